@@ -3,59 +3,221 @@ import json
 import logging
 import os
 from multiprocessing import Process, Queue
-import requests
-from requests_toolbelt import MultipartEncoder
+from Queue import Queue as ThreadQueue
 import sys
+from threading import Thread
 import time
 import yaml
 from bottle import route, run, request, abort
 
-# the safe-thread store that is shared across components
-#
-from context import Context
-context = Context()
-context.set('plumby.version', '0.2 alpha')
+from catalog import Catalog
+from context import Context, LocalContext, SharedContext
+from fetcher import Fetcher, Puller
+from listener import Listener
+from queues import build_queue
+from sender import Sender
+from shell import Shell
+from spark import SparkClient
+from speaker import Speaker
+from worker import Worker
 
-# the queue of updates to be sent to Cisco Spark, processed by a Sender
-#
-mouth = Queue()
 
-# the queue of reports from a Worker, processed by a Speaker
-#
-outbox = Queue()
+def build(settings={}):
+    """
+    Creates the shared context, the queues and the processing units
 
-# the queue of activities for a Worker, feeded by a Listener and Shell
-#
-inbox = Queue()
+    :param settings: configuration information, as returned by `configure()`
+    :type settings: ``dict``
 
-# the streams of information coming from Cisco Spark, handled by a Listener
-#
-ears = Queue()
+    The components are made available as global variables of this module.
 
-# the sender of updates to Cisco Spark is processing the mouth queue
-#
-from sender import Sender
-sender = Sender(mouth)
+    When `runtime.mode` is set to `threads`, the context and the queues are
+    built for processing units that run as threads of this process.
 
-# the speaker translates reports from the outbox, and feeds the mouth
-#
-from speaker import Speaker
-speaker = Speaker(outbox, mouth)
+    Queues are bounded as configured in the `queues` section of settings.
+    """
 
-# the worker takes activities from the inbox and puts reports in the outbox
-#
-from worker import Worker
-worker = Worker(inbox, outbox)
+    global context, mouth, chatter, outbox, inbox, ears, ids, catalog
+    global sender, speaker, worker, shell, listener, fetcher, puller
+    global spark
 
-# the shell handles immediate commands and delegates others to the worker
-#
-from shell import Shell
-shell = Shell(context, inbox, mouth)
+    runtime = settings.get('runtime', {})
 
-# the listener acknowledges commands and feeds the worker via the inbox
-#
-from listener import Listener
-listener = Listener(ears, shell)
+    # the safe-thread store that is shared across components
+    #
+    if runtime.get('mode') == 'threads':
+        context = LocalContext()
+        queue = ThreadQueue
+    elif runtime.get('context') == 'shared':
+        context = SharedContext()
+        queue = Queue
+    else:
+        context = Context()
+        queue = Queue
+    context.set('plumby.version', '0.2 alpha')
+    context.apply(settings)
+
+    # the client used to get messages, with the token of a human being
+    #
+    spark = SparkClient(context, 'spark.CISCO_SPARK_TOKEN')
+
+    # the queue of updates to be sent to Cisco Spark, processed by a Sender
+    #
+    mouth = build_queue(context, 'mouth', queue)
+
+    # progress reports to be sent to Cisco Spark, after immediate replies
+    #
+    chatter = build_queue(context, 'chatter', queue)
+
+    # the queue of reports from a Worker, processed by a Speaker
+    #
+    outbox = build_queue(context, 'outbox', queue)
+
+    # the queue of activities for a Worker, feeded by a Listener and Shell
+    #
+    inbox = build_queue(context, 'inbox', queue)
+
+    # the streams of information coming from Cisco Spark, handled by a Listener
+    #
+    ears = build_queue(context, 'ears', queue)
+
+    # the ids of messages announced by the webhook, in this process
+    #
+    ids = build_queue(context, 'ids', ThreadQueue)
+
+    # the sender of updates to Cisco Spark is processing the mouth queue
+    # first, and then the chatter
+    #
+    sender = Sender(mouth, chatter)
+
+    # the speaker translates reports from the outbox, and feeds the chatter
+    #
+    speaker = Speaker(outbox, chatter)
+
+    # the worker takes activities from the inbox and puts reports in the outbox
+    #
+    worker = Worker(inbox, outbox)
+
+    # the index of fittings plans, built once and shared by shell commands
+    #
+    catalog = Catalog(context.get('plumbery.fittings', '.'),
+                      context.get('plumbery.refresh', 2.0))
+    catalog.refresh()
+
+    # the shell handles immediate commands and delegates others to the worker
+    #
+    shell = Shell(context, inbox, mouth, catalog)
+
+    # the listener acknowledges commands and feeds the worker via the inbox
+    #
+    listener = Listener(ears, shell)
+
+    # the fetcher gets messages announced by the webhook, and feeds the ears
+    #
+    fetcher = Fetcher(ids, ears)
+
+    # the puller polls Cisco Spark for new messages, and feeds the ears
+    #
+    puller = Puller(ears)
+
+
+def get_server(context):
+    """
+    Selects the web server and its options
+
+    :param context: the context that has settings of the server
+    :type context: ``Context``
+
+    :return: the name of the server, and its options
+    :rtype: ``tuple``
+
+    Settings are read from the `server` section: `engine`, `threads`,
+    `backlog`, `timeout` and `connections`. Options are translated for
+    'paste' and 'waitress'. Other servers supported by bottle can be used,
+    but they are started with their default options.
+    """
+
+    (engine, threads, backlog, timeout, connections) = context.get_many(
+        ('server.engine',
+         'server.threads',
+         'server.backlog',
+         'server.timeout',
+         'server.connections'),
+        {'server.engine': 'paste',
+         'server.threads': 10,
+         'server.backlog': 64,
+         'server.timeout': 30,
+         'server.connections': 100})
+
+    if engine == 'paste':
+        from paste.httpserver import WSGIHandler
+
+        # keep connections alive, and send responses without delay
+        #
+        class Handler(WSGIHandler):
+            disable_nagle_algorithm = True
+
+        options = {'use_threadpool': True,
+                   'threadpool_workers': int(threads),
+                   'request_queue_size': int(backlog),
+                   'socket_timeout': int(timeout),
+                   'protocol_version': 'HTTP/1.1',
+                   'handler': Handler}
+
+    elif engine == 'waitress':
+        options = {'threads': int(threads),
+                   'backlog': int(backlog),
+                   'channel_timeout': int(timeout),
+                   'connection_limit': int(connections)}
+
+    else:
+        options = {}
+
+    return (engine, options)
+
+
+def serve(context):
+    """
+    Runs the web endpoint until the end
+
+    :param context: the context that has settings of the server
+    :type context: ``Context``
+
+    """
+
+    (engine, options) = get_server(context)
+
+    print("Starting web endpoint with {}".format(engine))
+    run(host='0.0.0.0',
+        port=context.get('server.port'),
+        debug=context.get('general.DEBUG'),
+        quiet=not context.get('server.access_log', True),
+        server=engine,
+        **options)
+
+
+def start(target, *args):
+    """
+    Runs some processing unit in the background
+
+    :param target: the function to run
+    :type target: callable
+
+    :return: the background process or thread
+    :rtype: ``Process`` or ``Thread``
+
+    Units are separate processes, or threads of this process when
+    `runtime.mode` is set to `threads`. In the latter case, blocking work
+    such as the one done by the plumbery engine stays in its own thread.
+    """
+
+    if context.get('runtime.mode') == 'threads':
+        w = Thread(target=target, args=args)
+    else:
+        w = Process(target=target, args=args)
+    w.daemon = True
+    w.start()
+    return w
 
 
 # the endpoint exposed to Cisco Spark
@@ -66,31 +228,35 @@ def push_from_spark():
     Processes the flow of events from Cisco Spark
 
     This function is called from far far away, over the Internet
+
+    Events for messages posted by the bot itself, or posted in other rooms,
+    are counted in `webhook.skipped` and are not fetched.
     """
 
     try:
 
         print('Receiving data from webhook')
 
-        # step 1 -- we got message id, but no content
+        # we got message id, but no content -- skip messages that the
+        # listener would throw away anyway, to save on API calls
         #
-        message_id = request.json['data']['id']
+        data = request.json['data']
+        (bot_id, room_id) = context.get_many(('spark.bot_id', 'spark.room_id'))
 
-        # step 2 -- get the message itself
-        #
-        url = 'https://api.ciscospark.com/v1/messages/{}'.format(message_id)
-        bearer = context.get('spark.CISCO_SPARK_TOKEN')
-        headers = {'Authorization': 'Bearer '+bearer}
-        response = requests.get(url=url, headers=headers)
+        if bot_id and data.get('personId') == bot_id:
+            print("- sent by me, skipped")
+            context.increment('webhook.skipped')
+            return "OK\n"
 
-        if response.status_code != 200:
-            print("Received error code {}".format(response.status_code))
-            print(response.json())
-            raise Exception
+        if room_id and data.get('roomId', room_id) != room_id:
+            print("- not in my room, skipped")
+            context.increment('webhook.skipped')
+            return "OK\n"
 
-        # step 3 -- push it in the handling queue
+        # the message itself is fetched in the background, so that we can
+        # respond at once
         #
-        ears.put(response.json())
+        ids.put(data['id'])
 
         return "OK\n"
 
@@ -106,50 +272,7 @@ def pull_from_spark():
     This function senses new items at regular intervals
     """
 
-    print('Pulling messages pro-actively')
-
-    bearer = context.get('spark.CISCO_SPARK_TOKEN')
-    room_id = context.get('spark.room_id')
-    last_id = 0
-    while context.get('general.switch', 'on') == 'on':
-
-        time.sleep(1)
-
-        try:
-            url = 'https://api.ciscospark.com/v1/messages'
-            headers = {'Authorization': 'Bearer '+bearer}
-            payload = {'roomId': room_id, 'max': 10 }
-            response = requests.get(url=url, headers=headers, params=payload)
-
-            if response.status_code == 403:
-                print("Received error code {}".format(response.status_code))
-                print(response.json())
-                continue
-
-            if response.status_code != 200:
-                print("Received error code {}".format(response.status_code))
-                print(response.json())
-                raise Exception
-
-            items = response.json()['items']
-
-            index = 0
-            while index < len(items):
-                if items[index]['id'] == last_id:
-                    break
-                index += 1
-
-            if index > 0:
-                print("Fetching {} new messages".format(index))
-
-            while index > 0:
-                index -= 1
-                last_id = items[index]['id']
-                ears.put(items[index])
-
-        except Exception as feedback:
-            print("ERROR: exception raised while fetching messages")
-            raise
+    puller.work(context)
 
 def delete_room(context):
     """
@@ -159,13 +282,11 @@ def delete_room(context):
     """
 
     room = context.get('spark.room')
-    bearer = context.get('spark.CISCO_SPARK_PLUMBERY_BOT')
+    client = SparkClient(context)
 
     print("Deleting Cisco Spark room '{}'".format(room))
 
-    url = 'https://api.ciscospark.com/v1/rooms'
-    headers = {'Authorization': 'Bearer '+bearer}
-    response = requests.get(url=url, headers=headers)
+    response = client.get('/rooms')
 
     if response.status_code != 200:
         print(response.json())
@@ -178,9 +299,7 @@ def delete_room(context):
             print("- found it")
             print("- DELETING IT")
 
-            url = 'https://api.ciscospark.com/v1/rooms/{}'.format(item['id'])
-            headers = {'Authorization': 'Bearer '+bearer}
-            response = requests.delete(url=url, headers=headers)
+            response = client.delete('/rooms/{}'.format(item['id']))
 
             if response.status_code != 204:
                 raise Exception("Received error code {}".format(response.status_code))
@@ -205,13 +324,11 @@ def get_room(context):
     """
 
     room = context.get('spark.room')
-    bearer = context.get('spark.CISCO_SPARK_PLUMBERY_BOT')
+    client = SparkClient(context)
 
     print("Looking for Cisco Spark room '{}'".format(room))
 
-    url = 'https://api.ciscospark.com/v1/rooms'
-    headers = {'Authorization': 'Bearer '+bearer}
-    response = requests.get(url=url, headers=headers)
+    response = client.get('/rooms')
 
     if response.status_code != 200:
         print(response.json())
@@ -225,10 +342,8 @@ def get_room(context):
     print("- not found")
     print("Creating Cisco Spark room")
 
-    url = 'https://api.ciscospark.com/v1/rooms'
-    headers = {'Authorization': 'Bearer '+bearer}
     payload = {'title': room }
-    response = requests.post(url=url, headers=headers, data=payload)
+    response = client.post('/rooms', data=payload)
 
     if response.status_code != 200:
         print(response.json())
@@ -252,9 +367,7 @@ def get_room(context):
 
     print("Getting bot id")
 
-    url = 'https://api.ciscospark.com/v1/people/me'
-    headers = {'Authorization': 'Bearer '+bearer}
-    response = requests.get(url=url, headers=headers)
+    response = client.get('/people/me')
 
     if response.status_code != 200:
         print(response.json())
@@ -281,12 +394,11 @@ def add_person(room_id, person=None, isModerator='false'):
 
     """
 
-    url = 'https://api.ciscospark.com/v1/memberships'
-    headers = {'Authorization': 'Bearer '+context.get('spark.CISCO_SPARK_PLUMBERY_BOT')}
+    client = SparkClient(context)
     payload = {'roomId': room_id,
                'personEmail': person,
                'isModerator': isModerator }
-    response = requests.post(url=url, headers=headers, data=payload)
+    response = client.post('/memberships', data=payload)
 
     if response.status_code != 200:
         print(response.json())
@@ -300,20 +412,18 @@ def register_hook(context):
     """
 
     room_id = context.get('spark.room_id')
-    bearer = context.get('spark.CISCO_SPARK_TOKEN')
     webhook = context.get('server.url')
 
     print("Registering webhook to Cisco Spark")
     print("- {}".format(webhook))
 
-    url = 'https://api.ciscospark.com/v1/webhooks'
-    headers = {'Authorization': 'Bearer '+bearer}
+    client = SparkClient(context, 'spark.CISCO_SPARK_TOKEN')
     payload = {'name': 'controller-webhook',
                'resource': 'messages',
                'event': 'created',
                'filter': 'roomId='+room_id,
                'targetUrl': webhook }
-    response = requests.post(url=url, headers=headers, data=payload)
+    response = client.post('/webhooks', data=payload)
 
     if response.status_code != 200:
         print(response.json())
@@ -392,6 +502,15 @@ def configure(name="settings.yaml"):
         logging.error("Missing url: configuration information")
         sys.exit(1)
 
+    if "runtime" not in settings:
+        settings['runtime'] = {}
+
+    if "mode" not in settings['runtime']:
+        settings['runtime']['mode'] = 'processes'
+
+    if "context" not in settings['runtime']:
+        settings['runtime']['context'] = 'manager'
+
     if len(sys.argv) > 1:
         try:
             port_number = int(sys.argv[1])
@@ -418,9 +537,9 @@ def configure(name="settings.yaml"):
 #
 if __name__ == "__main__":
 
-    # read configuration file, look at the environment, and update context
+    # read configuration file, look at the environment, and build components
     #
-    context.apply(configure())
+    build(configure())
 
     # create a clean environment for the demo
     #
@@ -432,36 +551,23 @@ if __name__ == "__main__":
 
     # start processing threads in the background
     #
-    w = Process(target=sender.work, args=(context,))
-    w.daemon = True
-    w.start()
-
-    w = Process(target=speaker.work, args=(context,))
-    w.daemon = True
-    w.start()
-
-    w = Process(target=worker.work, args=(context,))
-    w.daemon = True
-    w.start()
-
-    w = Process(target=listener.work, args=(context,))
-    w.daemon = True
-    w.start()
+    start(sender.work, context)
+    start(speaker.work, context)
+    start(worker.work, context)
+    start(listener.work, context)
 
     # connect to Cisco Spark
     #
     if context.get('spark.mode') == 'pull':
-        w = Process(target=pull_from_spark)
+        start(pull_from_spark)
+
+    else:
+        w = Thread(target=fetcher.work, args=(context,))
         w.daemon = True
         w.start()
 
-    else:
         register_hook(context)
 
     # ready to receive updates
     #
-    print("Starting web endpoint")
-    run(host='0.0.0.0',
-        port=context.get('server.port'),
-        debug=context.get('general.DEBUG'),
-        server='paste')
+    serve(context)
@@ -0,0 +1,440 @@
+# Licensed to the Apache Software Foundation (ASF) under one or more
+# contributor license agreements.  See the NOTICE file distributed with
+# this work for additional information regarding copyright ownership.
+# The ASF licenses this file to You under the Apache License, Version 2.0
+# (the "License"); you may not use this file except in compliance with
+# the License.  You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+import heapq
+import logging
+import os
+import re
+from stat import S_ISDIR
+from threading import Lock
+import time
+import yaml
+
+try:
+    from yaml import CSafeLoader as Loader
+except ImportError:
+    from yaml import SafeLoader as Loader
+
+
+class Catalog(object):
+    """
+    Indexes categories and templates of fittings plans
+
+    :param root: the directory of fittings plans, e.g., `plumbery-contrib/fittings`
+    :type root: ``str``
+
+    :param interval: the minimum number of seconds between two checks of
+        the file system
+    :type interval: ``float``
+
+    The catalog is built once and shared by all commands of the Shell.
+    Each category is a directory of the root, and each template is a
+    directory of a category that contains a file `fittings.yaml`.
+
+    The index is refreshed incrementally: the root directory and each
+    category directory are checked with `os.stat()`, and a category is
+    listed again only if its modification time has changed. Checks are
+    done at most once every `interval` seconds, so that a burst of commands
+    costs a single pass on the file system.
+
+    Note that the modification time of a category does not change when a
+    file `fittings.yaml` is added to, or removed from, an existing template.
+    Such changes are noted when the category itself changes, or after
+    `refresh(force=True)`.
+
+    Headers of fittings plans are parsed on first use, and kept in a cache
+    until the file is modified. The C loader of libyaml is used if it is
+    available.
+
+    Templates can be searched with words of their names and categories,
+    of their `information` lines and of names of their parameters. The
+    inverted index used for this is updated for modified categories only,
+    on next search.
+    """
+
+    header_keys = ('information', 'parameters', 'links')
+
+    # the weight of words found in each part of a template
+    #
+    weights = {'template': 4, 'category': 2, 'information': 1, 'parameter': 1}
+
+    def __init__(self, root, interval=2.0):
+        self.root = root
+        self.interval = float(interval)
+        self.checked = None
+        self.stamp = None
+        self.index = {}
+        self.headers = {}
+        self.lock = Lock()
+        self.dirty = set()
+        self.members = {}
+        self.words = {}
+        self.postings = {}
+        self.search_lock = Lock()
+        logging.debug('catalog {}'.format(self.root))
+
+    def refresh(self, force=False):
+        """
+        Updates the index from the file system
+
+        :param force: check the file system now, and list every category
+        :type force: ``bool``
+
+        :return: False if the root directory cannot be found
+        :rtype: ``bool``
+        """
+
+        with self.lock:
+
+            now = time.time()
+            if (not force
+                and self.checked is not None
+                and now - self.checked < self.interval):
+
+                return self.stamp is not None
+
+            self.checked = now
+
+            stamp = self.get_stamp(self.root)
+            if stamp is None:
+                self.dirty.update(self.index.keys())
+                self.stamp = None
+                self.index = {}
+                return False
+
+            if force or stamp != self.stamp:
+                categories = set()
+                for category in os.listdir(self.root):
+                    if category[0] == '.':
+                        continue
+                    if os.path.isdir(os.path.join(self.root, category)):
+                        categories.add(category)
+
+                for category in list(self.index.keys()):
+                    if category not in categories:
+                        del self.index[category]
+                        self.dirty.add(category)
+
+                for category in categories:
+                    self.index.setdefault(category, (None, {}))
+
+                self.stamp = self.trust(stamp, now)
+
+            for category, (known, templates) in list(self.index.items()):
+                c_path = os.path.join(self.root, category)
+                current = self.get_stamp(c_path)
+                if current is None:
+                    del self.index[category]
+                    self.dirty.add(category)
+                elif force or current != known:
+                    scanned = self.scan(c_path)
+                    if force or scanned != templates:
+                        self.dirty.add(category)
+                    self.index[category] = (self.trust(current, now), scanned)
+
+            return True
+
+    def scan(self, c_path):
+        """
+        Lists templates of one category
+
+        :param c_path: the directory of the category
+        :type c_path: ``str``
+
+        :return: the path of `fittings.yaml` for each template
+        :rtype: ``dict``
+        """
+
+        templates = {}
+        for template in os.listdir(c_path):
+            if template[0] == '.':
+                continue
+            f_path = os.path.join(c_path, template, 'fittings.yaml')
+            if os.path.isfile(f_path):
+                templates[template] = f_path
+        return templates
+
+    def get_stamp(self, path):
+        """
+        Gets the modification time of a directory
+
+        :return: the modification time, or None if this is not a directory
+        :rtype: ``float``
+        """
+
+        try:
+            status = os.stat(path)
+        except OSError:
+            return None
+        if not S_ISDIR(status.st_mode):
+            return None
+        return status.st_mtime
+
+    def trust(self, stamp, now):
+        """
+        Decides if a modification time can be remembered
+
+        With coarse timestamps, a directory can change again within the
+        same second after it has been listed. In that case the stamp is
+        forgotten, so that the directory is listed again on next refresh.
+        """
+
+        if now - stamp < 1.0:
+            return None
+        return stamp
+
+    def list_categories(self):
+        """
+        Lists categories of templates
+
+        :return: names of categories, sorted alphabetically
+        :rtype: ``list`` of ``str``
+        """
+
+        self.refresh()
+        return sorted(self.index.keys())
+
+    def list_templates(self, category):
+        """
+        Lists templates of one category
+
+        :param category: the name of the category, e.g., 'analytics'
+        :type category: ``str``
+
+        :return: names of templates, or None if the category is unknown
+        :rtype: ``list`` of ``str``
+        """
+
+        self.refresh()
+        entry = self.index.get(category)
+        if entry is None:
+            return None
+        return sorted(entry[1].keys())
+
+    def get_path(self, name):
+        """
+        Locates one fittings plan
+
+        :param name: the category and the template, e.g., 'analytics/hadoop-cluster'
+        :type name: ``str``
+
+        :return: the path of `fittings.yaml`, or None if the template is unknown
+        :rtype: ``str``
+        """
+
+        if '/' not in name:
+            return None
+
+        self.refresh()
+        category, template = name.split('/', 1)
+        entry = self.index.get(category)
+        if entry is None:
+            return None
+        return entry[1].get(template)
+
+    def get_header(self, name):
+        """
+        Provides the header of one fittings plan
+
+        :param name: the category and the template, e.g., 'analytics/hadoop-cluster'
+        :type name: ``str``
+
+        :return: `information`, `parameters` and `links` of the plan, or
+            None if the template is unknown
+        :rtype: ``dict``
+
+        The header is parsed again only if the file has been modified. A
+        plan that cannot be parsed has an empty header.
+        """
+
+        f_path = self.get_path(name)
+        if f_path is None:
+            return None
+
+        try:
+            stamp = os.stat(f_path).st_mtime
+        except OSError:
+            return None
+
+        cached = self.headers.get(f_path)
+        if cached is not None:
+            if cached[0] == stamp:
+                return cached[1]
+            self.dirty.add(name.split('/', 1)[0])
+
+        try:
+            with open(f_path, 'r') as handle:
+                header = self.parse(handle.read())
+        except IOError:
+            return None
+        except yaml.YAMLError as feedback:
+            logging.error("Unable to parse '{}': {}".format(f_path, feedback))
+            header = {}
+
+        self.headers[f_path] = (stamp, header)
+        return header
+
+    def parse(self, plan):
+        """
+        Parses the header of a fittings plan
+
+        :param plan: the content of `fittings.yaml`
+        :type plan: ``str``
+
+        :return: `information`, `parameters` and `links` of the plan
+        :rtype: ``dict``
+
+        Only the first document of the plan is parsed, and other documents,
+        that describe the blueprints, are ignored.
+        """
+
+        for document in plan.split('\n---'):
+            if '\n' in document:
+                settings = yaml.load(document, Loader=Loader)
+                if not isinstance(settings, dict):
+                    return {}
+                return dict((key, settings[key])
+                            for key in self.header_keys
+                            if key in settings)
+
+        return {}
+
+    def search(self, terms, limit=10):
+        """
+        Finds templates that match some words
+
+        :param terms: the words to look for, e.g., 'hadoop cluster'
+        :type terms: ``str``
+
+        :param limit: the maximum number of templates to return
+        :type limit: ``int``
+
+        :return: names of templates, best matches first
+        :rtype: ``list`` of ``str``
+
+        Templates that match more words come first. Then templates are
+        ranked by the weight of matching words, e.g., a word in the name of
+        a template counts more than a word in the description.
+        """
+
+        self.refresh()
+        self.update_postings()
+
+        # each matching word counts more than any sum of weights
+        #
+        scores = {}
+        for word in set(self.tokenize(terms, split=False)):
+            for name, weight in self.postings.get(word, {}).items():
+                scores[name] = scores.get(name, 0) + 1000000 + weight
+
+        ranked = heapq.nsmallest(limit,
+                                 scores.items(),
+                                 key=lambda item: (-item[1], item[0]))
+        return [name for name, score in ranked]
+
+    def update_postings(self):
+        """
+        Indexes words of templates in modified categories
+        """
+
+        with self.search_lock:
+
+            with self.lock:
+                dirty = self.dirty
+                self.dirty = set()
+
+            for category in dirty:
+
+                for name in self.members.pop(category, {}):
+                    for word in self.words.pop(name, ()):
+                        postings = self.postings.get(word)
+                        if postings is not None:
+                            postings.pop(name, None)
+                            if not postings:
+                                del self.postings[word]
+
+                entry = self.index.get(category)
+                if entry is None:
+                    continue
+
+                names = []
+                for template in entry[1].keys():
+                    name = category+'/'+template
+                    words = self.get_words(name)
+                    for word, weight in words.items():
+                        self.postings.setdefault(word, {})[name] = weight
+                    self.words[name] = list(words.keys())
+                    names.append(name)
+                self.members[category] = names
+
+    def get_words(self, name):
+        """
+        Lists words of one template, with their weights
+
+        :param name: the category and the template, e.g., 'analytics/hadoop-cluster'
+        :type name: ``str``
+
+        :return: the weight of each word
+        :rtype: ``dict``
+        """
+
+        (category, template) = name.split('/', 1)
+        parts = [('template', template), ('category', category)]
+
+        header = self.get_header(name) or {}
+
+        information = header.get('information') or []
+        if not isinstance(information, list):
+            information = [information]
+        for line in information:
+            parts.append(('information', unicode(line)))
+
+        parameters = header.get('parameters') or {}
+        if isinstance(parameters, dict):
+            for key in parameters.keys():
+                parts.append(('parameter', unicode(key)))
+
+        words = {}
+        for part, text in parts:
+            for word in self.tokenize(text):
+                words[word] = words.get(word, 0) + self.weights[part]
+        return words
+
+    def tokenize(self, text, split=True):
+        """
+        Splits text into words
+
+        :param text: e.g., 'hadoop-cluster' or 'cpuPerNode'
+        :type text: ``str``
+
+        :param split: add parts of mixed-case and alphanumeric words
+        :type split: ``bool``
+
+        :return: lower-case words, e.g., ['cpupernode', 'cpu', 'per', 'node']
+        :rtype: ``list`` of ``str``
+        """
+
+        if isinstance(text, str):
+            text = text.decode('utf-8', 'replace')
+
+        words = []
+        for token in re.findall(r'[^\W_]+', text, re.UNICODE):
+            words.append(token.lower())
+            if not split:
+                continue
+            parts = re.findall(r'[A-Z]?[a-z]+|[A-Z]+(?![a-z])|[0-9]+', token)
+            if len(parts) > 1:
+                words.extend(part.lower() for part in parts)
+        return words
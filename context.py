@@ -13,72 +13,503 @@
 # See the License for the specific language governing permissions and
 # limitations under the License.
 
+import ctypes
 import logging
-from multiprocessing import Lock, Manager
+from multiprocessing import Event, Lock, RawArray, RawValue
+import threading
+from threading import Thread
+import zlib
+from multiprocessing.managers import BaseManager, DictProxy, MakeProxyType
+
+
+class Store(dict):
+    """
+    Holds shared values in the Manager process
+
+    Each method of this class is a single round-trip from the client.
+    """
+
+    def get_many(self, keys):
+        """
+        Retrieves the values of several keys
+
+        :param keys: the keys to look for
+        :type keys: ``list`` of ``str``
+
+        :return: values of keys that have been found
+        :rtype: ``dict``
+        """
+
+        values = {}
+        for key in keys:
+            if key in self:
+                values[key] = self[key]
+        return values
+
+    def compare_and_set(self, key, expected, value):
+        """
+        Changes the value of a key only if it has the expected value
+
+        :return: True if the value has been changed
+        :rtype: ``bool``
+        """
+
+        if self.get(key) != expected:
+            return False
+        self[key] = value
+        return True
+
+    def increment(self, key, delta=1):
+        """
+        Adds some quantity to a counter
+
+        :return: the new value of the counter
+        :rtype: ``int``
+        """
+
+        value = self.get(key, 0)
+        if not isinstance(value, int):
+            value = 0
+        value += delta
+        self[key] = value
+        return value
+
+
+StoreProxy = MakeProxyType('StoreProxy',
+                           DictProxy._exposed_+('get_many',
+                                                'compare_and_set',
+                                                'increment'))
+
+
+class ContextManager(BaseManager):
+    """
+    Runs the process that serves shared values
+    """
+
+ContextManager.register('Store', Store, StoreProxy)
+
 
 class Context(object):
     """
     Stores data across multiple independent processing units
+
+    Keys that rarely change, e.g., tokens or the room id, are cached
+    in each process. Every write to one of these keys moves a version
+    counter that lives in shared memory, and each process flushes its
+    local cache when it sees that this counter has moved.
+
+    Each key is protected by one lock out of a small set, so that processes
+    working on unrelated keys, e.g., the counters of different stages,
+    do not wait for each other. Operations on multiple keys, e.g.,
+    `get_many()` or `set_many()`, take the locks of their keys at once,
+    and make a single round-trip to the Manager.
+
+    When `general.switch` is turned off, the `stopped` event is set, so that
+    processing units can block on their queues instead of polling the switch.
     """
 
+    # keys starting with these prefixes are cached in each process
+    #
+    cached_prefixes = ('general.', 'plumbery.', 'server.', 'spark.')
+
+    # the number of locks shared by all keys
+    #
+    stripes = 16
+
     def __init__(self):
         self.lock = Lock()
-        self.values = Manager().dict()
+        self.locks = tuple([Lock() for index in range(self.stripes)])
+        manager = ContextManager()
+        manager.start()
+        self.values = manager.Store()
+        self.version = RawValue('l', 0)
+        self.cache = {}
+        self.cache_version = 0
+        self.stopped = Event()
 
-    def apply(self, settings={}):
+    def is_cached(self, key):
         """
-        Applies multiple settings at once
+        Tells if a key is cached locally
+
+        :param key: the key to check
+        :type key: ``str``
+
+        :return: True if the value is cached in each process
+        :rtype: ``bool``
+        """
+
+        return key.startswith(self.cached_prefixes)
+
+    def invalidate(self):
+        """
+        Signals a change of some cached value to all processes
+
+        This function should be called after the update of the shared value
+        and while the lock of the key is held.
         """
 
         self.lock.acquire()
         try:
-            for key in settings.keys():
-                if isinstance(settings[key], dict):
-                    for label in settings[key].keys():
-                        self.values[key+'.'+label] = settings[key].get(label)
-                else:
-                    self.values['general.'+key] = settings[key]
+            self.version.value += 1
         finally:
             self.lock.release()
 
+    def signal(self, values):
+        """
+        Sets or clears the `stopped` event on changes of the switch
+
+        :param values: new values of some keys
+        :type values: ``dict``
+        """
+
+        if 'general.switch' not in values:
+            return
+
+        if values['general.switch'] == 'on':
+            self.stopped.clear()
+        else:
+            self.stopped.set()
+
+    def wake_up(self, queue):
+        """
+        Pushes an exception to a queue when the switch is turned off
+
+        :param queue: the queue processed by some unit
+        :type queue: ``Queue``
+
+        This function starts a background thread that waits for the
+        `stopped` event. Processing units call it once, then block on their
+        queue until they get either some work or the exception that
+        tells them to stop.
+        """
+
+        def watch():
+            self.stopped.wait()
+            queue.put(Exception('STOP'))
+
+        watcher = Thread(target=watch)
+        watcher.daemon = True
+        watcher.start()
+
+    def lock_key(self, key):
+        """
+        Finds the lock that protects one key
+
+        :param key: the key to protect
+        :type key: ``str``
+
+        :return: the lock bound to this key
+        :rtype: ``multiprocessing.Lock``
+        """
+
+        return self.locks[(zlib.crc32(key) & 0xffffffff) % len(self.locks)]
+
+    def acquire(self, keys):
+        """
+        Acquires the locks that protect several keys
+
+        :param keys: the keys to protect
+        :type keys: ``list`` of ``str``
+
+        :return: the locks that have been acquired
+        :rtype: ``list``
+
+        Locks are always taken in the same order to prevent deadlocks.
+        """
+
+        locks = []
+        for lock in self.locks:
+            for key in keys:
+                if self.lock_key(key) is lock:
+                    locks.append(lock)
+                    break
+
+        for lock in locks:
+            lock.acquire()
+        return locks
+
+    def release(self, locks):
+        """
+        Releases locks acquired with `acquire()`
+        """
+
+        for lock in reversed(locks):
+            lock.release()
+
+    def check_cache(self):
+        """
+        Flushes the local cache if some cached value has been changed
+
+        :return: the version of cached values
+        :rtype: ``int``
+        """
+
+        version = self.version.value
+        if version != self.cache_version:
+            self.cache.clear()
+            self.cache_version = version
+        return version
+
+    def read_many(self, keys):
+        """
+        Reads several values, while their locks are held
+
+        :param keys: the keys to look for
+        :type keys: ``list`` of ``str``
+
+        :return: values of keys that have been found
+        :rtype: ``dict``
+        """
+
+        return self.values.get_many(keys)
+
+    def write_many(self, values):
+        """
+        Writes several values, while their locks are held
+
+        :param values: new values of the keys
+        :type values: ``dict``
+        """
+
+        self.values.update(values)
+
+    def read(self, key, default=None):
+        """
+        Reads one value, while its lock is held
+        """
+
+        return self.values.get(key, default)
+
+    def write(self, key, value):
+        """
+        Writes one value, while its lock is held
+        """
+
+        self.values[key] = value
+
+    def add(self, key, delta):
+        """
+        Adds some quantity to a counter, while its lock is held
+
+        :return: the new value of the counter
+        :rtype: ``int``
+        """
+
+        return self.values.increment(key, delta)
+
+    @staticmethod
+    def flatten(settings={}):
+        """
+        Turns settings into a flat dictionary of keys and values
+
+        :param settings: configuration information, e.g., `{'spark': {}}`
+        :type settings: ``dict``
+
+        :return: values keyed by labels such as `spark.room`
+        :rtype: ``dict``
+        """
+
+        values = {}
+        for key in settings.keys():
+            if isinstance(settings[key], dict):
+                for label in settings[key].keys():
+                    values[key+'.'+label] = settings[key].get(label)
+            else:
+                values['general.'+key] = settings[key]
+        return values
+
+    def apply(self, settings={}):
+        """
+        Applies multiple settings at once
+        """
+
+        self.set_many(self.flatten(settings))
+
     def get(self, key, default=None):
         """
         Retrieves the value of one key
         """
 
-        self.lock.acquire()
+        if self.is_cached(key):
+            return self.get_many((key,), {key: default})[0]
+
+        lock = self.lock_key(key)
+        lock.acquire()
         value = None
         try:
-            value = self.values.get(key, default)
+            value = self.read(key, default)
         finally:
-            self.lock.release()
+            lock.release()
             return value
 
+    def get_many(self, keys, defaults={}):
+        """
+        Retrieves the values of several keys at once
+
+        :param keys: the keys to look for
+        :type keys: ``list`` of ``str``
+
+        :param defaults: default values for some keys
+        :type defaults: ``dict``
+
+        :return: the values, in the same order as the keys
+        :rtype: ``list``
+
+        Cached keys are served locally, and other keys are fetched with
+        one round-trip to the Manager. For example::
+
+            (bearer, room_id) = context.get_many(('spark.CISCO_SPARK_TOKEN',
+                                                  'spark.room_id'))
+
+        """
+
+        version = self.check_cache()
+
+        values = {}
+        missing = []
+        for key in keys:
+            if key in self.cache:
+                (found, value) = self.cache[key]
+                if found:
+                    values[key] = value
+            else:
+                missing.append(key)
+
+        if missing:
+            locks = self.acquire(missing)
+            try:
+                fetched = self.read_many(missing)
+            finally:
+                self.release(locks)
+
+            values.update(fetched)
+
+            if version == self.version.value:
+                for key in missing:
+                    if self.is_cached(key):
+                        self.cache[key] = (key in fetched, fetched.get(key))
+
+        return [values[key] if key in values else defaults.get(key)
+                for key in keys]
+
     def set(self, key, value):
         """
         Remembers the value of one key
         """
 
-        self.lock.acquire()
+        lock = self.lock_key(key)
+        lock.acquire()
         try:
-            self.values[key] = value
+            self.write(key, value)
+            if self.is_cached(key):
+                self.invalidate()
         finally:
-            self.lock.release()
+            lock.release()
+        self.signal({key: value})
+
+    def set_many(self, values):
+        """
+        Remembers the values of several keys at once
+
+        :param values: new values of the keys
+        :type values: ``dict``
+
+        """
+
+        locks = self.acquire(values.keys())
+        try:
+            self.write_many(values)
+            for key in values.keys():
+                if self.is_cached(key):
+                    self.invalidate()
+                    break
+        finally:
+            self.release(locks)
+        self.signal(values)
+
+    def compare_and_set(self, key, expected, value):
+        """
+        Changes the value of a key only if it has the expected value
+
+        :param key: the key to update
+        :type key: ``str``
+
+        :param expected: the value that the key should have
+        :type expected: any
+
+        :param value: the new value of the key
+        :type value: any
+
+        :return: True if the value has been changed
+        :rtype: ``bool``
+
+        Missing keys are considered to have the value None.
+        """
+
+        lock = self.lock_key(key)
+        lock.acquire()
+        try:
+            changed = self.values.compare_and_set(key, expected, value)
+            if changed and self.is_cached(key):
+                self.invalidate()
+        finally:
+            lock.release()
+        if changed:
+            self.signal({key: value})
+        return changed
+
+    def update(self, key, function, default=None):
+        """
+        Changes the value of a key with a function
+
+        :param key: the key to update
+        :type key: ``str``
+
+        :param function: computes the new value from the current one
+        :type function: callable
+
+        :param default: the value passed to the function for missing keys
+        :type default: any
+
+        :return: the new value
+        :rtype: any
+
+        The value is read and written while the lock of the key is held,
+        so that other processes cannot interleave their own updates.
+        For example::
+
+            context.update('worker.queue', lambda x: x+['deploy'], [])
+
+        """
+
+        lock = self.lock_key(key)
+        lock.acquire()
+        try:
+            value = function(self.read(key, default))
+            self.write(key, value)
+            if self.is_cached(key):
+                self.invalidate()
+        finally:
+            lock.release()
+        self.signal({key: value})
+        return value
 
     def increment(self, key, delta=1):
         """
         Increments a value
+
+        The counter is updated with a single round-trip to the Manager,
+        and only processes that use the same lock have to wait.
         """
 
-        self.lock.acquire()
+        lock = self.lock_key(key)
+        lock.acquire()
         try:
-            value = self.values.get(key, 0)
-            if not isinstance(value, int):
-                value = 0
-            value += delta
-            self.values[key] = value
+            value = self.add(key, delta)
+            if self.is_cached(key):
+                self.invalidate()
         finally:
-            self.lock.release()
+            lock.release()
             return value
 
     def decrement(self, key, delta=1):
@@ -86,13 +517,233 @@ class Context(object):
         Decrements a value
         """
 
-        self.lock.acquire()
-        try:
-            value = self.values.get(key, 0)
-            if not isinstance(value, int):
-                value = 0
-            value -= delta
+        return self.increment(key, -delta)
+
+
+class SharedContext(Context):
+    """
+    Stores counters and flags in shared memory, and other data in a Manager
+
+    Values of the keys listed in `shared_slots` are kept in fixed-width
+    slots of a memory segment that is shared by all processes, so they are
+    read and written without any round-trip to the Manager process. Each
+    slot accepts either integers, or one of a short list of choices.
+    A value that does not fit in its slot, e.g., a string set to a counter,
+    is sent to the Manager instead.
+
+    Counters that fit in their slots are incremented without any
+    round-trip, under the lock of their key only.
+    """
+
+    shared_slots = (
+        ('general.switch', ('on', 'off')),
+        ('worker.busy', (False, True)),
+        ('listener.counter', int),
+        ('worker.counter', int),
+        ('speaker.counter', int),
+        ('sender.counter', int),
+    )
+
+    # range of integers that fit in a slot
+    #
+    LIMIT = 2 ** (8 * ctypes.sizeof(ctypes.c_long) - 1)
+
+    # state of each slot
+    #
+    MISSING = 0
+    IN_SLOT = 1
+    IN_STORE = 2
+
+    def __init__(self):
+        super(SharedContext, self).__init__()
+        self.slots = {}
+        for index, (key, kind) in enumerate(self.shared_slots):
+            self.slots[key] = index
+        self.states = RawArray('b', len(self.shared_slots))
+        self.numbers = RawArray('l', len(self.shared_slots))
+
+    def is_cached(self, key):
+        """
+        Tells if a key is cached locally
+
+        Keys stored in shared memory are not cached, since they are
+        read at no cost.
+        """
+
+        if key in self.slots:
+            return False
+        return super(SharedContext, self).is_cached(key)
+
+    def encode(self, index, value):
+        """
+        Converts a value to the number stored in a slot
+
+        :return: the number to store, or None if the value does not fit
+        :rtype: ``int`` or None
+        """
+
+        kind = self.shared_slots[index][1]
+        if kind is int:
+            if isinstance(value, bool) or not isinstance(value, (int, long)):
+                return None
+            if value < -self.LIMIT or value >= self.LIMIT:
+                return None
+            return value
+
+        for number, choice in enumerate(kind):
+            if type(choice) == type(value) and choice == value:
+                return number
+        return None
+
+    def read_slot(self, index, key, default=None):
+        """
+        Reads one value from shared memory, while its lock is held
+        """
+
+        state = self.states[index]
+        if state == self.IN_SLOT:
+            kind = self.shared_slots[index][1]
+            number = self.numbers[index]
+            if kind is int:
+                return number
+            return kind[number]
+
+        if state == self.IN_STORE:
+            return self.values.get(key, default)
+
+        return default
+
+    def write_slot(self, index, key, value):
+        """
+        Writes one value to shared memory, while its lock is held
+        """
+
+        number = self.encode(index, value)
+        if number is None:
             self.values[key] = value
+            self.states[index] = self.IN_STORE
+        else:
+            self.numbers[index] = number
+            self.states[index] = self.IN_SLOT
+
+    def read_many(self, keys):
+        """
+        Reads several values, while their locks are held
+        """
+
+        values = {}
+        others = []
+        for key in keys:
+            index = self.slots.get(key)
+            if index is None:
+                others.append(key)
+            elif self.states[index] != self.MISSING:
+                values[key] = self.read_slot(index, key)
+
+        if others:
+            values.update(self.values.get_many(others))
+        return values
+
+    def write_many(self, values):
+        """
+        Writes several values, while their locks are held
+        """
+
+        others = {}
+        for key in values.keys():
+            index = self.slots.get(key)
+            if index is None:
+                others[key] = values[key]
+            else:
+                self.write_slot(index, key, values[key])
+
+        if others:
+            self.values.update(others)
+
+    def read(self, key, default=None):
+        """
+        Reads one value, while its lock is held
+        """
+
+        index = self.slots.get(key)
+        if index is None:
+            return self.values.get(key, default)
+        return self.read_slot(index, key, default)
+
+    def write(self, key, value):
+        """
+        Writes one value, while its lock is held
+        """
+
+        index = self.slots.get(key)
+        if index is None:
+            self.values[key] = value
+        else:
+            self.write_slot(index, key, value)
+
+    def add(self, key, delta):
+        """
+        Adds some quantity to a counter, while its lock is held
+        """
+
+        index = self.slots.get(key)
+        if index is None:
+            return self.values.increment(key, delta)
+
+        value = self.read_slot(index, key, 0)
+        if not isinstance(value, int):
+            value = 0
+        value += delta
+        self.write_slot(index, key, value)
+        return value
+
+    def compare_and_set(self, key, expected, value):
+        """
+        Changes the value of a key only if it has the expected value
+        """
+
+        if key not in self.slots:
+            return super(SharedContext, self).compare_and_set(key,
+                                                              expected,
+                                                              value)
+
+        lock = self.lock_key(key)
+        lock.acquire()
+        try:
+            changed = (self.read(key) == expected)
+            if changed:
+                self.write(key, value)
         finally:
-            self.lock.release()
-            return value
+            lock.release()
+        if changed:
+            self.signal({key: value})
+        return changed
+
+
+class LocalContext(Context):
+    """
+    Stores data across threads of a single process
+
+    This is used when all processing units run as threads of the same
+    process. Values are kept in a plain dictionary, locks and the `stopped`
+    event come from the `threading` module, and no Manager process is
+    started. Since reads are local, no value is cached.
+    """
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.locks = tuple([threading.Lock() for index in range(self.stripes)])
+        self.values = Store()
+        self.version = RawValue('l', 0)
+        self.cache = {}
+        self.cache_version = 0
+        self.stopped = threading.Event()
+
+    def is_cached(self, key):
+        """
+        Tells if a key is cached locally
+
+        All values are local already, so this function always returns False.
+        """
+
+        return False
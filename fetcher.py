@@ -0,0 +1,255 @@
+# Licensed to the Apache Software Foundation (ASF) under one or more
+# contributor license agreements.  See the NOTICE file distributed with
+# this work for additional information regarding copyright ownership.
+# The ASF licenses this file to You under the Apache License, Version 2.0
+# (the "License"); you may not use this file except in compliance with
+# the License.  You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+import logging
+from requests import RequestException
+from threading import Thread
+
+from records import Message
+from spark import SparkClient
+
+
+class Fetcher(object):
+    """
+    Gets messages from Cisco Spark and feeds the ears
+
+    :param ids: the ids of messages announced by the webhook
+    :type ids: ``Queue``
+
+    :param ears: the queue of messages processed by a Listener
+    :type ears: ``Queue``
+
+    Messages are fetched by `fetcher.workers` threads, that share the
+    pooled session of the process. The webhook only has to queue the id of
+    each new message, and can respond to Cisco Spark at once.
+
+    Following counters are maintained in the context:
+
+    * `fetcher.counter` - ids taken from the queue
+    * `fetcher.errors` - messages that could not be fetched
+
+    """
+
+    def __init__(self, ids, ears):
+        self.ids = ids
+        self.ears = ears
+        logging.debug('fetcher {}, {}'.format(self.ids, self.ears))
+
+    def work(self, context):
+        print("Starting fetcher")
+
+        self.context = context
+        self.client = SparkClient(context, 'spark.CISCO_SPARK_TOKEN')
+
+        self.context.set('fetcher.counter', 0)
+        self.context.wake_up(self.ids)
+
+        threads = []
+        for index in range(int(self.context.get('fetcher.workers', 4))):
+            thread = Thread(target=self.run)
+            thread.daemon = True
+            thread.start()
+            threads.append(thread)
+
+        for thread in threads:
+            thread.join()
+
+    def run(self):
+        """
+        Fetches messages until the end
+        """
+
+        while self.context.get('general.switch', 'on') == 'on':
+            item = self.ids.get()
+            if isinstance(item, Exception):
+                self.ids.put(item)  # for other threads
+                break
+            counter = self.context.increment('fetcher.counter')
+            self.process(item, counter)
+
+    def process(self, item, counter):
+        """
+        Gets one message from Cisco Spark
+
+        :param item: the id of the message
+        :type item: ``str``
+
+        """
+
+        print('Fetcher is working on {}'.format(counter))
+
+        try:
+            response = self.client.get('/messages/{}'.format(item))
+
+        except RequestException as feedback:
+            print("Fetcher could not reach Cisco Spark: {}".format(feedback))
+            self.context.increment('fetcher.errors')
+            return
+
+        if response.status_code != 200:
+            print("Fetcher received error code {}".format(response.status_code))
+            self.context.increment('fetcher.errors')
+            return
+
+        self.ears.put(Message.from_spark(response.json()))
+
+
+class Puller(object):
+    """
+    Polls Cisco Spark for new messages and feeds the ears
+
+    :param ears: the queue of messages processed by a Listener
+    :type ears: ``Queue``
+
+    Messages of the room are listed page after page, with `beforeMessage`,
+    until the last message seen is found, so that no message is lost even
+    when many messages are posted between two polls. On first poll, only
+    the last message is noted, and previous messages are not processed.
+
+    If the last message seen has been deleted, listing stops at the first
+    message that was created before it, so that old commands are not
+    processed again. Without a creation time, at most one page is listed.
+
+    Polling happens every `pull.min_interval` seconds while the room is
+    active. The interval is doubled after each poll without new messages,
+    or after an error, up to `pull.max_interval` seconds.
+
+    Following counters are maintained in the context:
+
+    * `pull.requests` - requests sent to Cisco Spark
+    * `pull.errors` - requests that failed
+    * `pull.messages` - new messages put in the ears
+
+    """
+
+    def __init__(self, ears):
+        self.ears = ears
+        self.last_id = None
+        self.last_created = None
+        self.started = False
+        logging.debug('puller {}'.format(self.ears))
+
+    def work(self, context):
+        print("Pulling messages pro-actively")
+
+        self.context = context
+        self.client = SparkClient(context, 'spark.CISCO_SPARK_TOKEN')
+
+        (self.room_id, min_interval, max_interval,
+         page_size) = self.context.get_many(
+            ('spark.room_id',
+             'pull.min_interval',
+             'pull.max_interval',
+             'pull.page_size'),
+            {'pull.min_interval': 1.0,
+             'pull.max_interval': 8.0,
+             'pull.page_size': 50})
+        self.min_interval = float(min_interval)
+        self.max_interval = float(max_interval)
+        self.page_size = int(page_size)
+
+        interval = self.min_interval
+        while not self.context.stopped.wait(interval):
+
+            count = self.pull()
+            if count:
+                interval = self.min_interval
+            else:
+                interval = min(self.max_interval, 2 * interval)
+
+    def pull(self):
+        """
+        Puts new messages in the ears, oldest first
+
+        :return: the number of new messages, or None on error
+        :rtype: ``int``
+        """
+
+        items = self.fetch()
+        if items is None:
+            return None
+
+        for item in items:
+            self.ears.put(Message.from_spark(item))
+
+        if items:
+            print("Fetching {} new messages".format(len(items)))
+            self.context.increment('pull.messages', len(items))
+            self.last_id = items[-1]['id']
+            self.last_created = items[-1].get('created')
+
+        return len(items)
+
+    def fetch(self, limit=1000):
+        """
+        Lists messages posted after the last one seen
+
+        :param limit: the maximum number of messages to list
+        :type limit: ``int``
+
+        :return: new messages, oldest first, or None on error
+        :rtype: ``list`` of ``dict``
+        """
+
+        params = {'roomId': self.room_id, 'max': self.page_size}
+        items = []
+        while True:
+
+            self.context.increment('pull.requests')
+            try:
+                response = self.client.get('/messages', params=params)
+            except RequestException as feedback:
+                print("Puller could not reach Cisco Spark: {}".format(feedback))
+                self.context.increment('pull.errors')
+                return None
+
+            if response.status_code != 200:
+                print("Received error code {}".format(response.status_code))
+                self.context.increment('pull.errors')
+                return None
+
+            page = response.json()['items']
+
+            # first poll -- remember where we are
+            #
+            if not self.started:
+                self.started = True
+                if page:
+                    self.last_id = page[0]['id']
+                    self.last_created = page[0].get('created')
+                return []
+
+            for item in page:
+                if item['id'] == self.last_id:
+                    return list(reversed(items))
+
+                # last message has been deleted
+                #
+                if (self.last_created is not None
+                        and item.get('created') is not None
+                        and item['created'] < self.last_created):
+                    return list(reversed(items))
+
+                items.append(item)
+
+            # beginning of the room, or no way to tell old messages
+            #
+            if (len(page) < self.page_size
+                    or len(items) >= limit
+                    or (self.last_id is not None
+                        and self.last_created is None)):
+                return list(reversed(items))
+
+            params['beforeMessage'] = page[-1]['id']
@@ -15,10 +15,11 @@
 
 import json
 import logging
-from Queue import Empty
 import random
 import time
 
+from records import Message
+
 class Listener(object):
     """
     Acknowledges commands and feeds the worker
@@ -34,15 +35,13 @@ class Listener(object):
         self.context = context
 
         self.context.set('listener.counter', 0)
+        self.context.wake_up(self.ears)
         while self.context.get('general.switch', 'on') == 'on':
-            try:
-                item = self.ears.get(True, 0.1)
-                if isinstance(item, Exception):
-                    break
-                counter = self.context.increment('listener.counter')
-                self.process(item, counter)
-            except Empty:
-                pass
+            item = self.ears.get()
+            if isinstance(item, Exception):
+                break
+            counter = self.context.increment('listener.counter')
+            self.process(item, counter)
 
     def process(self, item, counter):
         """
@@ -53,7 +52,8 @@ class Listener(object):
         Commands that require significant processing time are pushed
         to the inbox.
 
-        Example command received from Cisco Spark:
+        Items are `Message` records, or full messages received from
+        Cisco Spark, such as:
 
             {
               "id" : "Z2lzY29zcGFyazovL3VzL01FU1NBR0UvOTJkYjNiZTAtNDNiZC0xMWU2LThhZTktZGQ1YjNkZmM1NjVk",
@@ -73,18 +73,21 @@ class Listener(object):
 
         # sanity check
         #
-        if not isinstance(item, dict) or 'personId' not in item.keys():
-            print("- not a dict, thrown away")
+        if isinstance(item, dict) and 'personId' in item.keys():
+            item = Message.from_spark(item)
+
+        if not isinstance(item, Message):
+            print("- not a message, thrown away")
             return
 
-        input = item.get('text', '')
+        input = item.text
         if input is None:
             print("- no input in this item, thrown away")
             return
 
         # my own messages
         #
-        if item['personId'] == self.context.get('spark.bot_id'):
+        if item.person_id == self.context.get('spark.bot_id'):
             print("- sent by me, thrown away")
             return
 
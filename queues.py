@@ -0,0 +1,621 @@
+# Licensed to the Apache Software Foundation (ASF) under one or more
+# contributor license agreements.  See the NOTICE file distributed with
+# this work for additional information regarding copyright ownership.
+# The ASF licenses this file to You under the Apache License, Version 2.0
+# (the "License"); you may not use this file except in compliance with
+# the License.  You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+import cPickle as pickle
+import logging
+import os
+from Queue import Empty, Full
+import sqlite3
+import tempfile
+from threading import Condition, Thread
+
+
+class Spill(object):
+    """
+    Keeps items in a file, in order
+
+    :param path: the directory where the file is created
+    :type path: ``str``
+
+    Items are appended at the end of the file, and read from the beginning.
+    The file is emptied each time all items have been read. It is removed
+    from the directory on creation, so that nothing is left on exit.
+    """
+
+    def __init__(self, path=None):
+        (handle, name) = tempfile.mkstemp(prefix='spill-', dir=path)
+        os.unlink(name)
+        self.file = os.fdopen(handle, 'w+b')
+        self.offset = 0
+        self.count = 0
+
+    def __len__(self):
+        return self.count
+
+    def append(self, item):
+        """
+        Writes one item at the end of the file
+        """
+
+        self.file.seek(0, os.SEEK_END)
+        pickle.dump(item, self.file, pickle.HIGHEST_PROTOCOL)
+        self.count += 1
+
+    def popleft(self):
+        """
+        Reads the first item that has not been read yet
+        """
+
+        self.file.seek(self.offset)
+        item = pickle.load(self.file)
+        self.offset = self.file.tell()
+        self.count -= 1
+
+        if self.count == 0:
+            self.file.seek(0)
+            self.file.truncate()
+            self.offset = 0
+
+        return item
+
+
+class Overflow(list):
+    """
+    Keeps items in memory, and merges consecutive texts
+
+    :param limit: the maximum size of merged texts
+    :type limit: ``int``
+
+    """
+
+    def __init__(self, limit=7439):
+        super(Overflow, self).__init__()
+        self.limit = limit
+
+    def append(self, item):
+        """
+        Merges the item with the previous one, or adds it
+
+        :return: True if the item has been merged
+        :rtype: ``bool``
+        """
+
+        if (len(self) > 0
+                and isinstance(item, basestring)
+                and isinstance(self[-1], basestring)
+                and len(self[-1]) + 1 + len(item) <= self.limit):
+
+            self[-1] = self[-1] + '\n' + item
+            return True
+
+        super(Overflow, self).append(item)
+        return False
+
+    def popleft(self):
+        """
+        Takes the first item
+        """
+
+        return self.pop(0)
+
+
+class BoundedQueue(object):
+    """
+    Limits the number of items in a queue
+
+    :param context: the context where counters are kept
+    :type context: ``Context``
+
+    :param name: the name of the queue, e.g., 'mouth'
+    :type name: ``str``
+
+    :param queue: a queue that has been created with some `maxsize`
+    :type queue: ``multiprocessing.Queue`` or ``Queue.Queue``
+
+    :param policy: 'block', 'drop_oldest', 'coalesce' or 'spill'
+    :type policy: ``str``
+
+    :param path: the directory used to spill items to disk
+    :type path: ``str``
+
+    When the queue is full, the policy decides what happens to a new item:
+
+    * `block` - the producer waits until there is some room
+    * `drop_oldest` - the oldest item is removed from the queue, and the
+      producer waits only if some other producer takes the room first
+    * `coalesce` - the item is kept aside by the producer, and merged with
+      other texts, until there is some room in the queue
+    * `spill` - the item is written to a file by the producer, until there
+      is some room in the queue
+
+    With `coalesce` and `spill`, a background thread of the producer moves
+    items kept aside to the queue, in order. Items put in the meantime go
+    after them. The number of items kept aside in memory is limited to the
+    size of the queue, and beyond that the producer waits.
+
+    Following counters are maintained in the context, e.g., for the mouth:
+
+    * `mouth.blocked` - items that had to wait for some room
+    * `mouth.dropped` - items removed from the queue
+    * `mouth.coalesced` - items merged with a previous one
+    * `mouth.spilled` - items written to disk
+
+    Other functions, such as `get()`, are passed to the queue itself.
+    """
+
+    policies = ('block', 'drop_oldest', 'coalesce', 'spill')
+
+    def __init__(self, context, name, queue, policy='block', path=None):
+        if policy not in self.policies:
+            raise ValueError("Unknown policy '{}'".format(policy))
+
+        self.context = context
+        self.name = name
+        self.queue = queue
+        self.policy = policy
+        self.path = path
+        self.maxsize = getattr(queue, 'maxsize', None) or queue._maxsize
+
+        self.reset()
+
+    def __getattr__(self, name):
+        if name == 'queue':
+            raise AttributeError(name)
+        return getattr(self.queue, name)
+
+    def reset(self):
+        """
+        Forgets items kept aside, e.g., by the parent of a forked process
+        """
+
+        self.pid = os.getpid()
+        self.ready = Condition()
+        self.overflow = None
+        self.mover = None
+
+    def put(self, item):
+        """
+        Adds an item to the queue, according to the policy
+        """
+
+        if self.pid != os.getpid():
+            self.reset()
+
+        if self.policy in ('coalesce', 'spill'):
+            self.put_aside(item)
+            return
+
+        try:
+            self.queue.put_nowait(item)
+            return
+        except Full:
+            pass
+
+        if self.policy == 'block':
+            self.context.increment(self.name+'.blocked')
+            self.queue.put(item)
+            return
+
+        # one item is dropped at most, then the producer waits if another
+        # producer has taken the room in the meantime
+        #
+        try:
+            self.queue.get(True, 0.1)
+            self.context.increment(self.name+'.dropped')
+        except Empty:
+            pass
+
+        try:
+            self.queue.put_nowait(item)
+        except Full:
+            self.context.increment(self.name+'.blocked')
+            self.queue.put(item)
+
+    def put_aside(self, item):
+        """
+        Adds an item to the queue, or keeps it aside if the queue is full
+        """
+
+        self.ready.acquire()
+        try:
+            if self.mover is None:
+                try:
+                    self.queue.put_nowait(item)
+                    return
+                except Full:
+                    pass
+
+            if self.overflow is None:
+                if self.policy == 'spill':
+                    self.overflow = Spill(self.path)
+                else:
+                    self.overflow = Overflow()
+
+            if self.policy == 'spill':
+                self.overflow.append(item)
+                self.context.increment(self.name+'.spilled')
+
+            else:
+                if len(self.overflow) >= self.maxsize:
+                    self.context.increment(self.name+'.blocked')
+                    while len(self.overflow) >= self.maxsize:
+                        self.ready.wait()
+
+                if self.overflow.append(item):
+                    self.context.increment(self.name+'.coalesced')
+
+            if self.mover is None:
+                self.mover = Thread(target=self.move)
+                self.mover.daemon = True
+                self.mover.start()
+
+        finally:
+            self.ready.release()
+
+    def move(self):
+        """
+        Moves items kept aside to the queue, in order
+        """
+
+        while True:
+            self.ready.acquire()
+            try:
+                if len(self.overflow) == 0:
+                    self.mover = None
+                    return
+                item = self.overflow.popleft()
+                self.ready.notify_all()
+            finally:
+                self.ready.release()
+
+            self.queue.put(item)
+
+
+class Spool(object):
+    """
+    Keeps items in a SQLite database until they have been processed
+
+    :param path: the database file
+    :type path: ``str``
+
+    The database is in WAL mode, and each commit is synced to disk. Several
+    processes can write to the same database, since each process has its
+    own connection.
+    """
+
+    def __init__(self, path):
+        self.path = path
+        self.pid = None
+        self.connection = None
+
+    def connect(self):
+        """
+        Provides the connection of the current process
+
+        :return: a connection to the database
+        :rtype: ``sqlite3.Connection``
+        """
+
+        if self.pid != os.getpid():
+            self.pid = os.getpid()
+            self.connection = sqlite3.connect(self.path,
+                                              timeout=10.0,
+                                              check_same_thread=False)
+            self.connection.execute('PRAGMA journal_mode=WAL')
+            self.connection.execute('PRAGMA synchronous=FULL')
+            self.connection.execute(
+                'CREATE TABLE IF NOT EXISTS items ('
+                ' id INTEGER PRIMARY KEY AUTOINCREMENT,'
+                ' queue TEXT NOT NULL,'
+                ' item BLOB NOT NULL)')
+            self.connection.commit()
+
+        return self.connection
+
+    def commit(self, queue, items, acks):
+        """
+        Writes new items, and removes processed items, in one transaction
+
+        :param queue: the name of the queue, e.g., 'mouth'
+        :type queue: ``str``
+
+        :param items: the items to write
+        :type items: ``list``
+
+        :param acks: the ids of items that have been processed
+        :type acks: ``list`` of ``int``
+
+        :return: the ids of new items
+        :rtype: ``list`` of ``int``
+        """
+
+        connection = self.connect()
+        ids = []
+        with connection:
+            for item in items:
+                cursor = connection.execute(
+                    'INSERT INTO items (queue, item) VALUES (?, ?)',
+                    (queue, buffer(pickle.dumps(item, pickle.HIGHEST_PROTOCOL))))
+                ids.append(cursor.lastrowid)
+
+            if acks:
+                connection.executemany('DELETE FROM items WHERE id = ?',
+                                       [(id,) for id in acks])
+        return ids
+
+    def load(self, queue):
+        """
+        Reads items that have not been processed yet
+
+        :param queue: the name of the queue, e.g., 'mouth'
+        :type queue: ``str``
+
+        :return: ids and items, in order
+        :rtype: ``list`` of ``tuple``
+        """
+
+        cursor = self.connect().execute(
+            'SELECT id, item FROM items WHERE queue = ? ORDER BY id', (queue,))
+        return [(id, pickle.loads(str(item))) for (id, item) in cursor]
+
+
+class SpooledQueue(object):
+    """
+    Writes items to a spool before they are queued
+
+    :param queue: the queue that is carrying items
+    :type queue: ``Queue`` or ``BoundedQueue``
+
+    :param spool: the storage of items
+    :type spool: ``Spool``
+
+    :param name: the name of the queue, e.g., 'inbox'
+    :type name: ``str``
+
+    Items put in the queue are written to the spool by a background thread
+    of the producer, and passed to the queue once they are on disk. All
+    items that arrive during a commit are written by the next one, so that
+    the cost of syncing to disk is shared by many items.
+
+    By default, an item is removed from the spool when the consumer gets the
+    next one. A consumer that holds several items at once, like the Sender,
+    rather takes them with `get_envelope()` and calls `ack()` once they
+    have been processed. Removals are also written by a background thread,
+    in batches. Items
+    that have not been removed when the bot stops are put again in the
+    queue by `replay()` on next start. An item can then be processed twice,
+    but it is never lost.
+
+    Exceptions, that are used to stop consumers, are not written to disk.
+    """
+
+    def __init__(self, queue, spool, name):
+        self.queue = queue
+        self.spool = spool
+        self.name = name
+        self.reset()
+
+    def __getattr__(self, name):
+        if name == 'queue':
+            raise AttributeError(name)
+        return getattr(self.queue, name)
+
+    def reset(self):
+        """
+        Forgets pending writes, e.g., from the parent of a forked process
+        """
+
+        self.pid = os.getpid()
+        self.ready = Condition()
+        self.pending = []
+        self.acks = []
+        self.last = None
+        self.writer = None
+
+    def signal(self):
+        """
+        Wakes up the writer, or starts it
+        """
+
+        if self.writer is None:
+            self.writer = Thread(target=self.write)
+            self.writer.daemon = True
+            self.writer.start()
+        self.ready.notify()
+
+    def put(self, item):
+        """
+        Adds an item to the queue, once it has been written to disk
+        """
+
+        if self.pid != os.getpid():
+            self.reset()
+
+        self.ready.acquire()
+        try:
+            self.pending.append(item)
+            self.signal()
+        finally:
+            self.ready.release()
+
+    def put_nowait(self, item):
+        """
+        Adds an item to the queue, once it has been written to disk
+
+        This is the same as `put()`, that never waits for the disk, so that
+        no item can bypass the spool.
+        """
+
+        self.put(item)
+
+    def get(self, block=True, timeout=None):
+        """
+        Takes next item, and acknowledges the previous one
+        """
+
+        if self.pid != os.getpid():
+            self.reset()
+
+        if self.last is not None:
+            self.ready.acquire()
+            try:
+                self.acks.append(self.last)
+                self.last = None
+                self.signal()
+            finally:
+                self.ready.release()
+
+        (self.last, item) = self.queue.get(block, timeout)
+        return item
+
+    def get_nowait(self):
+        """
+        Takes next item without waiting
+        """
+
+        return self.get(False)
+
+    def get_envelope(self, block=True, timeout=None):
+        """
+        Takes next item, without acknowledging anything
+
+        :return: the id of the item in the spool, and the item
+        :rtype: ``tuple``
+
+        The id is None for exceptions, that are not written to disk. Other
+        items stay in the spool until their id is passed to `ack()`.
+        """
+
+        if self.pid != os.getpid():
+            self.reset()
+
+        return self.queue.get(block, timeout)
+
+    def ack(self, ids):
+        """
+        Removes processed items from the spool
+
+        :param ids: ids of items, as given by `get_envelope()`
+        :type ids: ``list`` of ``int``
+
+        """
+
+        ids = [id for id in ids if id is not None]
+        if not ids:
+            return
+
+        if self.pid != os.getpid():
+            self.reset()
+
+        self.ready.acquire()
+        try:
+            self.acks.extend(ids)
+            self.signal()
+        finally:
+            self.ready.release()
+
+    def write(self):
+        """
+        Writes items and acknowledgements to the spool, in batches
+        """
+
+        while True:
+            self.ready.acquire()
+            try:
+                while not self.pending and not self.acks:
+                    self.ready.wait()
+                (pending, self.pending) = (self.pending, [])
+                (acks, self.acks) = (self.acks, [])
+            finally:
+                self.ready.release()
+
+            items = [item for item in pending
+                     if not isinstance(item, Exception)]
+            ids = iter(self.spool.commit(self.name, items, acks))
+
+            for item in pending:
+                if isinstance(item, Exception):
+                    self.queue.put((None, item))
+                else:
+                    self.queue.put((next(ids), item))
+
+    def replay(self):
+        """
+        Puts again in the queue items left by a previous run
+
+        :return: the number of items found in the spool
+        :rtype: ``int``
+
+        Items are passed to the queue by a background thread, so that this
+        function does not wait for the consumer.
+        """
+
+        envelopes = self.spool.load(self.name)
+        if envelopes:
+            print("Replaying {} items in {}".format(len(envelopes), self.name))
+
+            def put_all():
+                for envelope in envelopes:
+                    self.queue.put(envelope)
+
+            thread = Thread(target=put_all)
+            thread.daemon = True
+            thread.start()
+
+        return len(envelopes)
+
+
+def build_queue(context, name, factory):
+    """
+    Builds a queue as configured in the context
+
+    :param context: the context that has settings of the queue
+    :type context: ``Context``
+
+    :param name: the name of the queue, e.g., 'mouth'
+    :type name: ``str``
+
+    :param factory: the class of the queue, e.g., `multiprocessing.Queue`
+    :type factory: ``type``
+
+    :return: a queue
+    :rtype: ``BoundedQueue``, ``SpooledQueue`` or a queue from the factory
+
+    Settings are read from `queues.<name>`, with `size`, `policy` and
+    `durable`. A queue without size is not bounded. A durable queue keeps
+    its items in the spool at `queues.spool_path`, and items left by a
+    previous run are replayed.
+    """
+
+    settings = context.get('queues.'+name) or {}
+    size = int(settings.get('size', 0))
+    if size <= 0:
+        queue = factory()
+
+    else:
+        policy = settings.get('policy', 'block')
+        logging.debug("queue {}: {} items, {}".format(name, size, policy))
+        queue = BoundedQueue(context,
+                             name,
+                             factory(size),
+                             policy,
+                             context.get('queues.spill_path'))
+
+    if settings.get('durable', False):
+        spool = Spool(context.get('queues.spool_path', 'plumby.spool'))
+        queue = SpooledQueue(queue, spool, name)
+        queue.replay()
+
+    return queue
@@ -0,0 +1,55 @@
+# Licensed to the Apache Software Foundation (ASF) under one or more
+# contributor license agreements.  See the NOTICE file distributed with
+# this work for additional information regarding copyright ownership.
+# The ASF licenses this file to You under the Apache License, Version 2.0
+# (the "License"); you may not use this file except in compliance with
+# the License.  You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+from collections import namedtuple
+
+
+class Message(namedtuple('Message', ('person_id', 'text'))):
+    """
+    A message received from Cisco Spark, as passed to the Listener
+
+    Only the fields used by the Listener are kept, so that the record is
+    cheap to pickle into the ears queue.
+    """
+
+    __slots__ = ()
+
+    def __reduce__(self):
+        return (Message, tuple(self))
+
+    @classmethod
+    def from_spark(cls, item):
+        """
+        Trims a message received from the Cisco Spark API
+
+        :param item: the message, e.g., `{'personId': ..., 'text': ...}`
+        :type item: ``dict``
+
+        :return: the compact record
+        :rtype: ``Message``
+        """
+
+        return cls(item.get('personId'), item.get('text'))
+
+
+class Action(namedtuple('Action', ('verb', 'arguments'))):
+    """
+    An activity passed by the Shell to the Worker, e.g., `('deploy', '')`
+    """
+
+    __slots__ = ()
+
+    def __reduce__(self):
+        return (Action, tuple(self))
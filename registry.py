@@ -0,0 +1,138 @@
+# Licensed to the Apache Software Foundation (ASF) under one or more
+# contributor license agreements.  See the NOTICE file distributed with
+# this work for additional information regarding copyright ownership.
+# The ASF licenses this file to You under the Apache License, Version 2.0
+# (the "License"); you may not use this file except in compliance with
+# the License.  You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+from bisect import bisect_left
+import importlib
+import logging
+
+
+class Registry(object):
+    """
+    Maps verbs typed by end users to commands of the shell
+
+    :param shell: the shell that runs commands
+    :type shell: ``Shell``
+
+    The dispatch table is built once, from following sources:
+
+    * every method `do_<verb>()` of the shell
+    * plugin commands listed in `shell.commands`, e.g.,
+      `{'hello': 'plugins.hello'}`
+    * aliases listed in `shell.aliases`, e.g., `{'ls': 'list'}`
+
+    The module of a plugin command is imported the first time that the
+    command is used, and has to provide a function
+    `do_<verb>(shell, arguments)`.
+
+    A verb can be abbreviated, as long as it is the prefix of a single
+    command, e.g., 'para' for 'parameters'.
+    """
+
+    def __init__(self, shell):
+        self.shell = shell
+
+        (plugins, aliases) = shell.context.get_many(
+            ('shell.commands', 'shell.aliases'),
+            {'shell.commands': {}, 'shell.aliases': {}})
+
+        self.table = {}
+        for name in dir(shell):
+            if name.startswith('do_') and callable(getattr(shell, name)):
+                self.table[name[3:]] = getattr(shell, name)
+
+        self.plugins = {}
+        for verb, module in (plugins or {}).items():
+            self.plugins[verb] = module
+            self.table[verb] = None  # loaded on first use
+
+        self.aliases = {}
+        for alias, verb in (aliases or {}).items():
+            if verb not in self.table:
+                logging.warning("Alias '{}' of unknown command '{}'"
+                                .format(alias, verb))
+                continue
+            self.aliases[alias] = verb
+
+        self.verbs = sorted(set(self.table.keys()) | set(self.aliases.keys()))
+        self.resolved = {}
+        logging.debug('registry {}'.format(' '.join(self.verbs)))
+
+    def resolve(self, verb):
+        """
+        Finds the commands that match a verb
+
+        :param verb: a command, an alias, or a prefix of a command
+        :type verb: ``str``
+
+        :return: names of matching commands -- one if the verb is valid,
+            none if it is unknown, several if it is ambiguous
+        :rtype: ``list`` of ``str``
+        """
+
+        name = self.resolved.get(verb)
+        if name is not None:
+            return [name]
+
+        if verb in self.table:
+            names = [verb]
+
+        elif verb in self.aliases:
+            names = [self.aliases[verb]]
+
+        else:
+            names = set()
+            index = bisect_left(self.verbs, verb)
+            while (index < len(self.verbs)
+                   and self.verbs[index].startswith(verb)):
+                candidate = self.verbs[index]
+                names.add(self.aliases.get(candidate, candidate))
+                index += 1
+            names = sorted(names)
+
+        if len(names) == 1:
+            self.resolved[verb] = names[0]
+        return names
+
+    def get_command(self, name):
+        """
+        Provides the function that runs a command
+
+        :param name: the name of the command, as given by `resolve()`
+        :type name: ``str``
+
+        :return: a function that takes arguments of the command, or None
+            if a plugin cannot be loaded
+        :rtype: ``callable``
+        """
+
+        command = self.table.get(name)
+        if command is not None:
+            return command
+
+        if name not in self.plugins:
+            return None
+
+        try:
+            module = importlib.import_module(self.plugins[name])
+            function = getattr(module, 'do_'+name)
+        except (ImportError, AttributeError) as feedback:
+            logging.error("Unable to load command '{}' from '{}': {}"
+                          .format(name, self.plugins[name], feedback))
+            return None
+
+        shell = self.shell
+        command = lambda arguments=None: function(shell, arguments)
+        self.table[name] = command
+        return command
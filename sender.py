@@ -13,47 +13,735 @@
 # See the License for the specific language governing permissions and
 # limitations under the License.
 
+from collections import deque
+from io import BytesIO
 import logging
-from Queue import Empty
-import requests
+import os
+import re
+from requests import RequestException
 from requests_toolbelt import MultipartEncoder
 import random
+from Queue import Empty, Queue
+from threading import Condition, Lock, Thread
 import time
 
+from spark import SparkClient
+
+class TokenBucket(object):
+    """
+    Limits the rate of requests
+
+    :param rate: the number of requests allowed per second
+    :type rate: ``float``
+
+    :param burst: the number of requests that can be sent at once
+    :type burst: ``int``
+
+    Tokens are added to the bucket at a regular pace, up to its capacity,
+    and each request takes one token. A request that finds the bucket
+    empty waits until a token is available. A rate of 0, the default,
+    disables the limit.
+    """
+
+    def __init__(self, rate=0.0, burst=5):
+        self.rate = float(rate)
+        self.capacity = float(burst)
+        self.tokens = self.capacity
+        self.stamp = time.time()
+        self.lock = Lock()
+
+    def refill(self):
+        """
+        Adds tokens for the time elapsed since last refill
+        """
+
+        now = time.time()
+        self.tokens = min(self.capacity,
+                          self.tokens + (now - self.stamp) * self.rate)
+        self.stamp = now
+
+    def take(self):
+        """
+        Takes one token, and waits for it if necessary
+
+        :return: the number of seconds spent waiting
+        :rtype: ``float``
+        """
+
+        if self.rate <= 0:
+            return 0.0
+
+        self.lock.acquire()
+        try:
+            self.refill()
+            self.tokens -= 1.0
+            if self.tokens >= 0.0:
+                return 0.0
+            delay = -self.tokens / self.rate
+        finally:
+            self.lock.release()
+
+        time.sleep(delay)
+        return delay
+
+    def pause(self, delay):
+        """
+        Prevents any request during some time
+
+        :param delay: the number of seconds to wait, e.g., from `Retry-After`
+        :type delay: ``float``
+
+        """
+
+        if self.rate <= 0:
+            return
+
+        self.lock.acquire()
+        try:
+            self.refill()
+            self.tokens = min(self.tokens, 1.0 - delay * self.rate)
+        finally:
+            self.lock.release()
+
+
+class Receipt(object):
+    """
+    Acknowledges items of durable queues once they have been posted
+
+    :param keys: for each item, its queue and its id in the spool, or None
+    :type keys: ``list`` of ``tuple``
+
+    :param count: the number of updates built from these items
+    :type count: ``int``
+
+    Items are acknowledged when all updates have been processed, so that
+    items that have not been posted yet are replayed on next start.
+    """
+
+    def __init__(self, keys, count=1):
+        self.keys = keys
+        self.count = count
+        self.lock = Lock()
+
+    def done(self):
+        """
+        Notes that one update has been processed
+        """
+
+        self.lock.acquire()
+        try:
+            self.count -= 1
+            if self.count > 0:
+                return
+        finally:
+            self.lock.release()
+
+        queues = {}
+        for key in self.keys:
+            if key is not None:
+                (queue, id) = key
+                queues.setdefault(queue, []).append(id)
+        for queue, ids in queues.items():
+            queue.ack(ids)
+
+
 class Sender(object):
     """
     Sends updates to Cisco Spark
+
+    :param mouth: interactive replies, that are sent first
+    :type mouth: ``Queue``
+
+    :param chatter: progress reports, that can wait a bit
+    :type chatter: ``Queue``
+
+    When the chatter is provided, the Sender always takes items from the
+    mouth first. Still, after `sender.weight` batches from the mouth, a batch
+    is taken from the chatter if it is waiting, so that progress reports
+    are not delayed forever by a steady flow of replies.
+
+    Updates are posted one after the other. A token bucket can limit their
+    pace with `sender.rate` and `sender.burst`, and there is no limit by
+    default. When Cisco Spark asks for some delay, or on transient errors,
+    the same update is posted again after some back-off, before any
+    subsequent update, so that the order of messages is preserved.
+
+    When `sender.workers` is more than 1, updates are spread over as many
+    lanes, each served by its own thread. All updates for the same room go
+    through the same lane, so that several rooms are served concurrently
+    while messages of each room are still posted in order. The target room
+    can be given in the item, with `room:`, else `spark.room_id` is used.
+    This helps only when items carry `room:` for several rooms, since all
+    updates for the default room go through one lane. Each lane holds at
+    most one update waiting to be posted, so that the bounds of the queues
+    and the priority of the mouth over the chatter still apply.
+
+    Items that are available at once in the queue are taken together, and
+    consecutive text messages, or consecutive Markdown messages, for the
+    same room are merged into a single update, up to `sender.limit`
+    characters. Items with files are never merged.
+
+    A message that is longer than `sender.limit` is split into several
+    updates, on line boundaries, and Markdown lists are kept in one piece
+    where possible. Above `sender.attach_above` characters, the text is
+    rather uploaded as a file attached to a short message.
+
+    Items of durable queues, see `SpooledQueue`, are acknowledged only after
+    the updates built from them have been posted, or dropped on errors.
+    Updates that are still waiting when the bot stops are posted again on
+    next start.
+
+    Files are opened only when they are posted, and closed right after. The
+    multipart encoder reads them by chunks, so that large files are never
+    loaded in memory. Files larger than `sender.max_file_size` bytes are
+    not uploaded at all.
+
+    Following counters are maintained in the context:
+
+    * `sender.throttled` - updates that had to wait for the rate limiter
+    * `sender.wait_ms` - milliseconds spent waiting for the rate limiter
+    * `sender.rate_limited` - responses with status code 429
+    * `sender.retries` - updates posted again
+    * `sender.dropped` - updates that could not be posted at all
+    * `sender.merged` - items merged into a previous update
+    * `sender.attached` - long messages uploaded as files
+
     """
 
-    def __init__(self, mouth):
+    list_item = re.compile(r'\s*([-*+]|\d+[.)])\s')
+
+    def __init__(self, mouth, chatter=None):
         self.mouth = mouth
-        logging.debug('sender {}'.format(self.mouth))
+        self.chatter = chatter
+        logging.debug('sender {}, {}'.format(self.mouth, self.chatter))
 
     def work(self, context):
         print("Starting sender")
 
         self.context = context
+        self.client = SparkClient(context)
+
+        (rate, burst, retries, backoff, workers, limit,
+         attach_above, max_file_size, weight) = self.context.get_many(
+            ('sender.rate',
+             'sender.burst',
+             'sender.retries',
+             'sender.backoff',
+             'sender.workers',
+             'sender.limit',
+             'sender.attach_above',
+             'sender.max_file_size',
+             'sender.weight'),
+            {'sender.rate': 0.0,
+             'sender.burst': 5,
+             'sender.retries': 3,
+             'sender.backoff': 0.5,
+             'sender.workers': 1,
+             'sender.limit': 7439,
+             'sender.attach_above': 20000,
+             'sender.max_file_size': 100000000,
+             'sender.weight': 4})
+        self.bucket = TokenBucket(rate, burst)
+        self.retries = int(retries)
+        self.backoff = float(backoff)
+        self.limit = int(limit)
+        self.attach_above = int(attach_above)
+        self.max_file_size = int(max_file_size)
+        self.weight = int(weight)
+
+        self.lanes = []
+        threads = []
+        if int(workers) > 1:
+            for index in range(int(workers)):
+                lane = Queue(1)
+                thread = Thread(target=self.drive, args=(lane,))
+                thread.daemon = True
+                thread.start()
+                self.lanes.append(lane)
+                threads.append(thread)
 
         self.context.set('sender.counter', 0)
+        if self.chatter is None:
+            self.context.wake_up(self.mouth)
+        else:
+            self.listen()
+
         while self.context.get('general.switch', 'on') == 'on':
+            (items, keys, stop) = self.fetch()
+            if not items:
+                break
+
+            counter = self.context.increment('sender.counter', len(items))
+            groups = self.group(items)
+            if len(groups) < len(items):
+                self.context.increment('sender.merged',
+                                       len(items) - len(groups))
+
+            position = 0
+            for (update, count) in groups:
+                parts = self.fit(update)
+
+                receipt = None
+                if any(keys[position:position+count]):
+                    receipt = Receipt(keys[position:position+count],
+                                      len(parts))
+                position += count
+
+                for part in parts:
+                    self.process(part, counter, receipt)
+
+            if stop:
+                break
+
+        # let lanes complete updates in flight
+        #
+        for lane in self.lanes:
+            lane.put(None)
+        for thread in threads:
+            thread.join()
+
+    def fetch(self):
+        """
+        Waits for the next items to send
+
+        :return: the list of items, their keys, and True if the end has
+            been reached
+        :rtype: ``tuple``
+
+        """
+
+        if self.chatter is not None:
+            return self.select()
+
+        (key, item) = self.take(self.mouth)
+        if isinstance(item, Exception):
+            return ([], [], True)
+
+        return self.drain(key, item)
+
+    def take(self, queue, block=True):
+        """
+        Gets next item of a queue
+
+        :param queue: the queue to read
+        :type queue: ``Queue`` or ``SpooledQueue``
+
+        :param block: wait for an item
+        :type block: ``bool``
+
+        :return: the key of the item, and the item
+        :rtype: ``tuple``
+
+        For a durable queue, the key is the queue and the id of the item,
+        that are passed later on to a `Receipt`. Else the key is None.
+        """
+
+        if hasattr(queue, 'ack'):
+            (id, item) = queue.get_envelope(block)
+            if id is None:
+                return (None, item)
+            return ((queue, id), item)
+
+        return (None, queue.get(block))
+
+    def listen(self):
+        """
+        Starts one thread for the mouth, and one for the chatter
+
+        Each thread moves items from its queue to a list of pending items,
+        where `select()` can pick them. Items are listed with their keys.
+        """
+
+        self.ready = Condition()
+        self.pending = (deque(), deque())
+        self.streak = 0
+
+        for (queue, pending) in zip((self.mouth, self.chatter), self.pending):
+            self.context.wake_up(queue)
+            thread = Thread(target=self.feed, args=(queue, pending))
+            thread.daemon = True
+            thread.start()
+
+    def feed(self, queue, pending, size=100):
+        """
+        Moves items from one queue to a list of pending items
+
+        :param queue: the queue to read
+        :type queue: ``Queue``
+
+        :param pending: keys and items that have not been selected yet
+        :type pending: ``collections.deque``
+
+        :param size: the maximum number of pending items
+        :type size: ``int``
+
+        """
+
+        while True:
+            (key, item) = self.take(queue)
+
+            self.ready.acquire()
             try:
-                item = self.mouth.get(True, 0.1)
+                while len(pending) >= size:
+                    self.ready.wait()
+                pending.append((key, item))
+                self.ready.notify_all()
+            finally:
+                self.ready.release()
+
+            if isinstance(item, Exception):
+                break
+
+    def select(self, size=100):
+        """
+        Takes pending items, with priority given to the mouth
+
+        :param size: the maximum number of items to return
+        :type size: ``int``
+
+        :return: the list of items, their keys, and True if the end has
+            been reached
+        :rtype: ``tuple``
+
+        Items are taken from the mouth, unless it is empty or it has been
+        served `self.weight` times in a row while the chatter was waiting.
+        """
+
+        self.ready.acquire()
+        try:
+            (high, low) = self.pending
+            while not high and not low:
+                self.ready.wait()
+
+            if high and (not low or self.streak < self.weight):
+                lane = high
+                self.streak += 1
+            else:
+                lane = low
+                self.streak = 0
+
+            items = []
+            keys = []
+            stop = False
+            while lane and len(items) < size:
+                (key, item) = lane.popleft()
                 if isinstance(item, Exception):
+                    stop = True
                     break
-                counter = self.context.increment('sender.counter')
-                self.process(item, counter)
+                items.append(item)
+                keys.append(key)
+
+            self.ready.notify_all()
+            return (items, keys, stop)
+
+        finally:
+            self.ready.release()
+
+    def drain(self, key, item, size=100):
+        """
+        Takes items that are already in the queue
+
+        :param key: the key of the item that has just been received
+        :type key: ``tuple``
+
+        :param item: the item that has just been received
+        :type item: ``str`` or ``dict``
+
+        :param size: the maximum number of items to return
+        :type size: ``int``
+
+        :return: the list of items, their keys, and True if the end has
+            been reached
+        :rtype: ``tuple``
+
+        This function does not wait for new items.
+        """
+
+        items = [item]
+        keys = [key]
+        while len(items) < size:
+            try:
+                (key, item) = self.take(self.mouth, block=False)
             except Empty:
-                pass
+                break
+
+            if isinstance(item, Exception):
+                return (items, keys, True)
+
+            items.append(item)
+            keys.append(key)
+
+        return (items, keys, False)
+
+    def group(self, items):
+        """
+        Merges consecutive messages, and counts merged items
+
+        :param items: items taken from the queue
+        :type items: ``list``
+
+        :return: each update, with the number of items it is made of
+        :rtype: ``list`` of ``tuple``
+
+        Text messages are merged together, and Markdown messages are merged
+        together, as long as they go to the same room and as long as the
+        merged text does not exceed `self.limit`. Other items are passed
+        through unchanged.
+        """
+
+        merged = []
+        counts = []
+        previous = None
+        for item in items:
+            current = self.get_text(item)
+
+            if (current is not None
+                    and previous is not None
+                    and current[:2] == previous[:2]
+                    and len(previous[2]) + 1 + len(current[2]) <= self.limit):
+
+                previous = (previous[0],
+                            previous[1],
+                            previous[2] + '\n' + current[2])
+
+                if previous[0] == 'message' and previous[1] is None:
+                    merged[-1] = previous[2]
+                else:
+                    merged[-1] = {previous[0]: previous[2]}
+                    if previous[1] is not None:
+                        merged[-1]['room'] = previous[1]
+                counts[-1] += 1
+
+            else:
+                merged.append(item)
+                counts.append(1)
+                previous = current
+
+        return list(zip(merged, counts))
+
+    def fit(self, item):
+        """
+        Adapts an item to the size limit of Cisco Spark
+
+        :param item: an item taken from the queue
+        :type item: ``str`` or ``dict``
+
+        :return: one or several items ready for the update of Cisco Spark
+        :rtype: ``list``
+
+        Long messages are split in several parts, or attached as a file
+        if they are longer than `self.attach_above`.
+        """
+
+        current = self.get_text(item)
+        if current is None or len(current[2]) <= self.limit:
+            return [item]
+
+        (kind, room, text) = current
+
+        if self.attach_above > 0 and len(text) > self.attach_above:
+            print("- attaching long message as a file")
+            self.context.increment('sender.attached')
+
+            attachment = {
+                'message': 'Full text is attached ({} lines)'.format(
+                    text.count('\n') + 1),
+                'content': text}
+            if kind == 'markdown':
+                attachment['label'] = 'message.md'
+                attachment['type'] = 'text/markdown'
+            else:
+                attachment['label'] = 'message.txt'
+                attachment['type'] = 'text/plain'
+            if room is not None:
+                attachment['room'] = room
+            return [attachment]
+
+        parts = []
+        for chunk in self.split(text):
+            if kind == 'message' and room is None:
+                parts.append(chunk)
+            else:
+                part = {kind: chunk}
+                if room is not None:
+                    part['room'] = room
+                parts.append(part)
+
+        return parts
+
+    def split(self, text):
+        """
+        Cuts some text in pieces that are not longer than `self.limit`
+
+        :param text: the text to split
+        :type text: ``str``
+
+        :return: pieces of the text
+        :rtype: ``list`` of ``str``
+
+        Text is split on line boundaries. An item of a Markdown list, with
+        its indented lines, is never split, and a list that would not fit
+        at the end of a piece is moved to the next piece. Lines that are
+        longer than the limit are cut anyway. Blank lines stay with a
+        neighbouring piece where they fit, and no piece is ever longer than
+        the limit.
+        """
+
+        # a list item and its indented lines make one unit
+        #
+        units = []
+        for line in text.split('\n'):
+            if (units and units[-1][1]
+                    and line[:1] in (' ', '\t') and line.strip()):
+                units[-1] = (units[-1][0] + '\n' + line, True)
+            else:
+                units.append((line, self.list_item.match(line) is not None))
+
+        chunks = []
+        glues = []  # what goes between each piece and the next one
+        current = []
+        size = 0
+        start = None  # where the list of the current piece begins
+        for (unit, is_item) in units:
+
+            while len(unit) > self.limit:
+                if current:
+                    chunks.append('\n'.join(current))
+                    glues.append('\n')
+                    (current, size, start) = ([], 0, None)
+                chunks.append(unit[:self.limit])
+                glues.append('')
+                unit = unit[self.limit:]
+
+            if current and size + 1 + len(unit) > self.limit:
+
+                if is_item and start:
+                    chunks.append('\n'.join(current[:start]))
+                    glues.append('\n')
+                    current = current[start:]
+                    size = len('\n'.join(current))
+                    start = 0
+
+                if current and size + 1 + len(unit) > self.limit:
+                    chunks.append('\n'.join(current))
+                    glues.append('\n')
+                    (current, size, start) = ([], 0, None)
+
+            if not is_item:
+                start = None
+            elif start is None:
+                start = len(current)
+
+            if current:
+                size += 1 + len(unit)
+            else:
+                size = len(unit)
+            current.append(unit)
+
+        if current:
+            chunks.append('\n'.join(current))
+            glues.append('\n')
+
+        # blank pieces are kept with a neighbour, where they fit
+        #
+        pieces = []
+        for (chunk, glue) in zip(chunks, glues):
+            if pieces and (not chunk.strip() or not pieces[-1][0].strip()):
+                (previous, joint) = pieces[-1]
+                if len(previous) + len(joint) + len(chunk) <= self.limit:
+                    pieces[-1] = (previous + joint + chunk, glue)
+                    continue
+            pieces.append((chunk, glue))
+
+        return [chunk for (chunk, glue) in pieces]
+
+    def get_text(self, item):
+        """
+        Describes an item that can be merged with others
+
+        :param item: an item taken from the queue
+        :type item: ``str`` or ``dict``
+
+        :return: kind ('message' or 'markdown'), room, and text, or None
+        :rtype: ``tuple``
+        """
+
+        if isinstance(item, basestring):
+            return ('message', None, item)
 
-    def process(self, item, counter):
+        if isinstance(item, dict):
+            keys = set(item.keys())
+            keys.discard('room')
+            if len(keys) == 1:
+                kind = keys.pop()
+                if kind in ('message', 'markdown'):
+                    text = item[kind]
+                    if not isinstance(text, basestring):
+                        text = str(text)
+                    return (kind, item.get('room'), text)
+
+        return None
+
+    def process(self, item, counter, receipt=None):
         """
         Sends one update to Cisco Spark
+
+        :param receipt: what to acknowledge once the update has been posted
+        :type receipt: ``Receipt``
+
+        With several lanes, the update is queued to the lane of its room,
+        and this function returns without waiting for the actual post. An
+        update without `roomId` goes to the lane of `spark.room_id`, like
+        updates that name the default room explicitly.
         """
 
         print('Sender is working on {}'.format(counter))
 
         update = self.build_update(item, counter)
-        self.post_update(update)
+
+        if self.lanes:
+            room_id = None
+            if isinstance(update, dict):
+                room_id = update.get('roomId')
+            if room_id is None:
+                room_id = self.context.get('spark.room_id')
+            lane = self.lanes[hash(room_id) % len(self.lanes)]
+            lane.put((update, receipt))
+
+        else:
+            self.post(update, receipt)
+
+    def drive(self, lane):
+        """
+        Posts updates of one lane, in order
+
+        :param lane: updates to be posted with their receipts, and None at
+            the end
+        :type lane: ``Queue.Queue``
+
+        Pending updates are dropped once the bot has been stopped.
+        """
+
+        while True:
+            envelope = lane.get()
+            if envelope is None:
+                break
+            if self.context.stopped.is_set():
+                continue
+            self.post(*envelope)
+
+    def post(self, update, receipt=None):
+        """
+        Posts one update, and acknowledges its items
+
+        Items are not acknowledged if the update has been interrupted by
+        the stop of the bot, so that it is posted again on next start.
+        """
+
+        posted = self.post_update(update)
+        if receipt is not None:
+            if posted or not self.context.stopped.is_set():
+                receipt.done()
 
 
     def build_update(self, item, counter):
@@ -69,7 +757,12 @@ class Sender(object):
         * send a Markdown message to the room with `markdown:` statement
         * upload a file with `file:`, `label:` and `type:`
         * send a message and attach a file
+        * attach some text with `content:`, `label:` and `type:`
 
+        In every case, `room:` can designate another room than the default.
+
+        Files are not opened here, but only checked. The update mentions
+        their path, and they are read later on, while being posted.
 
         """
 
@@ -98,9 +791,7 @@ class Sender(object):
 
         # file upload
         #
-        if 'file' in item:
-
-            print("- attaching file {}".format(item['file']))
+        if 'file' in item or 'content' in item:
 
             if 'label' in item:
                 text = item['label']
@@ -109,14 +800,49 @@ class Sender(object):
                     update['text'] = "'{}'".format(item['label'])
 
             else:
-                text = item['file']
+                text = item.get('file', 'message.txt')
 
             if 'type' in item:
                 type = item['type']
             else:
                 type = 'application/octet-stream'
 
-            update['files'] = (text, open(item['file'], 'rb'), type)
+            if 'file' in item:
+                print("- attaching file {}".format(item['file']))
+
+                try:
+                    size = os.path.getsize(item['file'])
+                except OSError:
+                    size = None
+
+                if size is None or size > self.max_file_size:
+                    print("- unable to upload {}".format(item['file']))
+                    self.context.increment('sender.dropped')
+                    note = "Unable to upload '{}'".format(text)
+                    if 'markdown' in update:
+                        update['markdown'] += '\n' + note
+                    elif 'message' in item:
+                        update['text'] = item['message'] + '\n' + note
+                    else:
+                        update['text'] = note
+                    source = None
+
+                else:
+                    source = item['file']
+
+            else:
+                content = item['content']
+                if isinstance(content, unicode):
+                    content = content.encode('utf-8')
+                source = BytesIO(content)
+
+            if source is not None:
+                update['files'] = (text, source, type)
+
+        # another room than the default one
+        #
+        if 'room' in item:
+            update['roomId'] = item['room']
 
         return update
 
@@ -126,24 +852,98 @@ class Sender(object):
 
         If the update is a simple string, it is sent as such to Cisco Spark.
         Else if it a dictionary, then it is encoded as MIME Multipart.
+
+        A file attached to the update is opened on each attempt, streamed
+        to Cisco Spark, and closed before this function returns.
         """
 
         print("Sending update to Cisco Spark room")
 
-        bearer = self.context.get('spark.CISCO_SPARK_PLUMBERY_BOT')
         room_id = self.context.get('spark.room_id')
 
-        url = 'https://api.ciscospark.com/v1/messages'
-        headers = {'Authorization': 'Bearer '+bearer}
+        attempt = 0
+        while True:
+
+            waited = self.bucket.take()
+            if waited > 0:
+                self.context.increment('sender.throttled')
+                self.context.increment('sender.wait_ms', int(1000 * waited))
+
+            headers = {}
+            handle = None
+            if isinstance(update, dict):
+                fields = dict(update)
+                fields.setdefault('roomId', room_id)
+                if 'files' in update:
+                    (label, source, type) = update['files']
+                    if isinstance(source, basestring):
+                        try:
+                            handle = open(source, 'rb')
+                        except IOError as feedback:
+                            print("Sender could not read file: {}".format(feedback))
+                            self.context.increment('sender.dropped')
+                            return False
+                        fields['files'] = (label, handle, type)
+                    else:
+                        source.seek(0)
+                payload = MultipartEncoder(fields=fields)
+                headers['Content-Type'] = payload.content_type
+            else:
+                payload = {'roomId': room_id, 'text': update }
+
+            delay = None
+            try:
+                response = self.client.post('/messages',
+                                            headers=headers,
+                                            data=payload)
 
-        if isinstance(update, dict):
-            update['roomId'] = room_id
-            payload = MultipartEncoder(fields=update)
-            headers['Content-Type'] = payload.content_type
-        else:
-            payload = {'roomId': room_id, 'text': update }
+                if response.status_code == 200:
+                    return True
 
-        response = requests.post(url=url, headers=headers, data=payload)
+                print("Sender received error code {}".format(response.status_code))
+
+                if response.status_code == 429:
+                    self.context.increment('sender.rate_limited')
+                    delay = self.get_retry_after(response)
+                    if delay is not None:
+                        self.bucket.pause(delay)
+
+                elif response.status_code < 500:
+                    self.context.increment('sender.dropped')
+                    return False
+
+            except RequestException as feedback:
+                print("Sender could not reach Cisco Spark: {}".format(feedback))
+
+            finally:
+                if handle is not None:
+                    handle.close()
+
+            if attempt >= self.retries:
+                print("Sender is dropping the update")
+                self.context.increment('sender.dropped')
+                return False
+
+            if delay is None:
+                delay = random.uniform(0, self.backoff * 2 ** attempt)
+
+            attempt += 1
+            self.context.increment('sender.retries')
+            if self.context.stopped.wait(delay):
+                return False
+
+    def get_retry_after(self, response):
+        """
+        Reads the delay requested by Cisco Spark
+
+        :param response: a response with status code 429
+        :type response: ``requests.Response``
+
+        :return: the number of seconds to wait, or None
+        :rtype: ``float``
+        """
 
-        if response.status_code != 200:
-            print("Sender received error code {}".format(response.status_code))
+        try:
+            return max(0.0, float(response.headers.get('Retry-After')))
+        except (TypeError, ValueError):
+            return None
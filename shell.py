@@ -14,14 +14,17 @@
 # limitations under the License.
 
 import logging
-import os
-import yaml
+
+from catalog import Catalog
+from records import Action
+from registry import Registry
 
 help_markdown = """
 Some commands that may prove useful:
 - show status: @plumby status
 - list categories: @plumby list
 - list templates: @plumby list analytics
+- search templates: @plumby search hadoop
 - use template: @plumby use analytics/hadoop-cluster
 - deploy template: @plumby deploy
 - get information: @plumby information
@@ -30,22 +33,153 @@ Some commands that may prove useful:
 - destroy resources: @plumby dispose
 """
 
+class Reply(object):
+    """
+    Collects the output of one command, and sends it as one update
+
+    :param mouth: the queue of updates sent to Cisco Spark
+    :type mouth: ``Queue``
+
+    :param limit: the maximum size of one update
+    :type limit: ``int``
+
+    A reply of a single line is sent as plain text. Longer replies are
+    sent as Markdown. A reply that exceeds `limit` characters is cut on
+    line boundaries, and pages are sent as separate updates.
+
+    Nothing is sent if the command raises an exception.
+    """
+
+    def __init__(self, mouth, limit=7439):
+        self.mouth = mouth
+        self.limit = limit
+        self.lines = []
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, type, value, traceback):
+        if type is None:
+            self.send()
+        return False
+
+    def add(self, line):
+        """
+        Appends a line to the reply
+
+        :param line: the text to add, that can span several lines
+        :type line: ``str``
+        """
+
+        self.lines.append(line)
+
+    def send(self):
+        """
+        Puts the reply in the mouth
+        """
+
+        if not self.lines:
+            return
+
+        if len(self.lines) == 1 and '\n' not in self.lines[0]:
+            self.mouth.put(self.lines[0])
+
+        else:
+            for page in self.paginate():
+                self.mouth.put({'markdown': page})
+
+        self.lines = []
+
+    def paginate(self):
+        """
+        Cuts the reply in pages that are not longer than `self.limit`
+
+        :return: pages of text
+        :rtype: ``list`` of ``str``
+
+        A line longer than the limit makes a page on its own, and is cut
+        later on by the Sender.
+        """
+
+        pages = []
+        current = []
+        size = 0
+        for line in self.lines:
+            if current and size + 1 + len(line) > self.limit:
+                pages.append('\n'.join(current))
+                current = []
+                size = 0
+            size += len(line) + (1 if current else 0)
+            current.append(line)
+        pages.append('\n'.join(current))
+        return pages
+
+
 class Shell(object):
     """
     Parses input and reacts accordingly
+
+    :param catalog: the index of fittings plans, shared by all commands
+    :type catalog: ``Catalog``
+
+    If no catalog is provided, one is built on first use from the setting
+    `plumbery.fittings`.
+
+    Each command gives back a single update to the end user, see `Reply`.
     """
 
-    def __init__(self, context, inbox, mouth):
+    def __init__(self, context, inbox, mouth, catalog=None):
         self.context = context
         self.inbox = inbox
         self.mouth = mouth
+        self.catalog = catalog
+        self.registry = Registry(self)
+
+    def get_catalog(self):
+        """
+        Provides the index of fittings plans
+
+        :return: the catalog, or None if fittings cannot be found
+        :rtype: ``Catalog``
+
+        The catalog is built again if `plumbery.fittings` has been changed.
+        """
+
+        (root, interval) = self.context.get_many(
+            ('plumbery.fittings', 'plumbery.refresh'),
+            {'plumbery.fittings': '.', 'plumbery.refresh': 2.0})
+
+        if self.catalog is None or self.catalog.root != root:
+            self.catalog = Catalog(root, interval)
+
+        if not self.catalog.refresh():
+            return None
+        return self.catalog
+
+    def reply(self):
+        """
+        Starts the reply to one command
+
+        :return: a reply that is sent at the end of a `with` block
+        :rtype: ``Reply``
+
+        Example::
+
+            with self.reply() as reply:
+                reply.add("Available parameters:")
+                reply.add("- locationId: EU6")
+
+        """
+
+        return Reply(self.mouth, self.context.get('sender.limit', 7439))
 
     def do(self, line):
         """
         Handles one line of text
 
-        This function uses the first token as a verb, and looks for a method
-        of the same name in the shell.
+        This function uses the first token as a verb, and looks for the
+        command of the same name in the registry of the shell. A verb can
+        also be an alias, or an unambiguous prefix of a command.
 
         For example, for the command `use analytics/hadoop-cluster`, the function
         will invoke `shell.do_use('analytics/hadoop-cluster')`.
@@ -63,186 +197,201 @@ class Shell(object):
         else:
             arguments = ''
 
-        try:
-            method = getattr(self, 'do_'+verb, None)
-            if callable(method):
-                method(arguments)
+        names = self.registry.resolve(verb)
+        if len(names) == 1:
+            command = self.registry.get_command(names[0])
+            if command is not None:
+                command(arguments)
+                return
+
+        with self.reply() as reply:
+            if len(names) > 1:
+                reply.add("Sorry, '{}' could be any of: {}".format(
+                    verb, ', '.join(names)))
             else:
-                self.mouth.put("Sorry, I do not know how to handle '{}'".format(verb))
-
-        except Exception as feedback:
-            raise
-
-            self.mouth.put("Sorry, I do not know how to handle '{}'".format(verb))
+                reply.add("Sorry, I do not know how to handle '{}'".format(verb))
 
     def do_deploy(self, arguments=None):
-        if not self.context.get('worker.busy', False):
-            self.mouth.put("Ok, working on it")
-        else:
-            self.mouth.put("Ok, will work on it as soon as possible")
-        self.inbox.put(('deploy', arguments))
+        with self.reply() as reply:
+            if not self.context.get('worker.busy', False):
+                reply.add("Ok, working on it")
+            else:
+                reply.add("Ok, will work on it as soon as possible")
+        self.inbox.put(Action('deploy', arguments))
 
     def do_dispose(self, arguments=None):
-        if not self.context.get('worker.busy', False):
-            self.mouth.put("Ok, working on it")
-        else:
-            self.mouth.put("Ok, will work on it as soon as possible")
-        self.inbox.put(('dispose', arguments))
+        with self.reply() as reply:
+            if not self.context.get('worker.busy', False):
+                reply.add("Ok, working on it")
+            else:
+                reply.add("Ok, will work on it as soon as possible")
+        self.inbox.put(Action('dispose', arguments))
 
     def do_information(self, arguments=None):
-        if not self.context.get('worker.busy', False):
-            self.mouth.put("Ok, working on it")
-        else:
-            self.mouth.put("Ok, will work on it as soon as possible")
-        self.inbox.put(('information', arguments))
+        with self.reply() as reply:
+            if not self.context.get('worker.busy', False):
+                reply.add("Ok, working on it")
+            else:
+                reply.add("Ok, will work on it as soon as possible")
+        self.inbox.put(Action('information', arguments))
 
     def do_help(self, arguments=None):
-        self.mouth.put({'markdown': help_markdown})
+        with self.reply() as reply:
+            reply.add(help_markdown.strip())
 
     def do_list(self, arguments=None):
-        root =  self.context.get('plumbery.fittings', '.')
-        url =  self.context.get('plumbery.fittings_url', None)
-        if not os.path.isdir(root):
-            self.mouth.put("Invalid path for fittings. Check configuration")
-            return
-
-        if arguments is None or len(arguments) == 0:
-            count = 0
-            update=["You can list templates in following categories:"]
-            for category in os.listdir(root):
-                c_path = os.path.join(root,category)
-                if not os.path.isdir(c_path):
-                    continue
-                if category[0] == '.':
-                    continue
-                count += 1
-                update.append("- {}".format(category))
-            if count == 0:
-                self.mouth.put("No category has been found. Check configuration")
-            else:
-                self.mouth.put({'markdown': '\n'.join(update)})
-            return
-
-        c_path = os.path.join(root,arguments)
-        if not os.path.isdir(c_path):
-            self.mouth.put("No category has this name. Double-check with the list command.".format(arguments))
-            return
-
-        count = 0
-        update=["You can use any of following templates:"]
-        for fittings in os.listdir(c_path):
-            f_path = os.path.join(c_path,fittings)
-            try:
-                with open(os.path.join(f_path, 'fittings.yaml'), 'r') as f:
-                    count += 1
-                    label = arguments+'/'+fittings
-                    if url:
-                        label = '['+label+']('+url+'/'+label+')'
-                    update.append("- {}".format(label))
-            except IOError:
-                pass
-
-        if count == 0:
-            self.mouth.put("No template has been found in category '{}'".format(arguments))
-        else:
-            self.mouth.put({'markdown': '\n'.join(update)})
+        with self.reply() as reply:
+            url =  self.context.get('plumbery.fittings_url', None)
+            catalog = self.get_catalog()
+            if catalog is None:
+                reply.add("Invalid path for fittings. Check configuration")
+                return
+
+            if arguments is None or len(arguments) == 0:
+                categories = catalog.list_categories()
+                if len(categories) == 0:
+                    reply.add("No category has been found. Check configuration")
+                else:
+                    reply.add("You can list templates in following categories:")
+                    for category in categories:
+                        reply.add("- {}".format(category))
+                return
+
+            templates = catalog.list_templates(arguments)
+            if templates is None:
+                reply.add("No category has this name. Double-check with the list command.")
+                return
+
+            if len(templates) == 0:
+                reply.add("No template has been found in category '{}'".format(arguments))
+                return
+
+            reply.add("You can use any of following templates:")
+            for fittings in templates:
+                label = arguments+'/'+fittings
+                if url:
+                    label = '['+label+']('+url+'/'+label+')'
+                reply.add("- {}".format(label))
 
     def do_parameters(self, arguments=None):
-        root =  self.context.get('plumbery.fittings', '.')
-        if not os.path.isdir(root):
-            self.mouth.put("Invalid path for fittings. Check configuration")
-            return
-
-        if arguments is None or len(arguments) < 1:
-            arguments = self.context.get('worker.template', 'example/first')
-
-        if '/' not in arguments:
-            self.mouth.put("Please indicate the category and the template that you want to use.")
-            return
-
-        f_path = os.path.join(root,arguments)
-        try:
-            with open(os.path.join(f_path, 'fittings.yaml'), 'r') as handle:
-                plan = handle.read()
-                documents = plan.split('\n---')
-                for document in documents:
-                    if '\n' in document:
-                        settings = yaml.load(document)
-
-                        if 'parameters' in settings:
-                            self.mouth.put('Available parameters:')
-                            for key in sorted(settings['parameters'].keys()):
-#                                if 'parameter.'+key in parameters:
-#                                    continue
-                                if 'default' not in settings['parameters'][key]:
-                                    raise ValueError("Parameter '{}' has no default value"
-                                                     .format(key))
-#                                parameters['parameter.'+key] = settings['parameters'][key]['default']
-                                self.mouth.put('- {}: {}'.format(key, settings['parameters'][key]['default']))
-                        else:
-                            self.mouth.put('No parameter for {}'.format(arguments))
-                        break
-                    else:
-                        self.mouth.put('No parameter for {}'.format(arguments))
-        except IOError:
-            self.mouth.put("No template has this name. Double-check with the list command.")
+        with self.reply() as reply:
+            catalog = self.get_catalog()
+            if catalog is None:
+                reply.add("Invalid path for fittings. Check configuration")
+                return
+
+            if arguments is None or len(arguments) < 1:
+                arguments = self.context.get('worker.template', 'example/first')
+
+            if '/' not in arguments:
+                reply.add("Please indicate the category and the template that you want to use.")
+                return
+
+            header = catalog.get_header(arguments)
+            if header is None:
+                reply.add("No template has this name. Double-check with the list command.")
+                return
+
+            parameters = header.get('parameters')
+            if not parameters:
+                reply.add('No parameter for {}'.format(arguments))
+                return
+
+            reply.add('Available parameters:')
+            for key in sorted(parameters.keys()):
+                if 'default' not in parameters[key]:
+                    raise ValueError("Parameter '{}' has no default value"
+                                     .format(key))
+                reply.add('- {}: {}'.format(key, parameters[key]['default']))
 
     def do_prepare(self, arguments=None):
-        if not self.context.get('worker.busy', False):
-            self.mouth.put("Ok, working on it")
-        else:
-            self.mouth.put("Ok, will work on it as soon as possible")
-        self.inbox.put(('prepare', arguments))
+        with self.reply() as reply:
+            if not self.context.get('worker.busy', False):
+                reply.add("Ok, working on it")
+            else:
+                reply.add("Ok, will work on it as soon as possible")
+        self.inbox.put(Action('prepare', arguments))
 
     def do_refresh(self, arguments=None):
-        if not self.context.get('worker.busy', False):
-            self.mouth.put("Ok, working on it")
-        else:
-            self.mouth.put("Ok, will work on it as soon as possible")
-        self.inbox.put(('refresh', arguments))
+        with self.reply() as reply:
+            if not self.context.get('worker.busy', False):
+                reply.add("Ok, working on it")
+            else:
+                reply.add("Ok, will work on it as soon as possible")
+        self.inbox.put(Action('refresh', arguments))
+
+    def do_search(self, arguments=None):
+        with self.reply() as reply:
+            url =  self.context.get('plumbery.fittings_url', None)
+            catalog = self.get_catalog()
+            if catalog is None:
+                reply.add("Invalid path for fittings. Check configuration")
+                return
+
+            if arguments is None or len(arguments.strip()) == 0:
+                reply.add("Please indicate what you are looking for.")
+                return
+
+            names = catalog.search(arguments)
+            if len(names) == 0:
+                reply.add("No template has been found for '{}'".format(arguments))
+                return
+
+            reply.add("You can use any of following templates:")
+            for label in names:
+                if url:
+                    label = '['+label+']('+url+'/'+label+')'
+                reply.add("- {}".format(label))
 
     def do_start(self, arguments=None):
-        if not self.context.get('worker.busy', False):
-            self.mouth.put("Ok, working on it")
-        else:
-            self.mouth.put("Ok, will work on it as soon as possible")
-        self.inbox.put(('start', arguments))
+        with self.reply() as reply:
+            if not self.context.get('worker.busy', False):
+                reply.add("Ok, working on it")
+            else:
+                reply.add("Ok, will work on it as soon as possible")
+        self.inbox.put(Action('start', arguments))
 
     def do_status(self, arguments=None):
-        self.mouth.put("Using {}".format(self.context.get('worker.template', 'example/first')))
-        if self.context.get('worker.busy', False):
-            self.mouth.put("On-going processing")
-        else:
-            self.mouth.put("Ready to process commands")
+        with self.reply() as reply:
+            (template, busy) = self.context.get_many(
+                ('worker.template', 'worker.busy'),
+                {'worker.template': 'example/first', 'worker.busy': False})
+            reply.add("Using {}".format(template))
+            if busy:
+                reply.add("On-going processing")
+            else:
+                reply.add("Ready to process commands")
 
     def do_stop(self, arguments=None):
-        if not self.context.get('worker.busy', False):
-            self.mouth.put("Ok, working on it")
-        else:
-            self.mouth.put("Ok, will work on it as soon as possible")
-        self.inbox.put(('stop', arguments))
+        with self.reply() as reply:
+            if not self.context.get('worker.busy', False):
+                reply.add("Ok, working on it")
+            else:
+                reply.add("Ok, will work on it as soon as possible")
+        self.inbox.put(Action('stop', arguments))
 
     def do_use(self, arguments=None):
-        root =  self.context.get('plumbery.fittings', '.')
-        if not os.path.isdir(root):
-            self.mouth.put("Invalid path for fittings. Check configuration")
-            return
+        with self.reply() as reply:
+            catalog = self.get_catalog()
+            if catalog is None:
+                reply.add("Invalid path for fittings. Check configuration")
+                return
 
-        if arguments is None:
-            self.mouth.put("Please indicate the category and the template that you want to use.")
-            return
+            if arguments is None:
+                reply.add("Please indicate the category and the template that you want to use.")
+                return
 
-        if '/' not in arguments:
-            self.mouth.put("Please indicate the category and the template that you want to use.")
-            return
+            if '/' not in arguments:
+                reply.add("Please indicate the category and the template that you want to use.")
+                return
+
+            if catalog.get_path(arguments) is None:
+                reply.add("No template has this name. Double-check with the list command.")
+                return
 
-        f_path = os.path.join(root,arguments)
-        try:
-            with open(os.path.join(f_path, 'fittings.yaml'), 'r') as f:
-                self.context.set('worker.template', arguments)
-                self.mouth.put("This is well-noted")
-        except IOError:
-            self.mouth.put("No template has this name. Double-check with the list command.")
+            self.context.set('worker.template', arguments)
+            reply.add("This is well-noted")
 
     def do_version(self, arguments=None):
-        self.mouth.put("Version {}".format(self.context.get('plumby.version', '*unknown*')))
+        with self.reply() as reply:
+            reply.add("Version {}".format(self.context.get('plumby.version', '*unknown*')))
@@ -0,0 +1,163 @@
+# Licensed to the Apache Software Foundation (ASF) under one or more
+# contributor license agreements.  See the NOTICE file distributed with
+# this work for additional information regarding copyright ownership.
+# The ASF licenses this file to You under the Apache License, Version 2.0
+# (the "License"); you may not use this file except in compliance with
+# the License.  You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+import logging
+import os
+import requests
+from requests.adapters import HTTPAdapter
+
+# one pooled session per process, keyed by process id
+#
+sessions = {}
+
+
+def get_session(pool_size=10):
+    """
+    Provides the HTTP session of the current process
+
+    :param pool_size: the number of connections kept alive per host
+    :type pool_size: ``int``
+
+    :return: a session that keeps connections alive across requests
+    :rtype: ``requests.Session``
+
+    Sessions are never shared across processes, since a forked process
+    cannot safely reuse the connections of its parent.
+    """
+
+    pid = os.getpid()
+    session = sessions.get(pid)
+    if session is None:
+        logging.debug('session {}, pool {}'.format(pid, pool_size))
+        session = requests.Session()
+        adapter = HTTPAdapter(pool_connections=pool_size,
+                              pool_maxsize=pool_size)
+        session.mount('https://', adapter)
+        session.mount('http://', adapter)
+        sessions.clear()
+        sessions[pid] = session
+    return session
+
+
+class SparkClient(object):
+    """
+    Sends requests to the Cisco Spark API
+
+    :param context: the shared context, with settings such as tokens
+    :type context: ``Context``
+
+    :param token: the key of the token used for authentication
+    :type token: ``str``
+
+    Connect and read timeouts are taken from `spark.connect_timeout` and
+    `spark.read_timeout`. The authentication header is computed on the
+    first request, and then reused.
+
+    Example::
+
+        client = SparkClient(context)
+        response = client.get('/rooms')
+
+    """
+
+    def __init__(self, context, token='spark.CISCO_SPARK_PLUMBERY_BOT'):
+        self.context = context
+        self.token = token
+        self.headers = None
+        self.timeout = None
+        self.url = None
+        self.pool_size = None
+
+    def configure(self):
+        """
+        Computes headers and timeouts from the context
+        """
+
+        (bearer, url, connect, read, pool_size) = self.context.get_many(
+            (self.token,
+             'spark.url',
+             'spark.connect_timeout',
+             'spark.read_timeout',
+             'spark.pool_size'),
+            {'spark.url': 'https://api.ciscospark.com/v1',
+             'spark.connect_timeout': 5.0,
+             'spark.read_timeout': 30.0,
+             'spark.pool_size': 10})
+
+        self.headers = {'Authorization': 'Bearer '+str(bearer)}
+        self.timeout = (float(connect), float(read))
+        self.url = url.rstrip('/')
+        self.pool_size = int(pool_size)
+
+    def request(self, method, path, headers={}, **kwargs):
+        """
+        Sends one request to Cisco Spark
+
+        :param method: 'GET', 'POST', etc.
+        :type method: ``str``
+
+        :param path: the API resource, e.g., '/messages', or a full url
+        :type path: ``str``
+
+        :param headers: additional headers, e.g., for the content type
+        :type headers: ``dict``
+
+        :return: the response from Cisco Spark
+        :rtype: ``requests.Response``
+
+        Other parameters, e.g., `params` or `data`, are passed to `requests`.
+        """
+
+        if self.headers is None:
+            self.configure()
+
+        if path.startswith('http'):
+            url = path
+        else:
+            url = self.url+path
+
+        if headers:
+            merged = dict(self.headers)
+            merged.update(headers)
+        else:
+            merged = self.headers
+
+        session = get_session(self.pool_size)
+        return session.request(method,
+                               url,
+                               headers=merged,
+                               timeout=self.timeout,
+                               **kwargs)
+
+    def get(self, path, **kwargs):
+        """
+        Gets some resource from Cisco Spark
+        """
+
+        return self.request('GET', path, **kwargs)
+
+    def post(self, path, **kwargs):
+        """
+        Posts some data to Cisco Spark
+        """
+
+        return self.request('POST', path, **kwargs)
+
+    def delete(self, path, **kwargs):
+        """
+        Deletes some resource from Cisco Spark
+        """
+
+        return self.request('DELETE', path, **kwargs)
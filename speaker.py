@@ -14,7 +14,6 @@
 # limitations under the License.
 
 import logging
-from Queue import Empty
 import random
 import time
 
@@ -34,15 +33,13 @@ class Speaker(object):
         self.context = context
 
         self.context.set('speaker.counter', 0)
+        self.context.wake_up(self.outbox)
         while self.context.get('general.switch', 'on') == 'on':
-            try:
-                item = self.outbox.get(True, 0.1)
-                if isinstance(item, Exception):
-                    break
-                counter = self.context.increment('speaker.counter')
-                self.process(item, counter)
-            except Empty:
-                pass
+            item = self.outbox.get()
+            if isinstance(item, Exception):
+                break
+            counter = self.context.increment('speaker.counter')
+            self.process(item, counter)
 
     def process(self, item, counter):
         """
@@ -0,0 +1,184 @@
+#!/usr/bin/env python
+"""
+Measures the catalog of fittings plans on a large generated catalog
+
+Example::
+
+    python test/bench_catalog.py --categories 20 --templates 100
+
+"""
+
+import argparse
+import os
+import shutil
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+
+from catalog import Catalog
+
+
+def generate(root, categories=20, templates=100, plan=None):
+    """
+    Writes fittings plans in a directory
+
+    :param root: the directory of the catalog
+    :type root: ``str``
+
+    :param categories: the number of categories
+    :type categories: ``int``
+
+    :param templates: the number of templates per category
+    :type templates: ``int``
+
+    :param plan: the content of each `fittings.yaml`, or None to describe
+        templates with words of a vocabulary of 1000 words
+    :type plan: ``str``
+
+    :return: names of templates
+    :rtype: ``list`` of ``str``
+    """
+
+    names = []
+    for category in range(categories):
+        for template in range(templates):
+            name = 'category{}/template{}'.format(category, template)
+            path = os.path.join(root, name)
+            os.makedirs(path)
+
+            content = plan
+            if content is None:
+                index = templates * category + template
+                content = 'information:\n  - "{}"\n'.format(' '.join(
+                    'word{}'.format((index * 7 + step * 131) % 1000)
+                    for step in range(5)))
+
+            with open(os.path.join(path, 'fittings.yaml'), 'w') as handle:
+                handle.write(content)
+            names.append(name)
+
+    return names
+
+
+def measure_index(root, category='category7'):
+    """
+    Indexes a catalog, then lists templates of one category
+
+    :return: seconds to index, and seconds per listing after that
+    :rtype: ``tuple``
+    """
+
+    catalog = Catalog(root, interval=0.0)
+    start = time.time()
+    catalog.refresh()
+    cold = time.time() - start
+
+    # stamps are trusted after one second
+    #
+    time.sleep(1.1)
+    catalog.refresh()
+
+    start = time.time()
+    for index in range(100):
+        catalog.list_templates(category)
+    warm = (time.time() - start) / 100
+
+    return (cold, warm)
+
+
+def measure_headers(root, names):
+    """
+    Reads headers of all templates, twice
+
+    :return: seconds per header on first read, and after that
+    :rtype: ``tuple``
+    """
+
+    catalog = Catalog(root)
+    catalog.refresh()
+
+    start = time.time()
+    for name in names:
+        catalog.get_header(name)
+    cold = (time.time() - start) / len(names)
+
+    start = time.time()
+    for name in names:
+        catalog.get_header(name)
+    warm = (time.time() - start) / len(names)
+
+    return (cold, warm)
+
+
+def measure_search(root, terms='word42 word314'):
+    """
+    Indexes words of all templates, then searches some of them
+
+    :return: seconds to index, and seconds per search after that
+    :rtype: ``tuple``
+    """
+
+    catalog = Catalog(root)
+    start = time.time()
+    catalog.search(terms)
+    cold = time.time() - start
+
+    start = time.time()
+    for index in range(100):
+        catalog.search(terms)
+    warm = (time.time() - start) / 100
+
+    return (cold, warm)
+
+
+if __name__ == "__main__":
+
+    parser = argparse.ArgumentParser(description=__doc__.split('\n')[1])
+    parser.add_argument('--categories', type=int, default=20)
+    parser.add_argument('--templates', type=int, default=100)
+    parser.add_argument('--search', type=int, default=10000,
+                        help='the number of templates to search')
+    parser.add_argument('--plan',
+                        default=os.path.join(os.path.dirname(__file__),
+                                             'category1',
+                                             'fittings1',
+                                             'fittings.yaml'))
+    arguments = parser.parse_args()
+
+    root = tempfile.mkdtemp()
+    try:
+        names = generate(root, arguments.categories, arguments.templates)
+
+        (cold, warm) = measure_index(root)
+        print('Catalog: {:.1f} ms to index {} templates, {:.2f} ms per '
+              'listing after that'.format(1000 * cold, len(names), 1000 * warm))
+
+    finally:
+        shutil.rmtree(root)
+
+    with open(arguments.plan) as handle:
+        plan = handle.read()
+
+    root = tempfile.mkdtemp()
+    try:
+        names = generate(root, arguments.categories, arguments.templates, plan)
+
+        (cold, warm) = measure_headers(root, names)
+        print('Headers: {:.2f} ms cold, {:.3f} ms warm, over {} '
+              'templates'.format(1000 * cold, 1000 * warm, len(names)))
+
+    finally:
+        shutil.rmtree(root)
+
+    root = tempfile.mkdtemp()
+    try:
+        names = generate(root, 100, arguments.search // 100)
+
+        (cold, warm) = measure_search(root)
+        print('Search: {:.1f} s to index {} templates, {:.3f} ms per search '
+              'after that'.format(cold, len(names), 1000 * warm))
+
+    finally:
+        shutil.rmtree(root)
@@ -0,0 +1,78 @@
+#!/usr/bin/env python
+"""
+Measures the throughput of the Fetcher, with one worker or several workers
+
+Example::
+
+    python test/bench_fetcher.py --count 20 --workers 4
+
+"""
+
+import argparse
+from Queue import Queue
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+
+from context import Context
+from fetcher import Fetcher
+from test.mock_spark import MockSpark
+
+
+def fetch(spark, count=20, workers=4):
+    """
+    Gets messages from a mock server
+
+    :param spark: the mock of Cisco Spark
+    :type spark: ``MockSpark``
+
+    :param count: the number of messages
+    :type count: ``int``
+
+    :param workers: the number of threads of the Fetcher
+    :type workers: ``int``
+
+    :return: messages fetched per second
+    :rtype: ``float``
+    """
+
+    for index in range(count):
+        spark.inbound[str(index)] = {'id': str(index),
+                                     'personId': 'matt',
+                                     'roomId': 'room',
+                                     'text': '/plumby {}'.format(index)}
+
+    ids = Queue()
+    for index in range(count):
+        ids.put(str(index))
+    ids.put(Exception('EOQ'))
+
+    context = Context()
+    context.set('spark.url', spark.url)
+    context.set('fetcher.workers', workers)
+
+    start = time.time()
+    Fetcher(ids, Queue()).work(context)
+    return count / (time.time() - start)
+
+
+if __name__ == "__main__":
+
+    parser = argparse.ArgumentParser(description=__doc__.split('\n')[1])
+    parser.add_argument('--count', type=int, default=20)
+    parser.add_argument('--workers', type=int, default=4)
+    parser.add_argument('--delay', type=float, default=0.05)
+    arguments = parser.parse_args()
+
+    spark = MockSpark(delay=arguments.delay)
+    spark.start()
+    try:
+        sequential = fetch(spark, arguments.count, 1)
+        concurrent = fetch(spark, arguments.count, arguments.workers)
+    finally:
+        spark.stop()
+
+    print('Fetcher: {:.0f} msg/s with 1 worker, {:.0f} msg/s with {} '
+          'workers'.format(sequential, concurrent, arguments.workers))
@@ -0,0 +1,80 @@
+#!/usr/bin/env python
+"""
+Measures the CPU used by idle stages, and the time they take to stop
+
+Example::
+
+    python test/bench_idle.py --duration 2.0
+
+"""
+
+import argparse
+from multiprocessing import Process, Queue
+import os
+import resource
+import sys
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+
+from context import Context
+from listener import Listener
+from sender import Sender
+from shell import Shell
+from speaker import Speaker
+from worker import Worker
+
+
+def measure(duration=2.0):
+    """
+    Runs idle stages in processes, then stops them
+
+    :param duration: the number of seconds of idle time
+    :type duration: ``float``
+
+    :return: CPU seconds per second of idle time, and seconds to stop
+    :rtype: ``tuple``
+    """
+
+    context = Context()
+
+    ears = Queue()
+    inbox = Queue()
+    outbox = Queue()
+    mouth = Queue()
+
+    shell = Shell(context, inbox, mouth)
+    listener = Listener(ears, shell)
+    worker = Worker(inbox, outbox)
+    speaker = Speaker(outbox, mouth)
+    sender = Sender(mouth)
+
+    processes = []
+    for target in (sender.work, speaker.work, worker.work, listener.work):
+        process = Process(target=target, args=(context,))
+        process.daemon = True
+        process.start()
+        processes.append(process)
+
+    time.sleep(duration)
+
+    start = time.time()
+    context.set('general.switch', 'off')
+    for process in processes:
+        process.join()
+    stop = time.time() - start
+
+    usage = resource.getrusage(resource.RUSAGE_CHILDREN)
+    return ((usage.ru_utime + usage.ru_stime) / duration, stop)
+
+
+if __name__ == "__main__":
+
+    parser = argparse.ArgumentParser(description=__doc__.split('\n')[1])
+    parser.add_argument('--duration', type=float, default=2.0)
+    arguments = parser.parse_args()
+
+    (cpu, stop) = measure(arguments.duration)
+
+    print('Idle: {:.1f} ms of CPU per second for 4 stages, stopped in '
+          '{:.3f} s'.format(1000 * cpu, stop))
@@ -0,0 +1,137 @@
+#!/usr/bin/env python
+"""
+Measures the throughput of the Sender, with one lane or several lanes
+
+Example::
+
+    python test/bench_sender.py --rooms 4 --count 10 --workers 4 --upload 8
+
+"""
+
+import argparse
+from multiprocessing import Queue
+import os
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+
+from context import Context
+from sender import Sender
+from test.mock_spark import MockSpark
+
+
+def send(spark, rooms=4, count=10, workers=1):
+    """
+    Posts messages to several rooms of a mock server
+
+    :param spark: the mock of Cisco Spark
+    :type spark: ``MockSpark``
+
+    :param rooms: the number of rooms
+    :type rooms: ``int``
+
+    :param count: the number of messages per room
+    :type count: ``int``
+
+    :param workers: the number of lanes of the Sender
+    :type workers: ``int``
+
+    :return: messages posted per second
+    :rtype: ``float``
+    """
+
+    mouth = Queue()
+    for index in range(count):
+        for room in range(rooms):
+            mouth.put({'message': str(index), 'room': 'room{}'.format(room)})
+    mouth.put(Exception('EOQ'))
+
+    context = Context()
+    context.set('spark.url', spark.url)
+    context.set('spark.room_id', 'fake')
+    context.set('sender.rate', 0)
+    context.set('sender.workers', workers)
+
+    del spark.messages[:]
+    start = time.time()
+    Sender(mouth).work(context)
+    return len(spark.messages) / (time.time() - start)
+
+
+def upload(spark, size=8, count=5):
+    """
+    Posts a large file several times to a mock server
+
+    :param spark: the mock of Cisco Spark
+    :type spark: ``MockSpark``
+
+    :param size: the size of the file, in MB
+    :type size: ``int``
+
+    :param count: the number of uploads
+    :type count: ``int``
+
+    :return: MB uploaded per second
+    :rtype: ``float``
+    """
+
+    handle, path = tempfile.mkstemp(suffix='.log')
+    os.write(handle, os.urandom(1024) * 1024 * size)
+    os.close(handle)
+
+    try:
+        mouth = Queue()
+        mouth.put(Exception('EOQ'))
+
+        context = Context()
+        context.set('spark.url', spark.url)
+        context.set('spark.room_id', 'fake')
+        context.set('sender.rate', 0)
+
+        sender = Sender(mouth)
+        sender.work(context)
+
+        update = sender.build_update({'file': path, 'label': 'big.log'}, 1)
+        start = time.time()
+        for index in range(count):
+            sender.post_update(dict(update))
+        return size * count / (time.time() - start)
+
+    finally:
+        os.remove(path)
+
+
+if __name__ == "__main__":
+
+    parser = argparse.ArgumentParser(description=__doc__.split('\n')[1])
+    parser.add_argument('--rooms', type=int, default=4)
+    parser.add_argument('--count', type=int, default=10)
+    parser.add_argument('--workers', type=int, default=4)
+    parser.add_argument('--delay', type=float, default=0.02)
+    parser.add_argument('--upload', type=int, default=8,
+                        help='the size of the uploaded file, in MB')
+    arguments = parser.parse_args()
+
+    spark = MockSpark(delay=arguments.delay)
+    spark.start()
+    try:
+        sequential = send(spark, arguments.rooms, arguments.count, 1)
+        concurrent = send(spark, arguments.rooms, arguments.count,
+                          arguments.workers)
+    finally:
+        spark.stop()
+
+    print('Sender: {:.0f} msg/s with 1 worker, {:.0f} msg/s with {} '
+          'workers'.format(sequential, concurrent, arguments.workers))
+
+    spark = MockSpark()
+    spark.start()
+    try:
+        throughput = upload(spark, arguments.upload)
+    finally:
+        spark.stop()
+
+    print('Files: {:.0f} MB/s, uploading 5 x {} MB'.format(
+        throughput, arguments.upload))
@@ -0,0 +1,80 @@
+#!/usr/bin/env python
+"""
+Compares a volatile queue with a durable queue, with and without batches
+
+Example::
+
+    python test/bench_spool.py --count 2000
+
+"""
+
+import argparse
+import os
+from Queue import Queue
+import shutil
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+
+from queues import Spool, SpooledQueue
+
+
+def measure(queue, count=2000):
+    """
+    Puts items in a queue, then gets them back
+
+    :param queue: the queue to measure
+    :type queue: ``Queue`` or ``SpooledQueue``
+
+    :param count: the number of items
+    :type count: ``int``
+
+    :return: items per second
+    :rtype: ``float``
+    """
+
+    start = time.time()
+    for index in range(count):
+        queue.put(('deploy', str(index)))
+    for index in range(count):
+        queue.get()
+    return count / (time.time() - start)
+
+
+def measure_commits(spool, count=200):
+    """
+    Writes items to a spool with one commit per item
+
+    :return: items per second
+    :rtype: ``float``
+    """
+
+    start = time.time()
+    for index in range(count):
+        spool.commit('mouth', [('deploy', str(index))], [])
+    return count / (time.time() - start)
+
+
+if __name__ == "__main__":
+
+    parser = argparse.ArgumentParser(description=__doc__.split('\n')[1])
+    parser.add_argument('--count', type=int, default=2000)
+    arguments = parser.parse_args()
+
+    path = tempfile.mkdtemp()
+    try:
+        volatile = measure(Queue(), arguments.count)
+
+        spool = Spool(os.path.join(path, 'bench.spool'))
+        batched = measure(SpooledQueue(Queue(), spool, 'inbox'),
+                          arguments.count)
+        unbatched = measure_commits(spool, arguments.count // 10)
+
+    finally:
+        shutil.rmtree(path)
+
+    print('Spool: {:.0f} items/s in memory, {:.0f} items/s with batched '
+          'commits, {:.0f} items/s with one commit per item'.format(
+              volatile, batched, unbatched))
@@ -0,0 +1,127 @@
+#!/usr/bin/env python
+"""
+Fires concurrent webhook events at the bot, and reports latency
+
+Example::
+
+    python bot.py &
+    python test/load_webhook.py --url http://127.0.0.1:8080/ --count 2000
+
+"""
+
+import argparse
+import json
+import requests
+from threading import Lock, Thread
+import time
+
+
+def fire(url, count=1000, concurrency=20):
+    """
+    Posts webhook events from several threads
+
+    :param url: the address of the webhook endpoint
+    :type url: ``str``
+
+    :param count: the total number of events
+    :type count: ``int``
+
+    :param concurrency: the number of threads posting events
+    :type concurrency: ``int``
+
+    :return: latencies of successful requests in seconds, errors, duration
+    :rtype: ``tuple``
+    """
+
+    latencies = []
+    errors = [0]
+    lock = Lock()
+    numbers = iter(range(count))
+
+    def post():
+        session = requests.Session()
+        while True:
+            lock.acquire()
+            try:
+                number = next(numbers, None)
+            finally:
+                lock.release()
+            if number is None:
+                break
+
+            body = json.dumps({'data': {'id': 'load-{}'.format(number)}})
+            start = time.time()
+            try:
+                response = session.post(url,
+                                        data=body,
+                                        headers={'Content-Type':
+                                                 'application/json'},
+                                        timeout=10)
+                ok = response.status_code == 200
+            except requests.RequestException:
+                ok = False
+            latency = time.time() - start
+
+            lock.acquire()
+            try:
+                if ok:
+                    latencies.append(latency)
+                else:
+                    errors[0] += 1
+            finally:
+                lock.release()
+
+    start = time.time()
+    threads = [Thread(target=post) for index in range(concurrency)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    return (latencies, errors[0], time.time() - start)
+
+
+def percentile(values, ratio):
+    """
+    Computes some percentile of a list of values
+
+    :param values: the values
+    :type values: ``list``
+
+    :param ratio: e.g., 0.99 for p99
+    :type ratio: ``float``
+
+    """
+
+    if not values:
+        return 0.0
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(ratio * len(ordered)))]
+
+
+def report(latencies, errors, duration):
+    """
+    Summarizes a load test
+
+    :return: a line with request rate, p50 and p99 latencies
+    :rtype: ``str``
+    """
+
+    return ("{} requests, {} errors, {:.0f} req/s, "
+            "p50 {:.1f} ms, p99 {:.1f} ms").format(
+                len(latencies) + errors,
+                errors,
+                len(latencies) / duration if duration else 0.0,
+                1000 * percentile(latencies, 0.50),
+                1000 * percentile(latencies, 0.99))
+
+
+if __name__ == "__main__":
+
+    parser = argparse.ArgumentParser(description=__doc__.split('\n')[1])
+    parser.add_argument('--url', default='http://127.0.0.1:8080/')
+    parser.add_argument('--count', type=int, default=1000)
+    parser.add_argument('--concurrency', type=int, default=20)
+    arguments = parser.parse_args()
+
+    print(report(*fire(arguments.url, arguments.count, arguments.concurrency)))
@@ -0,0 +1,152 @@
+#!/usr/bin/env python
+
+import BaseHTTPServer
+import cgi
+import json
+import SocketServer
+from threading import Lock, Thread
+import time
+import urlparse
+
+
+class MockServer(SocketServer.ThreadingMixIn, BaseHTTPServer.HTTPServer):
+
+    daemon_threads = True
+
+
+class MockSpark(object):
+    """
+    Serves a minimal Cisco Spark API on localhost, for tests and benchmarks
+
+    :param delay: seconds spent on each request, to mimic network latency
+    :type delay: ``float``
+
+    Messages posted to `/messages` are recorded in `self.messages`, in the
+    order of their arrival. Messages in `self.inbound`, keyed by id, are
+    served on `/messages/<id>`. Messages in `self.room`, oldest first, are
+    listed on `/messages`, newest first, with `max` and `beforeMessage`.
+
+    The highest number of GET requests served at the same time is kept in
+    `self.peak`.
+    """
+
+    def __init__(self, delay=0.0):
+        self.delay = delay
+        self.messages = []
+        self.inbound = {}
+        self.room = []
+        self.lock = Lock()
+        self.active = 0
+        self.peak = 0
+
+        spark = self
+
+        class Handler(BaseHTTPServer.BaseHTTPRequestHandler):
+
+            protocol_version = 'HTTP/1.1'
+            disable_nagle_algorithm = True
+            wbufsize = -1
+
+            def log_message(self, format, *args):
+                pass
+
+            def respond(self, status, body):
+                content = json.dumps(body)
+                self.send_response(status)
+                self.send_header('Content-Type', 'application/json')
+                self.send_header('Content-Length', str(len(content)))
+                self.end_headers()
+                self.wfile.write(content)
+
+            def do_GET(self):
+                url = urlparse.urlparse(self.path)
+                path = url.path
+
+                spark.lock.acquire()
+                try:
+                    spark.active += 1
+                    spark.peak = max(spark.peak, spark.active)
+                finally:
+                    spark.lock.release()
+
+                try:
+                    time.sleep(spark.delay)
+                finally:
+                    spark.lock.acquire()
+                    try:
+                        spark.active -= 1
+                    finally:
+                        spark.lock.release()
+
+                if path == '/messages':
+                    query = urlparse.parse_qs(url.query)
+                    items = list(reversed(spark.room))
+                    if 'beforeMessage' in query:
+                        ids = [item['id'] for item in items]
+                        index = ids.index(query['beforeMessage'][0])
+                        items = items[index+1:]
+                    items = items[:int(query.get('max', ['50'])[0])]
+                    self.respond(200, {'items': items})
+                    return
+
+                if path.startswith('/messages/'):
+                    message = spark.inbound.get(path[len('/messages/'):])
+                    if message is not None:
+                        self.respond(200, message)
+                        return
+
+                self.respond(404, {'message': 'not found'})
+
+            def do_POST(self):
+                path = urlparse.urlparse(self.path).path
+                if path != '/messages':
+                    self.respond(404, {'message': 'not found'})
+                    return
+
+                content_type = self.headers.get('Content-Type', '')
+                if content_type.startswith('multipart/'):
+                    form = cgi.FieldStorage(
+                        fp=self.rfile,
+                        headers=self.headers,
+                        environ={'REQUEST_METHOD': 'POST',
+                                 'CONTENT_TYPE': content_type})
+                    fields = {}
+                    for key in form.keys():
+                        if form[key].filename:
+                            fields[key] = len(form[key].value)
+                        else:
+                            fields[key] = form[key].value
+                else:
+                    length = int(self.headers.get('Content-Length', 0))
+                    body = urlparse.parse_qs(self.rfile.read(length))
+                    fields = dict([(key, body[key][0]) for key in body])
+
+                time.sleep(spark.delay)
+
+                spark.lock.acquire()
+                try:
+                    spark.messages.append(fields)
+                finally:
+                    spark.lock.release()
+
+                self.respond(200, {'id': str(len(spark.messages))})
+
+        self.server = MockServer(('127.0.0.1', 0), Handler)
+        self.url = 'http://127.0.0.1:{}'.format(self.server.server_address[1])
+
+    def start(self):
+        """
+        Serves requests in the background
+        """
+
+        thread = Thread(target=self.server.serve_forever)
+        thread.daemon = True
+        thread.start()
+
+    def stop(self):
+        """
+        Stops serving requests
+        """
+
+        self.server.shutdown()
+        self.server.server_close()
@@ -0,0 +1,8 @@
+"""
+A plugin command used in tests of the registry
+"""
+
+
+def do_hello(shell, arguments=None):
+    with shell.reply() as reply:
+        reply.add("Hello {}".format(arguments or 'world'))
@@ -0,0 +1,201 @@
+#!/usr/bin/env python
+
+import unittest
+import logging
+import os
+import shutil
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.abspath('..'))
+
+from catalog import Catalog
+
+
+def add_template(root, name, plan=None):
+    path = os.path.join(root, name)
+    os.makedirs(path)
+    with open(os.path.join(path, 'fittings.yaml'), 'w') as handle:
+        if plan is None:
+            plan = '---\n\ninformation:\n  - "{}"\n'.format(name)
+        handle.write(plan)
+
+
+class CatalogTests(unittest.TestCase):
+
+    def test_index(self):
+
+        logging.debug('*** Index test ***')
+
+        catalog = Catalog(os.path.dirname(os.path.realpath(__file__)))
+        self.assertEqual(catalog.list_categories(),
+                         ['category1', 'category2', 'category3_is_empty'])
+        self.assertEqual(catalog.list_templates('category1'),
+                         ['fittings1', 'fittings2'])
+        self.assertEqual(catalog.list_templates('category3_is_empty'), [])
+        self.assertEqual(catalog.list_templates('*unknown*'), None)
+        self.assertTrue(catalog.get_path('category2/fittings1')
+                        .endswith(os.path.join('category2',
+                                               'fittings1',
+                                               'fittings.yaml')))
+        self.assertEqual(catalog.get_path('category2/unknown'), None)
+        self.assertEqual(catalog.get_path('category2'), None)
+
+        catalog = Catalog('./perfectly_unknown_path')
+        self.assertFalse(catalog.refresh())
+        self.assertEqual(catalog.list_categories(), [])
+
+    def test_refresh(self):
+
+        logging.debug('*** Refresh test ***')
+
+        root = tempfile.mkdtemp()
+        try:
+            add_template(root, 'analytics/hadoop')
+            catalog = Catalog(root, interval=0.0)
+            self.assertEqual(catalog.list_categories(), ['analytics'])
+
+            # stamps older than one second are trusted
+            #
+            time.sleep(1.1)
+            catalog.refresh()
+            calls = []
+            catalog.scan = lambda path: calls.append(path) or {}
+            catalog.refresh()
+            self.assertEqual(calls, [])
+            del catalog.scan
+
+            # only the modified category is listed again
+            #
+            add_template(root, 'web/wordpress')
+            add_template(root, 'analytics/spark')
+            self.assertEqual(catalog.list_categories(), ['analytics', 'web'])
+            self.assertEqual(catalog.list_templates('analytics'),
+                             ['hadoop', 'spark'])
+
+            shutil.rmtree(os.path.join(root, 'web'))
+            self.assertEqual(catalog.list_categories(), ['analytics'])
+            self.assertEqual(catalog.get_path('web/wordpress'), None)
+
+            # no check of the file system within the interval
+            #
+            catalog.interval = 60.0
+            add_template(root, 'web/drupal')
+            self.assertEqual(catalog.list_categories(), ['analytics'])
+            catalog.refresh(force=True)
+            self.assertEqual(catalog.list_categories(), ['analytics', 'web'])
+
+        finally:
+            shutil.rmtree(root)
+
+    def test_header(self):
+
+        logging.debug('*** Header test ***')
+
+        catalog = Catalog(os.path.dirname(os.path.realpath(__file__)))
+        header = catalog.get_header('category1/fittings1')
+        self.assertEqual(header['information'],
+                         ["Hadoop cluster with 1 master and 6 nodes"])
+        self.assertEqual(header['parameters']['locationId']['default'], 'EU6')
+        self.assertFalse('blueprints' in header)
+        self.assertEqual(catalog.get_header('category1/fittings2'), {})
+        self.assertEqual(catalog.get_header('category1/unknown'), None)
+
+        root = tempfile.mkdtemp()
+        try:
+            add_template(root, 'web/wordpress',
+                         'information:\n  - "first"\n---\nblueprints:\n')
+            catalog = Catalog(root)
+            self.assertEqual(catalog.get_header('web/wordpress'),
+                             {'information': ['first']})
+
+            # no parsing as long as the file is not modified
+            #
+            calls = []
+            parse = catalog.parse
+            catalog.parse = lambda plan: calls.append(plan) or parse(plan)
+            catalog.get_header('web/wordpress')
+            self.assertEqual(calls, [])
+
+            f_path = os.path.join(root, 'web', 'wordpress', 'fittings.yaml')
+            with open(f_path, 'w') as handle:
+                handle.write('information:\n  - "second"\n')
+            os.utime(f_path, (time.time() + 10, time.time() + 10))
+            self.assertEqual(catalog.get_header('web/wordpress'),
+                             {'information': ['second']})
+            self.assertEqual(len(calls), 1)
+
+        finally:
+            shutil.rmtree(root)
+
+    def test_search(self):
+
+        logging.debug('*** Search test ***')
+
+        root = tempfile.mkdtemp()
+        try:
+            add_template(root, 'analytics/hadoop-cluster',
+                         'information:\n  - "Hadoop cluster with 6 nodes"\n'
+                         'parameters:\n  cpuPerNode:\n    default: 4\n')
+            add_template(root, 'analytics/spark',
+                         'information:\n  - "Spark on top of a Hadoop cluster"\n')
+            add_template(root, 'web/wordpress',
+                         'information:\n  - "Blog engine"\n')
+
+            catalog = Catalog(root, interval=0.0)
+            self.assertEqual(catalog.search('hadoop'),
+                             ['analytics/hadoop-cluster', 'analytics/spark'])
+            self.assertEqual(catalog.search('spark hadoop'),
+                             ['analytics/spark', 'analytics/hadoop-cluster'])
+            self.assertEqual(catalog.search('Node'),
+                             ['analytics/hadoop-cluster'])
+            self.assertEqual(catalog.search('cpuPerNode'),
+                             ['analytics/hadoop-cluster'])
+            self.assertEqual(catalog.search('WEB'), ['web/wordpress'])
+            self.assertEqual(catalog.search('unknown'), [])
+            self.assertEqual(catalog.search(''), [])
+            self.assertEqual(len(catalog.search('hadoop', limit=1)), 1)
+
+            # the index follows changes of categories
+            #
+            add_template(root, 'web/hadoop-dashboard')
+            shutil.rmtree(os.path.join(root, 'analytics', 'spark'))
+            self.assertEqual(catalog.search('hadoop'),
+                             ['analytics/hadoop-cluster', 'web/hadoop-dashboard'])
+
+            shutil.rmtree(os.path.join(root, 'analytics'))
+            self.assertEqual(catalog.search('hadoop'), ['web/hadoop-dashboard'])
+            self.assertEqual(catalog.search('cpuPerNode'), [])
+
+        finally:
+            shutil.rmtree(root)
+
+    def test_search_errors(self):
+
+        logging.debug('*** Search errors test ***')
+
+        root = tempfile.mkdtemp()
+        try:
+            add_template(root, 'web/deploiement',
+                         'information:\n  - "D\xc3\xa9ploiement rapide"\n'
+                         'parameters:\n  cpu:\n    default: 2\n')
+            add_template(root, 'web/broken',
+                         'information: [unclosed\nparameters:\n  cpu: {\n')
+            add_template(root, 'web/scalar', 'just some text\nand more\n')
+
+            catalog = Catalog(root, interval=0.0)
+            self.assertEqual(catalog.search('cpu'), ['web/deploiement'])
+            self.assertEqual(catalog.search('d\xc3\xa9ploiement'), ['web/deploiement'])
+            self.assertEqual(catalog.search(u'D\xe9ploiement rapide'), ['web/deploiement'])
+            self.assertEqual(catalog.search('broken'), ['web/broken'])
+            self.assertEqual(catalog.get_header('web/broken'), {})
+            self.assertEqual(catalog.get_header('web/scalar'), {})
+
+        finally:
+            shutil.rmtree(root)
+
+
+if __name__ == '__main__':
+    logging.getLogger('').setLevel(logging.DEBUG)
+    sys.exit(unittest.main())
@@ -5,13 +5,15 @@ import logging
 from mock import MagicMock
 import os
 from multiprocessing import Process, Queue
+from Queue import Queue as ThreadQueue
 import random
 import sys
+from threading import Event, Thread
 import time
 
 sys.path.insert(0, os.path.abspath('..'))
 
-from context import Context
+from context import Context, LocalContext
 from listener import Listener
 from shell import Shell
 from worker import Worker
@@ -64,6 +66,111 @@ class CompositeTests(unittest.TestCase):
         self.assertEqual(context.get('speaker.counter', 0), 0)
         self.assertEqual(context.get('sender.counter', 0), 0)
 
+    def test_idle(self):
+
+        logging.debug('*** Idle test ***')
+
+        class WatchedQueue(ThreadQueue):
+
+            def __init__(self):
+                ThreadQueue.__init__(self)
+                self.calls = []
+                self.items = []
+                self.waiting = Event()
+
+            def get(self, block=True, timeout=None):
+                self.calls.append((block, timeout))
+                self.waiting.set()
+                item = ThreadQueue.get(self, block, timeout)
+                self.items.append(item)
+                return item
+
+        context = LocalContext()
+
+        ears = WatchedQueue()
+        inbox = WatchedQueue()
+        outbox = WatchedQueue()
+        mouth = WatchedQueue()
+
+        shell = Shell(context, inbox, mouth)
+        listener = Listener(ears, shell)
+        worker = Worker(inbox, outbox)
+        speaker = Speaker(outbox, mouth)
+        sender = Sender(mouth)
+
+        threads = []
+        for target in (sender.work, speaker.work, worker.work, listener.work):
+            thread = Thread(target=target, args=(context,))
+            thread.daemon = True
+            thread.start()
+            threads.append(thread)
+
+        # every stage is blocked on its queue
+        #
+        queues = (ears, inbox, outbox, mouth)
+        for queue in queues:
+            self.assertTrue(queue.waiting.wait(10.0))
+
+        logging.debug('Stopping all threads')
+        context.set('general.switch', 'off')
+        for thread in threads:
+            thread.join(10.0)
+            self.assertFalse(thread.is_alive())
+
+        # stages waited without timeout, and stopped on the event
+        #
+        self.assertTrue(context.stopped.is_set())
+        for queue in queues:
+            self.assertEqual(set(queue.calls), set([(True, None)]))
+            self.assertEqual(len(queue.items), 1)
+            self.assertEqual(str(queue.items[0]), 'STOP')
+
+    def test_latency(self):
+
+        logging.debug('*** Latency test ***')
+
+        command = {
+              "id" : "1_lzY29zcGFyazovL3VzL01FU1NBR0UvOTJkYjNiZTAtNDNiZC0xMWU2LThhZTktZGQ1YjNkZmM1NjVk",
+              "text" : "/plumby version",
+              "personId" : "Y2lzY29zcGFyazovL3VzL1BFT1BMRS9mNWIzNjE4Ny1jOGRkLTQ3MjctOGIyZi1mOWM0NDdmMjkwNDY",
+            }
+
+        runtimes = (
+            ('processes', Context, Queue, Process),
+            ('threads', LocalContext, ThreadQueue, Thread),
+        )
+
+        for label, backend, queue, runner in runtimes:
+
+            context = backend()
+            ears = queue()
+            inbox = queue()
+            mouth = queue()
+
+            shell = Shell(context, inbox, mouth)
+            listener = Listener(ears, shell)
+
+            listener_unit = runner(target=listener.work, args=(context,))
+            listener_unit.daemon = True
+            listener_unit.start()
+
+            durations = []
+            for i in range(20):
+                start = time.time()
+                ears.put(command)
+                mouth.get()
+                durations.append(time.time() - start)
+
+            context.set('general.switch', 'off')
+            listener_unit.join()
+
+            durations.sort()
+            logging.debug('Median latency with %s: %.3f ms',
+                          label,
+                          1000.0 * durations[len(durations) // 2])
+
+            self.assertEqual(context.get('listener.counter'), 20)
+
     def test_dynamic(self):
 
         logging.debug('*** Dynamic test ***')
@@ -4,18 +4,23 @@ import unittest
 import logging
 import os
 import sys
+from multiprocessing import Process
+from threading import Thread
 sys.path.insert(0, os.path.abspath('..'))
 
-from context import Context
+from context import Context, LocalContext, SharedContext
 
 
 class ContextTests(unittest.TestCase):
 
+    backend = Context
+    runner = Process
+
     def test_apply(self):
 
         logging.debug('*** Apply test ***')
 
-        context = Context()
+        context = self.backend()
 
         self.assertEqual(context.get('general.port'), None)
 
@@ -36,7 +41,7 @@ class ContextTests(unittest.TestCase):
 
         logging.debug('*** Store test ***')
 
-        context = Context()
+        context = self.backend()
 
         # undefined key
         self.assertEqual(context.get('hello'), None)
@@ -56,7 +61,7 @@ class ContextTests(unittest.TestCase):
 
         logging.debug('*** Gauge test ***')
 
-        context = Context()
+        context = self.backend()
 
         # undefined key
         self.assertEqual(context.get('gauge'), None)
@@ -84,11 +89,123 @@ class ContextTests(unittest.TestCase):
         context.set('gauge', 123)
         self.assertEqual(context.get('gauge'), 123)
 
+    def test_cache(self):
+
+        logging.debug('*** Cache test ***')
+
+        def worker(context):
+            context.set('spark.room_id', 'updated')
+
+        context = self.backend()
+
+        # uncached keys are always fetched from the store
+        self.assertFalse(context.is_cached('worker.counter'))
+        self.assertTrue(context.is_cached('spark.room_id'))
+
+        # missing keys are cached too
+        self.assertEqual(context.get('spark.room_id', 'nothing'), 'nothing')
+        context.set('spark.room_id', None)
+        self.assertEqual(context.get('spark.room_id', 'nothing'), None)
+
+        # read-through, then served locally
+        context.set('spark.room_id', 'initial')
+        self.assertEqual(context.get('spark.room_id'), 'initial')
+        values = context.values
+        context.values = None
+        self.assertEqual(context.get('spark.room_id'), 'initial')
+        context.values = values
+
+        # updates from other processes are seen
+        p = self.runner(target=worker, args=(context,))
+        p.start()
+        p.join()
+        self.assertEqual(context.get('spark.room_id'), 'updated')
+
+        # bulk updates are seen as well
+        context.apply({'spark': {'room_id': 'applied'}})
+        self.assertEqual(context.get('spark.room_id'), 'applied')
+
+    def test_batch(self):
+
+        logging.debug('*** Batch test ***')
+
+        context = self.backend()
+
+        context.set_many({'spark.room_id': '123',
+                          'worker.busy': True,
+                          'hello': 'world'})
+
+        self.assertEqual(context.get_many(('hello', 'spark.room_id')),
+                         ['world', '123'])
+        self.assertEqual(context.get_many(('worker.busy', 'unknown')),
+                         [True, None])
+        self.assertEqual(context.get_many(('unknown', 'hello'),
+                                          {'unknown': 'default'}),
+                         ['default', 'world'])
+
+        # compare-and-set
+        self.assertFalse(context.compare_and_set('hello', 'universe', '*'))
+        self.assertEqual(context.get('hello'), 'world')
+        self.assertTrue(context.compare_and_set('hello', 'world', 'universe'))
+        self.assertEqual(context.get('hello'), 'universe')
+        self.assertTrue(context.compare_and_set('spark.room_id', '123', '456'))
+        self.assertEqual(context.get('spark.room_id'), '456')
+        self.assertTrue(context.compare_and_set('worker.busy', True, False))
+        self.assertEqual(context.get('worker.busy'), False)
+        self.assertTrue(context.compare_and_set('missing', None, 1))
+        self.assertEqual(context.get('missing'), 1)
+
+        # update with a function
+        self.assertEqual(context.update('list', lambda x: x+['a'], []), ['a'])
+        self.assertEqual(context.update('list', lambda x: x+['b'], []),
+                         ['a', 'b'])
+        self.assertEqual(context.get('list'), ['a', 'b'])
+
+    def test_atomic_update(self):
+
+        logging.debug('*** Atomic update test ***')
+
+        def worker(id, context):
+            for i in range(20):
+                context.update('items', lambda x: x+[id], [])
+
+        context = self.backend()
+
+        workers = []
+        for i in range(4):
+            p = self.runner(target=worker, args=(i, context,))
+            p.start()
+            workers.append(p)
+
+        for p in workers:
+            p.join()
+
+        self.assertEqual(sorted(context.get('items')),
+                         sorted(list(range(4)) * 20))
+
+    def test_stop(self):
+
+        logging.debug('*** Stop test ***')
+
+        from multiprocessing import Queue
+
+        context = self.backend()
+        self.assertFalse(context.stopped.is_set())
+
+        queue = Queue()
+        context.wake_up(queue)
+
+        context.set('general.switch', 'off')
+        self.assertTrue(context.stopped.is_set())
+        self.assertTrue(isinstance(queue.get(True, 1.0), Exception))
+
+        context.apply({'switch': 'on'})
+        self.assertFalse(context.stopped.is_set())
+
     def test_concurrency(self):
 
         logging.debug('*** Concurrency test ***')
 
-        from multiprocessing import Process
         import random
         import time
 
@@ -101,12 +218,12 @@ class ContextTests(unittest.TestCase):
             logging.debug('worker %d:done', id)
 
         logging.debug('Creating a counter')
-        self.counter = Context()
+        self.counter = self.backend()
 
         logging.debug('Launching incrementing workers')
         workers = []
         for i in range(4):
-            p = Process(target=worker, args=(i, self.counter,))
+            p = self.runner(target=worker, args=(i, self.counter,))
             p.start()
             workers.append(p)
 
@@ -117,6 +234,156 @@ class ContextTests(unittest.TestCase):
         logging.debug('Counter: %d', self.counter.get('gauge'))
         self.assertEqual(self.counter.get('gauge'), 16)
 
+    def test_benchmark(self):
+
+        logging.debug('*** Benchmark test ***')
+
+        import time
+
+        def worker(id, context, count):
+            key = ('listener', 'worker', 'speaker', 'sender')[id % 4]+'.counter'
+            for i in range(count):
+                context.get('general.switch', 'on')
+                context.increment(key)
+
+        for processes in (1, 4):
+
+            context = self.backend()
+            context.set('general.switch', 'on')
+
+            count = 500
+            workers = []
+            for i in range(processes):
+                p = self.runner(target=worker, args=(i, context, count))
+                workers.append(p)
+
+            start = time.time()
+            for p in workers:
+                p.start()
+            for p in workers:
+                p.join()
+            duration = time.time() - start
+
+            logging.debug('%s with %d processes: %d ops/sec',
+                          self.backend.__name__,
+                          processes,
+                          2 * processes * count / duration)
+
+            total = 0
+            for label in ('listener', 'worker', 'speaker', 'sender'):
+                total += context.get(label+'.counter', 0)
+            self.assertEqual(total, processes * count)
+
+    def test_contention(self):
+
+        logging.debug('*** Contention test ***')
+
+        import time
+
+        def worker(id, context, count):
+            key = ('listener', 'worker', 'speaker', 'sender')[id % 4]+'.counter'
+            for i in range(count):
+                context.increment(key)
+
+        for stripes in (1, self.backend.stripes):
+
+            backend = type('Striped', (self.backend,), {'stripes': stripes})
+
+            for processes in (4, 8):
+
+                context = backend()
+
+                count = 1000
+                workers = []
+                for i in range(processes):
+                    p = self.runner(target=worker, args=(i, context, count))
+                    workers.append(p)
+
+                start = time.time()
+                for p in workers:
+                    p.start()
+                for p in workers:
+                    p.join()
+                duration = time.time() - start
+
+                logging.debug('%s with %d locks and %d processes: %d ops/sec',
+                              self.backend.__name__,
+                              stripes,
+                              processes,
+                              processes * count / duration)
+
+                for label in ('listener', 'worker', 'speaker', 'sender'):
+                    self.assertEqual(context.get(label+'.counter', 0),
+                                     processes * count / 4)
+
+
+class SharedContextTests(ContextTests):
+
+    backend = SharedContext
+
+    def test_slots(self):
+
+        logging.debug('*** Slots test ***')
+
+        context = SharedContext()
+
+        # flags are kept in shared memory
+        self.assertEqual(context.get('general.switch', 'on'), 'on')
+        context.set('general.switch', 'off')
+        self.assertEqual(context.get('general.switch', 'on'), 'off')
+        self.assertEqual(context.states[context.slots['general.switch']],
+                         SharedContext.IN_SLOT)
+
+        context.set('worker.busy', True)
+        self.assertTrue(context.get('worker.busy') is True)
+        context.set('worker.busy', False)
+        self.assertTrue(context.get('worker.busy') is False)
+
+        # values that do not fit are sent to the Manager
+        context.set('worker.busy', 'maybe')
+        self.assertEqual(context.get('worker.busy'), 'maybe')
+        self.assertEqual(context.states[context.slots['worker.busy']],
+                         SharedContext.IN_STORE)
+
+        context.set('sender.counter', 'hello')
+        self.assertEqual(context.increment('sender.counter'), 1)
+        self.assertEqual(context.decrement('sender.counter', 3), -2)
+        self.assertEqual(context.get('sender.counter'), -2)
+
+        context.set('sender.counter', 2 ** 80)
+        self.assertEqual(context.get('sender.counter'), 2 ** 80)
+
+        # settings are dispatched as well
+        context.apply({'switch': 'on', 'spark': {'room': 'demo'}})
+        self.assertEqual(context.get('general.switch'), 'on')
+        self.assertEqual(context.get('spark.room'), 'demo')
+
+
+class LocalContextTests(ContextTests):
+
+    backend = LocalContext
+    runner = Thread
+
+    def test_cache(self):
+
+        logging.debug('*** Cache test ***')
+
+        context = LocalContext()
+
+        # nothing is cached, but values are seen across threads
+        self.assertFalse(context.is_cached('spark.room_id'))
+
+        def worker(context):
+            context.set('spark.room_id', 'updated')
+
+        context.set('spark.room_id', 'initial')
+        self.assertEqual(context.get('spark.room_id'), 'initial')
+
+        t = Thread(target=worker, args=(context,))
+        t.start()
+        t.join()
+        self.assertEqual(context.get('spark.room_id'), 'updated')
+
 
 if __name__ == '__main__':
     logging.getLogger('').setLevel(logging.DEBUG)
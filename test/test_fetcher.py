@@ -0,0 +1,200 @@
+#!/usr/bin/env python
+
+import unittest
+from io import BytesIO
+import json
+import logging
+import os
+from Queue import Queue
+import sys
+from threading import Thread
+import time
+
+from bottle import request
+
+sys.path.insert(0, os.path.abspath('..'))
+
+import bot
+from context import Context
+from fetcher import Fetcher, Puller
+from records import Message
+from test.mock_spark import MockSpark
+
+
+class FetcherTests(unittest.TestCase):
+
+    def test_fetch(self):
+
+        logging.debug('*** Fetch test ***')
+
+        spark = MockSpark(delay=0.05)
+        for index in range(20):
+            spark.inbound[str(index)] = {'id': str(index),
+                                         'personId': 'matt',
+                                         'roomId': 'room',
+                                         'text': '/plumby {}'.format(index)}
+        spark.start()
+        try:
+            ids = Queue()
+            for index in range(20):
+                ids.put(str(index))
+            ids.put('unknown')
+            ids.put(Exception('EOQ'))
+
+            ears = Queue()
+
+            context = Context()
+            context.set('spark.url', spark.url)
+            context.set('fetcher.workers', 4)
+
+            Fetcher(ids, ears).work(context)
+
+            # messages are fetched in parallel
+            self.assertTrue(spark.peak > 1)
+            self.assertTrue(spark.peak <= 4)
+            self.assertEqual(context.get('fetcher.counter'), 21)
+            self.assertEqual(context.get('fetcher.errors'), 1)
+
+            messages = []
+            while not ears.empty():
+                messages.append(ears.get())
+            self.assertEqual(sorted(messages),
+                             sorted([Message('matt', '/plumby {}'.format(index))
+                                     for index in range(20)]))
+
+        finally:
+            spark.stop()
+
+    def test_webhook(self):
+
+        logging.debug('*** Webhook test ***')
+
+        bot.context = Context()
+        bot.ids = Queue()
+        body = json.dumps({'data': {'id': '123'}})
+
+        start = time.time()
+        for index in range(100):
+            request.bind({'REQUEST_METHOD': 'POST',
+                          'CONTENT_TYPE': 'application/json',
+                          'CONTENT_LENGTH': str(len(body)),
+                          'wsgi.input': BytesIO(body)})
+            self.assertEqual(bot.push_from_spark(), "OK\n")
+        duration = time.time() - start
+        logging.info('Webhook: {:.3f} ms per event'.format(duration * 10))
+
+        self.assertEqual(bot.ids.qsize(), 100)
+        self.assertEqual(bot.ids.get(), '123')
+
+    def test_filter(self):
+
+        logging.debug('*** Filter test ***')
+
+        bot.context = Context()
+        bot.context.set('spark.bot_id', 'me')
+        bot.context.set('spark.room_id', 'room')
+        bot.ids = Queue()
+
+        for data in ({'id': '1', 'personId': 'me', 'roomId': 'room'},
+                     {'id': '2', 'personId': 'matt', 'roomId': 'other'},
+                     {'id': '3', 'personId': 'matt', 'roomId': 'room'},
+                     {'id': '4'}):
+            body = json.dumps({'data': data})
+            request.bind({'REQUEST_METHOD': 'POST',
+                          'CONTENT_TYPE': 'application/json',
+                          'CONTENT_LENGTH': str(len(body)),
+                          'wsgi.input': BytesIO(body)})
+            self.assertEqual(bot.push_from_spark(), "OK\n")
+
+        self.assertEqual(bot.context.get('webhook.skipped'), 2)
+        self.assertEqual(bot.ids.get(), '3')
+        self.assertEqual(bot.ids.get(), '4')
+        self.assertTrue(bot.ids.empty())
+
+    def test_pull(self):
+
+        logging.debug('*** Pull test ***')
+
+        numbers = iter(range(1000))
+
+        def post(count):
+            for index in range(count):
+                number = next(numbers)
+                spark.room.append({'id': str(number),
+                                   'personId': 'matt',
+                                   'text': 'message {}'.format(number),
+                                   'created': '2016-10-18T08:{:02d}:{:02d}.000Z'
+                                              .format(number // 60, number % 60)})
+
+        spark = MockSpark()
+        spark.start()
+        try:
+            ears = Queue()
+            context = Context()
+            context.set('spark.url', spark.url)
+            context.set('spark.room_id', 'room')
+
+            puller = Puller(ears)
+            puller.context = context
+            puller.client = bot.SparkClient(context, 'spark.CISCO_SPARK_TOKEN')
+            puller.room_id = 'room'
+            puller.page_size = 50
+
+            # an empty room, then a first message
+            self.assertEqual(puller.pull(), 0)
+            post(1)
+            self.assertEqual(puller.pull(), 1)
+            self.assertEqual(ears.get(), Message('matt', 'message 0'))
+
+            # a burst of messages between two polls
+            post(260)
+            requests = context.get('pull.requests')
+            self.assertEqual(puller.pull(), 260)
+            self.assertEqual(context.get('pull.requests') - requests, 6)
+            self.assertEqual([ears.get().text for index in range(260)],
+                             ['message {}'.format(index)
+                              for index in range(1, 261)])
+
+            # nothing new
+            self.assertEqual(puller.pull(), 0)
+            self.assertEqual(context.get('pull.messages'), 261)
+            self.assertEqual(context.get('pull.errors', 0), 0)
+
+            # the last message seen has been deleted
+            del spark.room[-1]
+            post(3)
+            requests = context.get('pull.requests')
+            self.assertEqual(puller.pull(), 3)
+            self.assertEqual(context.get('pull.requests') - requests, 1)
+            self.assertEqual([ears.get().text for index in range(3)],
+                             ['message 261', 'message 262', 'message 263'])
+
+            # without creation times, at most one page is listed
+            puller.last_id = 'deleted'
+            puller.last_created = None
+            self.assertEqual(puller.pull(), 50)
+            for index in range(50):
+                ears.get()
+
+            # previous messages are not processed on first poll
+            puller = Puller(ears)
+            context.set('pull.min_interval', 0.01)
+            context.set('pull.max_interval', 0.02)
+            worker = Thread(target=puller.work, args=(context,))
+            worker.start()
+            time.sleep(0.2)
+            post(3)
+            time.sleep(0.2)
+            context.set('general.switch', 'off')
+            worker.join()
+            self.assertEqual([ears.get().text for index in range(3)],
+                             ['message 264', 'message 265', 'message 266'])
+            self.assertTrue(ears.empty())
+
+        finally:
+            spark.stop()
+
+
+if __name__ == '__main__':
+    logging.getLogger('').setLevel(logging.DEBUG)
+    sys.exit(unittest.main())
@@ -13,6 +13,7 @@ sys.path.insert(0, os.path.abspath('..'))
 
 from context import Context
 from listener import Listener
+from records import Message
 from shell import Shell
 
 class ListenerTests(unittest.TestCase):
@@ -126,6 +127,32 @@ class ListenerTests(unittest.TestCase):
         with self.assertRaises(Exception):
             mouth.get_nowait()
 
+    def test_records(self):
+
+        logging.debug('*** Records test ***')
+
+        ears = Queue()
+        ears.put(Message('me', '/plumby deploy'))
+        ears.put(Message('you', None))
+        ears.put(Message('you', 'hello world'))
+        ears.put(Message('you', '@plumby deploy'))
+        ears.put(Exception('EOQ'))
+
+        inbox = Queue()
+        mouth = Queue()
+
+        context = Context()
+        context.set('spark.bot_id', 'me')
+        shell = Shell(context, inbox, mouth)
+        listener = Listener(ears, shell)
+
+        listener.work(context)
+
+        self.assertEqual(context.get('listener.counter'), 4)
+        self.assertEqual(inbox.get(), ('deploy', ''))
+        with self.assertRaises(Exception):
+            inbox.get_nowait()
+
 if __name__ == '__main__':
     logging.getLogger('').setLevel(logging.DEBUG)
     sys.exit(unittest.main())
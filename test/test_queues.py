@@ -0,0 +1,204 @@
+#!/usr/bin/env python
+
+import unittest
+import logging
+from multiprocessing import Process, Queue
+import os
+from Queue import Full, Queue as ThreadQueue
+import shutil
+import sys
+import tempfile
+from threading import Thread
+import time
+
+sys.path.insert(0, os.path.abspath('..'))
+
+from context import Context
+from queues import BoundedQueue, Spool, SpooledQueue, build_queue
+
+
+class QueuesTests(unittest.TestCase):
+
+    def test_block(self):
+
+        logging.debug('*** Block test ***')
+
+        context = Context()
+        queue = BoundedQueue(context, 'mouth', ThreadQueue(2))
+        queue.put('hello')
+        queue.put('world')
+
+        producer = Thread(target=queue.put, args=('again',))
+        producer.start()
+        time.sleep(0.1)
+        self.assertTrue(producer.is_alive())
+
+        self.assertEqual(queue.get(), 'hello')
+        producer.join()
+        self.assertEqual(queue.get(), 'world')
+        self.assertEqual(queue.get(), 'again')
+        self.assertEqual(context.get('mouth.blocked'), 1)
+
+        with self.assertRaises(ValueError):
+            BoundedQueue(context, 'mouth', ThreadQueue(2), 'unknown')
+
+    def test_drop_oldest(self):
+
+        logging.debug('*** Drop oldest test ***')
+
+        context = Context()
+        queue = BoundedQueue(context, 'ears', ThreadQueue(3), 'drop_oldest')
+        for index in range(10000):
+            queue.put(index)
+            self.assertTrue(queue.qsize() <= 3)
+
+        self.assertEqual([queue.get_nowait() for index in range(3)],
+                         [9997, 9998, 9999])
+        self.assertEqual(context.get('ears.dropped'), 9997)
+
+        # other producers take the room freed for a new item
+        class Crowded(ThreadQueue):
+
+            def put_nowait(self, item):
+                if self.crowd > 0:
+                    self.crowd -= 1
+                    raise Full
+                ThreadQueue.put_nowait(self, item)
+
+        context = Context()
+        crowded = Crowded(3)
+        crowded.crowd = 0
+        queue = BoundedQueue(context, 'ears', crowded, 'drop_oldest')
+        for index in range(3):
+            queue.put(index)
+
+        crowded.crowd = 3
+        queue.put('new')
+        self.assertEqual(context.get('ears.dropped'), 1)
+        self.assertEqual(context.get('ears.blocked'), 1)
+        self.assertEqual([queue.get_nowait() for index in range(3)],
+                         [1, 2, 'new'])
+
+    def test_coalesce(self):
+
+        logging.debug('*** Coalesce test ***')
+
+        context = Context()
+        queue = BoundedQueue(context, 'outbox', ThreadQueue(10), 'coalesce')
+        for index in range(1000):
+            queue.put('line {}'.format(index))
+        queue.put(Exception('EOQ'))
+
+        self.assertTrue(queue.qsize() <= 10)
+        self.assertTrue(len(queue.overflow) < 10)
+
+        lines = []
+        while True:
+            item = queue.get()
+            if isinstance(item, Exception):
+                break
+            lines.extend(item.split('\n'))
+
+        self.assertEqual(lines, ['line {}'.format(index)
+                                 for index in range(1000)])
+        self.assertTrue(context.get('outbox.coalesced') > 900)
+
+    def test_spill(self):
+
+        logging.debug('*** Spill test ***')
+
+        def consume(queue, results):
+            items = []
+            while True:
+                item = queue.get()
+                if isinstance(item, Exception):
+                    break
+                items.append(item)
+            results.put(items)
+
+        context = Context()
+        queue = BoundedQueue(context, 'inbox', Queue(5), 'spill')
+        for index in range(1000):
+            queue.put(('deploy', str(index)))
+        queue.put(Exception('EOQ'))
+        self.assertTrue(len(queue.overflow) > 900)
+
+        results = Queue()
+        consumer = Process(target=consume, args=(queue, results))
+        consumer.start()
+        items = results.get()
+        consumer.join()
+
+        self.assertEqual(items, [('deploy', str(index))
+                                 for index in range(1000)])
+        self.assertTrue(context.get('inbox.spilled') > 900)
+        self.assertEqual(len(queue.overflow), 0)
+
+    def test_build(self):
+
+        logging.debug('*** Build test ***')
+
+        context = Context()
+        context.apply({'queues': {'mouth': {'size': 10, 'policy': 'coalesce'}}})
+
+        queue = build_queue(context, 'mouth', Queue)
+        self.assertTrue(isinstance(queue, BoundedQueue))
+        self.assertEqual(queue.policy, 'coalesce')
+        self.assertEqual(queue.maxsize, 10)
+
+        queue = build_queue(context, 'inbox', Queue)
+        self.assertFalse(isinstance(queue, BoundedQueue))
+
+    def test_spool(self):
+
+        logging.debug('*** Spool test ***')
+
+        def wait_for(queue):
+            while queue.writer is not None and (queue.pending or queue.acks):
+                time.sleep(0.01)
+            time.sleep(0.05)
+
+        path = tempfile.mkdtemp()
+        try:
+            spool = Spool(os.path.join(path, 'test.spool'))
+            queue = SpooledQueue(ThreadQueue(), spool, 'inbox')
+            for index in range(5):
+                queue.put(('deploy', str(index)))
+
+            # the third item is being processed when the bot stops
+            self.assertEqual(queue.get(), ('deploy', '0'))
+            self.assertEqual(queue.get(), ('deploy', '1'))
+            self.assertEqual(queue.get(), ('deploy', '2'))
+            wait_for(queue)
+
+            # another queue is not affected
+            other = SpooledQueue(ThreadQueue(), spool, 'mouth')
+            other.put('hello')
+            other.put(Exception('EOQ'))
+            self.assertEqual(other.get(), 'hello')
+            self.assertTrue(isinstance(other.get(), Exception))
+
+            # items put without waiting are written to disk as well
+            other = SpooledQueue(ThreadQueue(), spool, 'chatter')
+            other.put_nowait('progress')
+            wait_for(other)
+            self.assertEqual(spool.load('chatter')[0][1], 'progress')
+            self.assertEqual(other.get(), 'progress')
+
+            # on restart, pending items are replayed
+            context = Context()
+            context.apply({'queues': {
+                'spool_path': os.path.join(path, 'test.spool'),
+                'inbox': {'durable': True}}})
+            queue = build_queue(context, 'inbox', ThreadQueue)
+            self.assertTrue(isinstance(queue, SpooledQueue))
+            self.assertEqual([queue.get() for index in range(3)],
+                             [('deploy', '2'), ('deploy', '3'), ('deploy', '4')])
+
+        finally:
+            shutil.rmtree(path)
+
+
+if __name__ == '__main__':
+    logging.getLogger('').setLevel(logging.DEBUG)
+    sys.exit(unittest.main())
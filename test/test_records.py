@@ -0,0 +1,79 @@
+#!/usr/bin/env python
+
+import unittest
+import logging
+import cPickle as pickle
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.abspath('..'))
+
+from records import Action, Message
+
+
+class RecordsTests(unittest.TestCase):
+
+    item = {
+        "id" : "Z2lzY29zcGFyazovL3VzL01FU1NBR0UvOTJkYjNiZTAtNDNiZC0xMWU2LThhZTktZGQ1YjNkZmM1NjVk",
+        "roomId" : "Y2lzY29zcGFyazovL3VzL1JPT00vYmJjZWIxYWQtNDNmMS0zYjU4LTkxNDctZjE0YmIwYzRkMTU0",
+        "roomType" : "group",
+        "toPersonId" : "Y2lzY29zcGFyazovL3VzL1BFT1BMRS9mMDZkNzFhNS0wODMzLTRmYTUtYTcyYS1jYzg5YjI1ZWVlMmX",
+        "toPersonEmail" : "julie@example.com",
+        "text" : "/plumby use containers/docker",
+        "personId" : "Y2lzY29zcGFyazovL3VzL1BFT1BMRS9mNWIzNjE4Ny1jOGRkLTQ3MjctOGIyZi1mOWM0NDdmMjkwNDY",
+        "personEmail" : "matt@example.com",
+        "created" : "2015-10-18T14:26:16+00:00",
+        "mentionedPeople" : [ "Y2lzY29zcGFyazovL3VzL1BFT1BMRS8yNDlmNzRkOS1kYjhhLTQzY2EtODk2Yi04NzllZDI0MGFjNTM", "Y2lzY29zcGFyazovL3VzL1BFT1BMRS83YWYyZjcyYy0xZDk1LTQxZjAtYTcxNi00MjlmZmNmYmM0ZDg" ]
+    }
+
+    def test_message(self):
+
+        logging.debug('*** Message test ***')
+
+        message = Message.from_spark(self.item)
+        self.assertEqual(message.person_id, self.item['personId'])
+        self.assertEqual(message.text, '/plumby use containers/docker')
+        self.assertEqual(pickle.loads(pickle.dumps(message, -1)), message)
+
+        message = Message.from_spark({'personId': '123'})
+        self.assertEqual(message, ('123', None))
+
+        with self.assertRaises(AttributeError):
+            message.room_id = 'abc'
+
+    def test_action(self):
+
+        logging.debug('*** Action test ***')
+
+        action = Action('deploy', 'analytics/hadoop')
+        (verb, arguments) = action
+        self.assertEqual(verb, 'deploy')
+        self.assertEqual(action, ('deploy', 'analytics/hadoop'))
+        self.assertEqual(pickle.loads(pickle.dumps(action, -1)), action)
+
+    def test_benchmark(self):
+
+        logging.debug('*** Serialization benchmark ***')
+
+        def measure(item, count=20000):
+            start = time.time()
+            for index in range(count):
+                pickle.loads(pickle.dumps(item, -1))
+            duration = time.time() - start
+            return (len(pickle.dumps(item, -1)), 1000000.0 * duration / count)
+
+        (full_size, full_time) = measure(self.item)
+        (trimmed_size, trimmed_time) = measure(Message.from_spark(self.item))
+
+        logging.info('Records: full message is {} bytes in {:.1f} us, '
+                     'record is {} bytes in {:.1f} us'.format(full_size,
+                                                              full_time,
+                                                              trimmed_size,
+                                                              trimmed_time))
+        self.assertTrue(trimmed_size < full_size / 3)
+
+
+if __name__ == '__main__':
+    logging.getLogger('').setLevel(logging.DEBUG)
+    sys.exit(unittest.main())
@@ -0,0 +1,95 @@
+#!/usr/bin/env python
+
+import unittest
+import logging
+from multiprocessing import Queue
+import os
+import sys
+
+sys.path.insert(0, os.path.abspath('..'))
+
+from context import Context
+from shell import Shell
+
+
+class RegistryTests(unittest.TestCase):
+
+    def test_resolve(self):
+
+        logging.debug('*** Resolve test ***')
+
+        context = Context()
+        context.apply({'shell': {'aliases': {'ls': 'list',
+                                             'find': 'search',
+                                             'oops': '*unknown*'}}})
+        shell = Shell(context, Queue(), Queue())
+        registry = shell.registry
+
+        self.assertEqual(registry.resolve('list'), ['list'])
+        self.assertEqual(registry.resolve('ls'), ['list'])
+        self.assertEqual(registry.resolve('para'), ['parameters'])
+        self.assertEqual(registry.resolve('sta'), ['start', 'status'])
+        self.assertEqual(registry.resolve('st'), ['start', 'status', 'stop'])
+        self.assertEqual(registry.resolve('fi'), ['search'])
+        self.assertEqual(registry.resolve('oops'), [])
+        self.assertEqual(registry.resolve('*unknown*'), [])
+
+        self.assertEqual(registry.get_command('list'), shell.do_list)
+        self.assertEqual(registry.get_command('*unknown*'), None)
+
+    def test_do(self):
+
+        logging.debug('*** Dispatch test ***')
+
+        context = Context()
+        inbox = Queue()
+        mouth = Queue()
+        shell = Shell(context, inbox, mouth)
+
+        shell.do('stat')
+        self.assertEqual(mouth.get(), {'markdown': 'Using example/first\nReady to process commands'})
+
+        shell.do('st')
+        self.assertEqual(mouth.get(), "Sorry, 'st' could be any of: start, status, stop")
+
+        shell.do('dep now')
+        self.assertEqual(mouth.get(), "Ok, working on it")
+        self.assertEqual(inbox.get(), ('deploy', 'now'))
+
+        with self.assertRaises(Exception):
+            mouth.get_nowait()
+        with self.assertRaises(Exception):
+            inbox.get_nowait()
+
+    def test_plugins(self):
+
+        logging.debug('*** Plugins test ***')
+
+        context = Context()
+        context.apply({'shell': {'commands': {'hello': 'test.plugin_hello',
+                                              'broken': 'test.*unknown*'},
+                                 'aliases': {'hi': 'hello'}}})
+        mouth = Queue()
+        sys.modules.pop('test.plugin_hello', None)
+        shell = Shell(context, Queue(), mouth)
+
+        # modules of plugins are loaded on first use
+        #
+        self.assertFalse('test.plugin_hello' in sys.modules)
+        shell.do('hello')
+        self.assertTrue('test.plugin_hello' in sys.modules)
+        self.assertEqual(mouth.get(), "Hello world")
+
+        shell.do('hi Alice')
+        self.assertEqual(mouth.get(), "Hello Alice")
+
+        shell.do('broken')
+        self.assertEqual(mouth.get(), "Sorry, I do not know how to handle 'broken'")
+
+        with self.assertRaises(Exception):
+            mouth.get_nowait()
+
+
+if __name__ == '__main__':
+    logging.getLogger('').setLevel(logging.DEBUG)
+    sys.exit(unittest.main())
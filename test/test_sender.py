@@ -5,14 +5,21 @@ import logging
 from mock import MagicMock
 from multiprocessing import Process, Queue
 import os
+from Queue import Queue as ThreadQueue
 import random
+import shutil
 import sys
+import tempfile
+from threading import Condition, Event, Thread, current_thread
+from collections import deque
 import time
 
 sys.path.insert(0, os.path.abspath('..'))
 
 from context import Context
-from sender import Sender
+from queues import Spool, SpooledQueue
+from sender import Sender, TokenBucket
+from test.mock_spark import MockSpark
 
 
 class SenderTests(unittest.TestCase):
@@ -56,9 +63,506 @@ class SenderTests(unittest.TestCase):
 #        sender.post_update = MagicMock()
         sender.work(context)
 
+        # posts are not throttled by default
+        self.assertEqual(sender.bucket.rate, 0.0)
+
         with self.assertRaises(Exception):
             mouth.get_nowait()
 
+    def test_bucket(self):
+
+        logging.debug('*** Bucket test ***')
+
+        bucket = TokenBucket(rate=20, burst=2)
+
+        self.assertEqual(bucket.take(), 0.0)
+        self.assertEqual(bucket.take(), 0.0)
+
+        start = time.time()
+        self.assertTrue(bucket.take() > 0.0)
+        self.assertTrue(bucket.take() > 0.0)
+        self.assertTrue(time.time() - start >= 0.09)
+
+        bucket.pause(0.2)
+        start = time.time()
+        bucket.take()
+        self.assertTrue(time.time() - start >= 0.19)
+
+        unlimited = TokenBucket(rate=0)
+        for i in range(100):
+            self.assertEqual(unlimited.take(), 0.0)
+
+    def test_retries(self):
+
+        logging.debug('*** Retries test ***')
+
+        def respond(status_code, headers={}):
+            response = MagicMock()
+            response.status_code = status_code
+            response.headers = headers
+            return response
+
+        mouth = Queue()
+        mouth.put(Exception('EOQ'))
+
+        context = Context()
+        context.set('spark.room_id', 'fake')
+        context.set('sender.rate', 0)
+        context.set('sender.backoff', 0.01)
+
+        sender = Sender(mouth)
+        sender.work(context)
+
+        posted = []
+
+        def post(path, headers, data):
+            posted.append(data['text'])
+            return responses.pop(0)
+
+        sender.client.post = MagicMock(side_effect=post)
+
+        # rate-limited, then failing, then accepted
+        responses = [respond(429, {'Retry-After': '0'}),
+                     respond(503),
+                     respond(200),
+                     respond(200)]
+        self.assertTrue(sender.post_update('hello'))
+        self.assertTrue(sender.post_update('world'))
+        self.assertEqual(posted, ['hello', 'hello', 'hello', 'world'])
+        self.assertEqual(context.get('sender.rate_limited'), 1)
+        self.assertEqual(context.get('sender.retries'), 2)
+
+        # permanent errors are not retried
+        responses = [respond(400)]
+        self.assertFalse(sender.post_update('bad'))
+        self.assertEqual(context.get('sender.dropped'), 1)
+
+        # too many errors
+        responses = [respond(500)] * 4
+        self.assertFalse(sender.post_update('unlucky'))
+        self.assertEqual(context.get('sender.dropped'), 2)
+        self.assertEqual(context.get('sender.retries'), 5)
+
+        # throttled updates are counted
+        sender.bucket = TokenBucket(rate=50, burst=1)
+        responses = [respond(200), respond(200)]
+        sender.post_update('first')
+        sender.post_update('second')
+        self.assertEqual(context.get('sender.throttled'), 1)
+        self.assertTrue(context.get('sender.wait_ms') >= 0)
+
+    def test_lanes(self):
+
+        logging.debug('*** Lanes test ***')
+
+        spark = MockSpark(delay=0.02)
+        spark.start()
+        try:
+            rooms = ['room{}'.format(index) for index in range(4)]
+
+            mouth = Queue()
+            for index in range(10):
+                for room in rooms:
+                    mouth.put({'message': str(index), 'room': room})
+            mouth.put(Exception('EOQ'))
+
+            context = Context()
+            context.set('spark.url', spark.url)
+            context.set('spark.room_id', 'fake')
+            context.set('sender.rate', 0)
+            context.set('sender.workers', 4)
+            Sender(mouth).work(context)
+
+            # all messages are there, in order for each room
+            self.assertEqual(len(spark.messages), 40)
+            for room in rooms:
+                texts = [message['text'] for message in spark.messages
+                         if message['roomId'] == room]
+                self.assertEqual(texts, [str(index) for index in range(10)])
+
+        finally:
+            spark.stop()
+
+    def test_bounded_lanes(self):
+
+        logging.debug('*** Bounded lanes test ***')
+
+        mouth = ThreadQueue()
+        for index in range(20):
+            mouth.put({'message': str(index), 'room': 'room{}'.format(index % 2)})
+        mouth.put(Exception('EOQ'))
+
+        context = Context()
+        context.set('sender.workers', 2)
+
+        sender = Sender(mouth)
+        built = []
+        build_update = sender.build_update
+
+        def build(item, counter):
+            built.append(item)
+            return build_update(item, counter)
+
+        sender.build_update = build
+
+        posting = Event()
+        release = Event()
+        posted = []
+
+        def post_update(update):
+            posting.set()
+            release.wait()
+            posted.append(update)
+            return True
+
+        sender.post_update = MagicMock(side_effect=post_update)
+
+        thread = Thread(target=sender.work, args=(context,))
+        thread.start()
+        try:
+
+            # while posts are held, the producer blocks on full lanes
+            #
+            self.assertTrue(posting.wait(10.0))
+            time.sleep(0.2)
+            self.assertTrue(thread.is_alive())
+            self.assertTrue(len(built) <= 5)
+
+        finally:
+            release.set()
+            thread.join()
+
+        # all updates are posted, in order for each room
+        #
+        self.assertEqual(len(posted), 20)
+        for room in ('room0', 'room1'):
+            self.assertEqual([update['text'] for update in posted
+                              if update['roomId'] == room],
+                             [str(index) for index in range(20)
+                              if 'room{}'.format(index % 2) == room])
+
+    def test_default_lane(self):
+
+        logging.debug('*** Default lane test ***')
+
+        # the default room and None go to distinct lanes if they are hashed
+        # separately, so that a mix of both would be posted out of order
+        #
+        room_id = [name for name in ('fake', 'room', 'default', 'general')
+                   if hash(name) % 4 != hash(None) % 4][0]
+
+        mouth = ThreadQueue()
+        mouth.put('one')
+        mouth.put({'message': 'two', 'room': room_id})
+        mouth.put({'markdown': 'three'})
+        mouth.put({'message': 'elsewhere', 'room': 'other'})
+        mouth.put({'message': 'four', 'room': room_id})
+        mouth.put(Exception('EOQ'))
+
+        context = Context()
+        context.set('spark.room_id', room_id)
+        context.set('sender.workers', 4)
+
+        sender = Sender(mouth)
+        posted = []
+
+        def post_update(update):
+            if update == 'one':
+                time.sleep(0.1)
+            if isinstance(update, dict):
+                if update.get('roomId', room_id) != room_id:
+                    return True
+                update = update.get('text', update.get('markdown'))
+            posted.append((update, current_thread().name))
+            return True
+
+        sender.post_update = MagicMock(side_effect=post_update)
+        sender.work(context)
+
+        # all updates for the default room are posted in order, by one lane
+        #
+        self.assertEqual([text for (text, name) in posted],
+                         ['one', 'two', 'three', 'four'])
+        self.assertEqual(len(set([name for (text, name) in posted])), 1)
+
+    def test_coalesce(self):
+
+        logging.debug('*** Coalesce test ***')
+
+        sender = Sender(Queue())
+        sender.limit = 20
+
+        items = ['hello',
+                 'world',
+                 {'message': 'again'},
+                 {'markdown': '*bold*'},
+                 {'markdown': '**bolder**'},
+                 {'message': 'elsewhere', 'room': 'other'},
+                 {'message': 'too', 'room': 'other'},
+                 {'message': 'with file', 'file': 'plan.yaml'},
+                 'this is a long line',
+                 'and another one']
+        self.assertEqual(sender.group(items),
+                         [('hello\nworld\nagain', 3),
+                          ({'markdown': '*bold*\n**bolder**'}, 2),
+                          ({'message': 'elsewhere\ntoo', 'room': 'other'}, 2),
+                          ({'message': 'with file', 'file': 'plan.yaml'}, 1),
+                          ('this is a long line', 1),
+                          ('and another one', 1)])
+
+        # a burst of log records becomes a few posts
+        spark = MockSpark()
+        spark.start()
+        try:
+            mouth = Queue()
+            for index in range(200):
+                mouth.put('log record number {}'.format(index))
+            mouth.put(Exception('EOQ'))
+            time.sleep(0.5)
+
+            context = Context()
+            context.set('spark.url', spark.url)
+            context.set('spark.room_id', 'fake')
+            context.set('sender.rate', 0)
+
+            Sender(mouth).work(context)
+
+            logging.info('Sender: 200 items in {} posts'.format(
+                len(spark.messages)))
+            self.assertTrue(len(spark.messages) <= 20)
+            self.assertEqual(context.get('sender.counter'), 200)
+            self.assertEqual(context.get('sender.merged'),
+                             200 - len(spark.messages))
+            lines = '\n'.join([message['text'] for message in spark.messages])
+            self.assertEqual(lines.split('\n'),
+                             ['log record number {}'.format(index)
+                              for index in range(200)])
+
+        finally:
+            spark.stop()
+
+    def test_split(self):
+
+        logging.debug('*** Split test ***')
+
+        sender = Sender(Queue())
+        sender.limit = 30
+        sender.attach_above = 200
+
+        # short messages are left untouched
+        self.assertEqual(sender.fit('hello'), ['hello'])
+
+        # long lines are cut anyway
+        self.assertEqual(sender.split('a' * 70), ['a' * 30, 'a' * 30, 'a' * 10])
+
+        # text is split on line boundaries
+        text = '\n'.join(['line {}'.format(index) for index in range(10)])
+        chunks = sender.split(text)
+        self.assertEqual('\n'.join(chunks), text)
+        for chunk in chunks:
+            self.assertTrue(len(chunk) <= 30)
+
+        # blank lines are kept, and no piece is longer than the limit
+        text = 'a' * 25 + '\n  \n' + 'b' * 40
+        self.assertEqual(sender.split(text), ['a' * 25 + '\n  ', 'b' * 30, 'b' * 10])
+        self.assertEqual(sender.split(' ' * 70), [' ' * 30, ' ' * 30, ' ' * 10])
+
+        # lists are moved to the next piece, and items are kept in one piece
+        text = 'Some introduction\n- first\n- second\n  continued\nDone'
+        self.assertEqual(sender.fit({'markdown': text, 'room': 'other'}),
+                         [{'markdown': 'Some introduction', 'room': 'other'},
+                          {'markdown': '- first\n- second\n  continued',
+                           'room': 'other'},
+                          {'markdown': 'Done', 'room': 'other'}])
+
+        # very long messages are attached as files
+        spark = MockSpark()
+        spark.start()
+        try:
+            context = Context()
+            context.set('spark.url', spark.url)
+            context.set('spark.room_id', 'fake')
+            context.set('sender.rate', 0)
+
+            mouth = Queue()
+            mouth.put({'markdown': '\n'.join(['- item'] * 5000)})
+            mouth.put(Exception('EOQ'))
+            Sender(mouth).work(context)
+
+            self.assertEqual(len(spark.messages), 1)
+            self.assertEqual(spark.messages[0]['text'],
+                             'Full text is attached (5000 lines)')
+            self.assertEqual(spark.messages[0]['files'], 5000 * 7 - 1)
+            self.assertEqual(context.get('sender.attached'), 1)
+
+        finally:
+            spark.stop()
+
+    def test_files(self):
+
+        logging.debug('*** Files test ***')
+
+        def count_descriptors(path):
+            count = 0
+            for name in os.listdir('/proc/self/fd'):
+                try:
+                    if os.readlink('/proc/self/fd/' + name) == path:
+                        count += 1
+                except OSError:
+                    pass
+            return count
+
+        handle, path = tempfile.mkstemp(suffix='.log')
+        os.write(handle, os.urandom(4096))
+        os.close(handle)
+
+        spark = MockSpark()
+        spark.start()
+        try:
+            context = Context()
+            context.set('spark.url', spark.url)
+            context.set('spark.room_id', 'fake')
+            context.set('sender.rate', 0)
+
+            sender = Sender(Queue())
+            sender.mouth.put(Exception('EOQ'))
+            sender.work(context)
+
+            # files are opened only while being posted
+            update = sender.build_update({'file': path, 'label': 'big.log'}, 1)
+            self.assertEqual(update['files'], ('big.log', path,
+                                               'application/octet-stream'))
+
+            # the file is open during each post, and closed after it
+            post = sender.client.post
+            opened = []
+
+            def watch(*args, **kwargs):
+                opened.append(count_descriptors(path))
+                return post(*args, **kwargs)
+
+            sender.client.post = watch
+            for index in range(3):
+                self.assertTrue(sender.post_update(dict(update)))
+                self.assertEqual(count_descriptors(path), 0)
+            self.assertEqual(opened, [1, 1, 1])
+
+            self.assertEqual([message['files'] for message in spark.messages],
+                             [4096, 4096, 4096])
+
+            # large files are not uploaded
+            sender.max_file_size = 1024
+            update = sender.build_update(
+                {'message': 'the log', 'file': path, 'label': 'big.log'}, 2)
+            self.assertEqual(update, {'text': "the log\nUnable to upload 'big.log'"})
+            self.assertEqual(context.get('sender.dropped'), 1)
+
+            # missing files are not uploaded either
+            update = sender.build_update({'file': '/no/such/file'}, 3)
+            self.assertEqual(update, {'text': "Unable to upload '/no/such/file'"})
+
+        finally:
+            spark.stop()
+            os.remove(path)
+
+    def test_priority(self):
+
+        logging.debug('*** Priority test ***')
+
+        sender = Sender(Queue(), Queue())
+        sender.weight = 2
+        sender.streak = 0
+        sender.ready = Condition()
+        sender.pending = (deque([(None, 'h{}'.format(index)) for index in range(6)]),
+                          deque([(None, 'l0'), (None, 'l1'), (None, Exception('EOQ'))]))
+
+        # replies first, with a progress report every 2 batches
+        batches = [sender.select(size=2) for index in range(5)]
+        self.assertEqual(batches, [(['h0', 'h1'], [None, None], False),
+                                   (['h2', 'h3'], [None, None], False),
+                                   (['l0', 'l1'], [None, None], False),
+                                   (['h4', 'h5'], [None, None], False),
+                                   ([], [], True)])
+
+        # replies do not wait behind a long queue of reports
+        mouth = ThreadQueue()
+        chatter = ThreadQueue()
+        for index in range(200):
+            chatter.put('progress {}'.format(index))
+
+        context = Context()
+        sender = Sender(mouth, chatter)
+        processed = []
+        sender.process = MagicMock(
+            side_effect=lambda item, counter, receipt: processed.append(item))
+        context.set('sender.limit', 20)
+
+        thread = Thread(target=sender.work, args=(context,))
+        thread.start()
+        mouth.put('Ok, working on it')
+        chatter.put(Exception('EOQ'))
+        thread.join()
+
+        self.assertEqual(len(processed), 201)
+        self.assertTrue(processed.index('Ok, working on it') < 100)
+
+    def test_durable(self):
+
+        logging.debug('*** Durable test ***')
+
+        def wait_for(queue):
+            while queue.writer is not None and (queue.pending or queue.acks):
+                time.sleep(0.01)
+            time.sleep(0.05)
+
+        path = tempfile.mkdtemp()
+        try:
+            spool = Spool(os.path.join(path, 'test.spool'))
+            mouth = SpooledQueue(ThreadQueue(), spool, 'mouth')
+            for index in range(5):
+                mouth.put({'message': str(index), 'room': 'room{}'.format(index)})
+            mouth.put(Exception('EOQ'))
+            wait_for(mouth)
+
+            # items that have been fetched are not acknowledged yet
+            #
+            context = Context()
+            sender = Sender(mouth)
+            sender.context = context
+            (items, keys, stop) = sender.fetch()
+            self.assertEqual(len(items), 5)
+            self.assertTrue(stop)
+            wait_for(mouth)
+            self.assertEqual(len(spool.load('mouth')), 5)
+
+            # the bot stops after 3 updates have been posted
+            #
+            for (id, item) in spool.load('mouth'):
+                mouth.queue.put((id, item))
+            mouth.queue.put((None, Exception('EOQ')))
+
+            posted = []
+
+            def post_update(update):
+                if len(posted) >= 3:
+                    context.set('general.switch', 'off')
+                    return False
+                posted.append(update['text'])
+                return True
+
+            sender = Sender(mouth)
+            sender.post_update = MagicMock(side_effect=post_update)
+            sender.work(context)
+            wait_for(mouth)
+
+            self.assertEqual(posted, ['0', '1', '2'])
+            self.assertEqual([item['message'] for (id, item) in spool.load('mouth')],
+                             ['3', '4'])
+
+        finally:
+            shutil.rmtree(path)
+
+
 if __name__ == '__main__':
     logging.getLogger('').setLevel(logging.DEBUG)
     sys.exit(unittest.main())
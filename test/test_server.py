@@ -0,0 +1,84 @@
+#!/usr/bin/env python
+
+import unittest
+import logging
+import os
+from Queue import Queue
+import sys
+from threading import Thread
+
+import bottle
+from paste import httpserver
+
+sys.path.insert(0, os.path.abspath('..'))
+
+import bot
+from context import Context
+from test.load_webhook import fire, percentile
+
+
+class ServerTests(unittest.TestCase):
+
+    def test_options(self):
+
+        logging.debug('*** Options test ***')
+
+        context = Context()
+        (engine, options) = bot.get_server(context)
+        self.assertEqual(engine, 'paste')
+        self.assertEqual(options['threadpool_workers'], 10)
+        self.assertEqual(options['request_queue_size'], 64)
+
+        context.apply({'server': {'engine': 'waitress',
+                                  'threads': 4,
+                                  'connections': 50}})
+        (engine, options) = bot.get_server(context)
+        self.assertEqual(engine, 'waitress')
+        self.assertEqual(options['threads'], 4)
+        self.assertEqual(options['connection_limit'], 50)
+
+        context.set('server.engine', 'wsgiref')
+        self.assertEqual(bot.get_server(context), ('wsgiref', {}))
+
+    def test_percentile(self):
+
+        logging.debug('*** Percentile test ***')
+
+        values = range(1, 101)
+        self.assertEqual(percentile(values, 0.50), 51)
+        self.assertEqual(percentile(values, 0.99), 100)
+        self.assertEqual(percentile([], 0.99), 0.0)
+
+    def test_serve(self):
+
+        logging.debug('*** Serve test ***')
+
+        bot.context = Context()
+        bot.ids = Queue()
+
+        (engine, options) = bot.get_server(bot.context)
+        server = httpserver.serve(bottle.default_app(),
+                                  host='127.0.0.1',
+                                  port='0',
+                                  start_loop=False,
+                                  **options)
+        thread = Thread(target=server.serve_forever)
+        thread.daemon = True
+        thread.start()
+        try:
+            url = 'http://127.0.0.1:{}/'.format(server.server_address[1])
+            (latencies, errors, duration) = fire(url, 5, 2)
+
+            self.assertEqual(errors, 0)
+            self.assertEqual(len(latencies), 5)
+            self.assertEqual(sorted([bot.ids.get() for index in range(5)]),
+                             ['load-{}'.format(index) for index in range(5)])
+
+        finally:
+            server.server_close()
+            server.thread_pool.shutdown(1)
+
+
+if __name__ == '__main__':
+    logging.getLogger('').setLevel(logging.DEBUG)
+    sys.exit(unittest.main())
@@ -4,14 +4,16 @@ import unittest
 import logging
 import os
 from multiprocessing import Process, Queue
+from Queue import Queue as ThreadQueue
 import random
 import sys
+from threading import Thread
 import time
 
 sys.path.insert(0, os.path.abspath('..'))
 
 from context import Context
-from shell import Shell
+from shell import Reply, Shell
 
 
 class SpeakerTests(unittest.TestCase):
@@ -94,6 +96,24 @@ class SpeakerTests(unittest.TestCase):
             with self.assertRaises(Exception):
                 inbox.get_nowait()
 
+    def test_acknowledge_first(self):
+
+        context = Context()
+        inbox = ThreadQueue(1)
+        inbox.put(('deploy', 'pending'))
+        mouth = Queue()
+        shell = Shell(context, inbox, mouth)
+
+        # the reply is sent even if the inbox is full
+        thread = Thread(target=shell.do_deploy, args=('123',))
+        thread.start()
+        self.assertEqual(mouth.get(timeout=1.0), "Ok, working on it")
+        self.assertTrue(thread.is_alive())
+
+        self.assertEqual(inbox.get(), ('deploy', 'pending'))
+        thread.join()
+        self.assertEqual(inbox.get(), ('deploy', '123'))
+
     def test_do_help(self):
 
         context = Context()
@@ -178,13 +198,7 @@ class SpeakerTests(unittest.TestCase):
         context.set('worker.template', 'category1/fittings1')
 
         shell.do_parameters()
-        self.assertEqual(mouth.get(), "Available parameters:")
-        self.assertEqual(mouth.get(), "- cpuPerNode: 4")
-        self.assertEqual(mouth.get(), "- diskPerNode: 200")
-        self.assertEqual(mouth.get(), "- domainName: HadoopClusterFox")
-        self.assertEqual(mouth.get(), "- locationId: EU6")
-        self.assertEqual(mouth.get(), "- memoryPerNode: 12")
-        self.assertEqual(mouth.get(), "- networkName: HadoopClusterNetwork")
+        self.assertEqual(mouth.get(), {'markdown': 'Available parameters:\n- cpuPerNode: 4\n- diskPerNode: 200\n- domainName: HadoopClusterFox\n- locationId: EU6\n- memoryPerNode: 12\n- networkName: HadoopClusterNetwork'})
         with self.assertRaises(Exception):
             mouth.get_nowait()
         with self.assertRaises(Exception):
@@ -197,6 +211,39 @@ class SpeakerTests(unittest.TestCase):
         with self.assertRaises(Exception):
             inbox.get_nowait()
 
+    def test_do_search(self):
+
+        context = Context()
+        inbox = Queue()
+        mouth = Queue()
+        shell = Shell(context, inbox, mouth)
+
+        context.set('plumbery.fittings', os.path.dirname(os.path.realpath(__file__)))
+
+        shell.do_search('hadoop')
+        self.assertEqual(mouth.get(), {'markdown': 'You can use any of following templates:\n- category1/fittings1'})
+        with self.assertRaises(Exception):
+            mouth.get_nowait()
+        with self.assertRaises(Exception):
+            inbox.get_nowait()
+
+        shell.do_search('fittings2')
+        self.assertEqual(mouth.get(), {'markdown': 'You can use any of following templates:\n- category1/fittings2\n- category2/fittings2'})
+        with self.assertRaises(Exception):
+            mouth.get_nowait()
+
+        shell.do_search('*unknown*')
+        self.assertEqual(mouth.get(), "No template has been found for '*unknown*'")
+        with self.assertRaises(Exception):
+            mouth.get_nowait()
+
+        shell.do_search()
+        self.assertEqual(mouth.get(), "Please indicate what you are looking for.")
+        with self.assertRaises(Exception):
+            mouth.get_nowait()
+        with self.assertRaises(Exception):
+            inbox.get_nowait()
+
     def test_do_status(self):
 
         context = Context()
@@ -205,8 +252,7 @@ class SpeakerTests(unittest.TestCase):
         shell = Shell(context, inbox, mouth)
 
         shell.do_status()
-        mouth.get()
-        mouth.get()
+        self.assertEqual(mouth.get(), {'markdown': 'Using example/first\nReady to process commands'})
         with self.assertRaises(Exception):
             mouth.get_nowait()
         with self.assertRaises(Exception):
@@ -265,6 +311,41 @@ class SpeakerTests(unittest.TestCase):
         with self.assertRaises(Exception):
             inbox.get_nowait()
 
+    def test_reply(self):
+
+        mouth = Queue()
+
+        with Reply(mouth) as reply:
+            pass
+        with self.assertRaises(Exception):
+            mouth.get_nowait()
+
+        with Reply(mouth) as reply:
+            reply.add("hello")
+        self.assertEqual(mouth.get(), "hello")
+
+        with Reply(mouth) as reply:
+            reply.add("hello\nworld")
+        self.assertEqual(mouth.get(), {'markdown': "hello\nworld"})
+
+        with Reply(mouth, limit=24) as reply:
+            reply.add("Some parameters:")
+            for index in range(5):
+                reply.add("- param{}: {}".format(index, index))
+        self.assertEqual(mouth.get(), {'markdown': "Some parameters:"})
+        self.assertEqual(mouth.get(), {'markdown': "- param0: 0\n- param1: 1"})
+        self.assertEqual(mouth.get(), {'markdown': "- param2: 2\n- param3: 3"})
+        self.assertEqual(mouth.get(), {'markdown': "- param4: 4"})
+        with self.assertRaises(Exception):
+            mouth.get_nowait()
+
+        with self.assertRaises(ValueError):
+            with Reply(mouth) as reply:
+                reply.add("hello")
+                raise ValueError()
+        with self.assertRaises(Exception):
+            mouth.get_nowait()
+
     def test_do_version(self):
 
         context = Context()
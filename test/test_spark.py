@@ -0,0 +1,92 @@
+#!/usr/bin/env python
+
+import unittest
+import logging
+from mock import MagicMock
+from multiprocessing import Process, Queue
+import os
+import sys
+
+sys.path.insert(0, os.path.abspath('..'))
+
+from context import Context
+import spark
+from spark import SparkClient, get_session
+
+
+class SparkTests(unittest.TestCase):
+
+    def test_session(self):
+
+        logging.debug('*** Session test ***')
+
+        def worker(queue, session):
+            queue.put(get_session() is not session)
+
+        session = get_session()
+        self.assertTrue(get_session() is session)
+
+        # each process has its own session
+        queue = Queue()
+        p = Process(target=worker, args=(queue, session))
+        p.start()
+        p.join()
+        self.assertTrue(queue.get())
+        self.assertEqual(len(spark.sessions), 1)
+        self.assertTrue(get_session() is session)
+
+    def test_request(self):
+
+        logging.debug('*** Request test ***')
+
+        context = Context()
+        context.set('spark.CISCO_SPARK_PLUMBERY_BOT', 'garbage')
+        context.set('spark.read_timeout', 12)
+
+        session = get_session()
+        request = session.request
+        session.request = MagicMock()
+        try:
+            client = SparkClient(context)
+
+            client.get('/rooms')
+            session.request.assert_called_with(
+                'GET',
+                'https://api.ciscospark.com/v1/rooms',
+                headers={'Authorization': 'Bearer garbage'},
+                timeout=(5.0, 12.0))
+
+            # headers are computed once
+            context.set('spark.CISCO_SPARK_PLUMBERY_BOT', 'changed')
+            client.post('/messages',
+                        headers={'Content-Type': 'text/plain'},
+                        data='hello')
+            session.request.assert_called_with(
+                'POST',
+                'https://api.ciscospark.com/v1/messages',
+                headers={'Authorization': 'Bearer garbage',
+                         'Content-Type': 'text/plain'},
+                timeout=(5.0, 12.0),
+                data='hello')
+            self.assertEqual(client.headers,
+                             {'Authorization': 'Bearer garbage'})
+
+            client.delete('https://www.acme.com/rooms/123')
+            session.request.assert_called_with(
+                'DELETE',
+                'https://www.acme.com/rooms/123',
+                headers={'Authorization': 'Bearer garbage'},
+                timeout=(5.0, 12.0))
+
+        finally:
+            session.request = request
+
+        # another token
+        context.set('spark.CISCO_SPARK_TOKEN', 'human')
+        client = SparkClient(context, 'spark.CISCO_SPARK_TOKEN')
+        client.configure()
+        self.assertEqual(client.headers, {'Authorization': 'Bearer human'})
+
+if __name__ == '__main__':
+    logging.getLogger('').setLevel(logging.DEBUG)
+    sys.exit(unittest.main())
@@ -14,7 +14,6 @@
 # limitations under the License.
 
 import logging
-from Queue import Empty
 import random
 import time
 from plumbery.engine import PlumberyEngine
@@ -52,26 +51,24 @@ class Worker(object):
         self.context = context
         self.context.set('worker.counter', 0)
         self.context.set('worker.busy', False)
+        self.context.wake_up(self.inbox)
 
         while self.context.get('general.switch', 'on') == 'on':
-            try:
-                item = self.inbox.get(True, 0.1)
-                if isinstance(item, Exception):
-                    break
-                counter = self.context.increment('worker.counter')
-                self.context.set('worker.busy', True)
-                self.process(item, counter)
+            item = self.inbox.get()
+            if isinstance(item, Exception):
+                break
+            counter = self.context.increment('worker.counter')
+            self.context.set('worker.busy', True)
+            self.process(item, counter)
 
-                self.context.set('worker.busy', False)
-            except Empty:
-                pass
+            self.context.set('worker.busy', False)
 
 
     def process(self, item, counter):
         """
         Processes one action
 
-        Example actions:
+        Actions are `Action` records, or tuples, such as:
 
             ('deploy', '')
             ('dispose', '')
@@ -83,9 +80,10 @@ class Worker(object):
 
         try:
 
-            fittings = self.context.get('plumbery.fittings', '.')            \
-                +'/'+self.context.get('worker.template', 'example/first')   \
-                +'/fittings.yaml'
+            (root, template) = self.context.get_many(
+                ('plumbery.fittings', 'worker.template'),
+                {'plumbery.fittings': '.', 'worker.template': 'example/first'})
+            fittings = root+'/'+template+'/fittings.yaml'
             print('- reading {}'.format(fittings))
 
             print('- loading plumbery engine')